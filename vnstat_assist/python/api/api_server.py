@@ -1,21 +1,108 @@
 import base64
-import calendar
+import copy
+import gzip
 import hmac
 import json
 import logging
 import os
-import ssl
+import queue
+import threading
 import time
-import urllib.request
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from hashlib import sha256
 
-from flask import Flask, jsonify, make_response, render_template, request
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    send_file,
+)
+from flask.json.provider import DefaultJSONProvider
 
 import sys
 
+try:
+    import brotli  # 可选依赖，未安装时仅提供gzip压缩
+except ImportError:
+    brotli = None
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-from backup.vnstat_backup import organize_backup_files, get_month_dir, ensure_month_dir
+from backup.vnstat_backup import (
+    organize_backup_files,
+    get_day_backup_base,
+    get_host_backup_dir,
+    get_month_backup_base,
+    get_rollup_base,
+    ensure_month_dir,
+    load_month_rollup,
+    day_bounds,
+    merge_day_backups_to_month,
+    month_bounds,
+    parse_range_bound,
+)
+from backup.backup_format import (
+    JSON_EXT,
+    decode_backup,
+    find_backup,
+    find_fresh_sidecar,
+    read_backup,
+    sidecar_enabled,
+    write_backup,
+    write_sidecar,
+)
+from backup.backup_catalog import (
+    catalog_index,
+    catalog_signature,
+    find_in_catalog,
+    remove_from_catalog,
+    update_catalog,
+)
+from backup.backup_manifest import backup_lock, lookup_manifest
+from backup.history_db import HistoryDB, get_history_db_path
+from backup.billing import billing_report, get_billing_quota, get_billing_start_day
+from backup.upstream_client import (
+    CircuitOpenError,
+    UpstreamError,
+    get_fetch_concurrency,
+    get_upstream_client,
+    get_upstream_hosts,
+)
+from backup.traffic_store import (
+    BUCKET_SOURCE,
+    GRANULARITY_PRECISION,
+    TrafficStore,
+    aggregate_rows,
+    diff_stores,
+)
+from backup.traffic_summary import summarize_data, summarize_series
+from backup.metrics import (
+    BYTES_BUCKETS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY,
+    Counter,
+    Histogram,
+    collect as collect_metrics,
+    render as render_metrics,
+)
+from backup.profiling import (
+    DEFAULT_SAMPLE_INTERVAL,
+    PROFILER,
+    ProfileBusyError,
+    begin_request_timings,
+    current_timings,
+    end_request_timings,
+    list_captures,
+    load_capture,
+    read_control,
+    start_capture,
+    stop_capture,
+    timed,
+)
 
 LOG_DIR = "/app/log"
 
@@ -23,6 +110,8 @@ LOG_DIR = "/app/log"
 def _setup_api_logger():
     _logger = logging.getLogger("api_server")
     _logger.setLevel(logging.INFO)
+    # 备份模块使用根日志器，避免根日志器被配置后重复输出
+    _logger.propagate = False
     if not _logger.handlers:
         os.makedirs(LOG_DIR, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -46,12 +135,17 @@ DEFAULT_CONFIG = {
     "expire_seconds": 3600,
     "user": {"username": "username", "password": "password"},
     "vnstat_api": "vnstat_api",
+    "cache_ttl": 30,
+    "cache_stale_seconds": 300,
+    "live_interval": 30,
+    "live_max_clients": 8,
+    "server_timing": 1,
 }
 
 
 def load_config_from_env():
     """从环境变量加载配置，缺失时回退到默认值"""
-    config = DEFAULT_CONFIG.copy()  # 初始化为默认配置
+    config = copy.deepcopy(DEFAULT_CONFIG)  # 初始化为默认配置，避免修改嵌套的默认值
     # 覆盖环境变量中的配置
     if "VNA_SECRET_KEY" in os.environ:
         config["secret_key"] = os.environ["VNA_SECRET_KEY"]
@@ -63,6 +157,16 @@ def load_config_from_env():
         config["user"]["password"] = os.environ["VNA_PASSWORD"]
     if "VNSTAT_API_URL" in os.environ:
         config["vnstat_api"] = os.environ["VNSTAT_API_URL"]
+    if "VNA_CACHE_TTL" in os.environ:
+        config["cache_ttl"] = int(os.environ["VNA_CACHE_TTL"])
+    if "VNA_CACHE_STALE_SECONDS" in os.environ:
+        config["cache_stale_seconds"] = int(os.environ["VNA_CACHE_STALE_SECONDS"])
+    if "VNA_LIVE_INTERVAL" in os.environ:
+        config["live_interval"] = int(os.environ["VNA_LIVE_INTERVAL"])
+    if "VNA_LIVE_MAX_CLIENTS" in os.environ:
+        config["live_max_clients"] = int(os.environ["VNA_LIVE_MAX_CLIENTS"])
+    if "VNA_SERVER_TIMING" in os.environ:
+        config["server_timing"] = int(os.environ["VNA_SERVER_TIMING"])
     config["auth_enable"] = int(
         os.getenv("VNA_AUTH_ENABLE", str(DEFAULT_CONFIG["auth_enable"]))
     )
@@ -78,9 +182,8 @@ def load_config_from_env():
                 if not value:
                     raise ValueError(f"环境变量 {key} 必须配置（当启用认证时）")
 
-    # 检查 vnstat_api 是否有效
-    if not config["vnstat_api"].startswith(("http://", "https://")):
-        raise ValueError("VNSTAT_API_URL 必须包含协议（如 http:// 或 https://）")
+    # 上游列表：VNSTAT_HOSTS 或单个 VNSTAT_API_URL，同时校验地址是否有效
+    config["hosts"] = get_upstream_hosts()
     return config
 
 
@@ -89,14 +192,17 @@ try:
     CONFIG = load_config_from_env()
     SECRET_KEY = CONFIG["secret_key"].encode()  # Convert to bytes for HMAC
     VALID_USER = CONFIG["user"]
-    VNSTAT_PROXY_URL = CONFIG["vnstat_api"]
     EXPIRE_SECONDS = CONFIG["expire_seconds"]
     AUTH_ENABLED = CONFIG["auth_enable"]
     JSON_DIR = "/app/backups/json"  # 备份文件目录
 
     logger.info("配置加载成功")
-    logger.info(f"VNSTAT API地址: {VNSTAT_PROXY_URL}")
+    for host_name, host_url in CONFIG["hosts"].items():
+        logger.info(f"VNSTAT API地址: [{host_name}] {host_url}")
     logger.info(f"认证启用: {AUTH_ENABLED}")
+    logger.info(
+        f"快照缓存: TTL {CONFIG['cache_ttl']}s, 过期可用 {CONFIG['cache_stale_seconds']}s"
+    )
 except Exception as e:
     logger.error(f"配置加载失败: {str(e)}")
     raise
@@ -105,6 +211,27 @@ except Exception as e:
 app = Flask(__name__)
 
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify 的序列化耗时计入 Server-Timing 的 serialize 阶段"""
+
+    def dumps(self, obj, **kwargs):
+        with timed("serialize"):
+            return super().dumps(obj, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+HTTP_REQUESTS = Counter("vna_http_requests_total", "API 请求数")
+HTTP_REQUEST_SECONDS = Histogram(
+    "vna_http_request_duration_seconds", "API 请求处理耗时（流式响应为开始发送前）"
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "vna_http_response_bytes", "API 响应体大小（字节，压缩后）", BYTES_BUCKETS
+)
+# 每个工作进程定期写出指标快照，/metrics 合并所有进程及定时任务的快照
+REGISTRY.start_flusher("api")
+
+
 class JWTManager:
     @staticmethod
     def generate_token(username):
@@ -159,6 +286,356 @@ class JWTManager:
             return {"valid": False, "error": str(e)}
 
 
+class Snapshot:
+    """一次上游拉取的结果：原始JSON字节 + 解析后的数据 + 区间索引"""
+
+    def __init__(self, body, data):
+        self.body = body
+        self.data = data
+        with timed("index"):
+            self.store = TrafficStore(data)
+        self.etag = self._make_etag()
+        self.fetched_at = time.monotonic()
+        self._encoded = {}
+        self._summary = None
+
+    def encoded_body(self, encoding):
+        """按编码返回响应体，压缩结果随快照缓存，每个快照每种编码只压缩一次"""
+        if encoding is None:
+            return self.body
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress_body(self.body, encoding)
+        return self._encoded[encoding]
+
+    def _make_etag(self):
+        """由各网卡的 updated 字段生成ETag，vnstat未更新数据时保持不变"""
+        updated = [
+            [iface.get("name"), iface.get("updated")]
+            for iface in self.data.get("interfaces", [])
+        ]
+        if any(u for _, u in updated):
+            source = json.dumps(updated, sort_keys=True).encode()
+        else:
+            source = self.body
+        return sha256(source).hexdigest()[:32]
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def summary(self, today):
+        """各网卡今天、昨天、本月的统计摘要及累计合计，同一快照每天只计算一次"""
+        cached = self._summary
+        if cached is not None and cached[0] == today:
+            return cached[1]
+
+        now = datetime(today.year, today.month, today.day)
+        periods = {
+            "today": day_bounds(now),
+            "yesterday": day_bounds(now - timedelta(days=1)),
+            "month": month_bounds(today.year, today.month),
+        }
+        result = {}
+        for name in self.store.interface_names():
+            series = self.store.series[name]
+            result[name] = {
+                period: summarize_series(series, start, end)
+                for period, (start, end) in periods.items()
+            }
+            result[name]["total"] = self.store.totals[name]
+        self._summary = (today, result)
+        return result
+
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/css", "text/plain")
+
+
+def preferred_encoding():
+    """按客户端 Accept-Encoding 选择响应压缩编码，br 需安装 brotli"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] and accepted["br"] >= accepted["gzip"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_body(body, encoding):
+    with timed("compress"):
+        if encoding == "br":
+            return brotli.compress(body, quality=5)
+        return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class SnapshotCache:
+    """上游快照缓存
+
+    - TTL 内直接返回缓存（hit）
+    - 超过 TTL 但仍在 stale 窗口内时返回旧快照，并在后台刷新（stale）
+    - 无可用快照时（miss），并发请求只触发一次上游拉取，其余请求等待结果
+    """
+
+    def __init__(self, fetcher, ttl, stale_seconds):
+        self._fetcher = fetcher
+        self._ttl = ttl
+        self._stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._inflight = None
+        self._inflight_error = None
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "upstream_fetches": 0,
+            "upstream_errors": 0,
+        }
+
+    def get(self):
+        """返回 (Snapshot, 状态)，状态为 HIT / STALE / MISS"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.age() < self._ttl:
+                self._stats["hits"] += 1
+                return snapshot, "HIT"
+            if (
+                snapshot is not None
+                and snapshot.age() < self._ttl + self._stale_seconds
+            ):
+                self._stats["stale_hits"] += 1
+                if self._inflight is None:
+                    self._inflight = threading.Event()
+                    threading.Thread(target=self._refresh, daemon=True).start()
+                return snapshot, "STALE"
+
+            self._stats["misses"] += 1
+            waiter = self._inflight
+            if waiter is None:
+                self._inflight = threading.Event()
+
+        if waiter is not None:
+            waiter.wait()
+            with self._lock:
+                if self._inflight_error is not None and self._snapshot is snapshot:
+                    raise self._inflight_error
+                return self._snapshot, "MISS"
+
+        self._refresh()
+        with self._lock:
+            if self._inflight_error is not None:
+                raise self._inflight_error
+            return self._snapshot, "MISS"
+
+    def _refresh(self):
+        """拉取上游并唤醒所有等待者，调用前必须已设置 self._inflight"""
+        error = None
+        snapshot = None
+        try:
+            body, data = self._fetcher()
+            snapshot = Snapshot(body, data)
+        except Exception as e:
+            error = e
+            logger.error(f"刷新上游快照失败: {str(e)}")
+
+        with self._lock:
+            self._stats["upstream_fetches"] += 1
+            if error is None:
+                self._snapshot = snapshot
+            else:
+                self._stats["upstream_errors"] += 1
+            self._inflight_error = error
+            event = self._inflight
+            self._inflight = None
+        event.set()
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result["ttl"] = self._ttl
+            result["stale_seconds"] = self._stale_seconds
+            result["age"] = (
+                round(self._snapshot.age(), 3) if self._snapshot is not None else None
+            )
+        return result
+
+
+class LiveFeed:
+    """SSE 实时推送
+
+    所有订阅者共享一个轮询线程：按间隔从快照缓存取数据，与上一份快照比较后
+    只推送变化的条目及合计。无订阅者时线程退出，下次订阅时重新启动。
+    """
+
+    QUEUE_SIZE = 16
+
+    def __init__(self, cache, interval, max_clients):
+        self._cache = cache
+        self._interval = interval
+        self._max_clients = max_clients
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._snapshot = None
+        self._seq = 0
+
+    def subscribe(self):
+        """返回订阅队列，订阅者已满时返回None"""
+        with self._lock:
+            if len(self._subscribers) >= self._max_clients:
+                return None
+            q = queue.Queue(maxsize=self.QUEUE_SIZE)
+            self._subscribers.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    # 下次启动时重新建立基准，避免推送积压期间的大量变化
+                    self._snapshot = None
+                    return
+            try:
+                self._poll()
+            except Exception as e:
+                logger.warning(f"实时推送轮询失败: {str(e)}")
+            time.sleep(self._interval)
+
+    def _poll(self):
+        snapshot, _ = self._cache.get()
+        previous = self._snapshot
+        if snapshot is previous:
+            return
+        self._snapshot = snapshot
+        if previous is None:
+            return
+
+        interfaces = diff_stores(previous.store, snapshot.store)
+        if interfaces is None:
+            self._publish("reset", {})
+        elif interfaces:
+            self._publish("delta", {"interfaces": interfaces})
+
+    def _publish(self, event, payload):
+        self._seq += 1
+        payload["seq"] = self._seq
+        message = (event, json.dumps(payload, separators=(",", ":")))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # 客户端消费过慢：丢弃积压的增量，通知其重新加载全量数据
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(("reset", json.dumps({"seq": self._seq})))
+
+
+class UpstreamHost:
+    """一个 vnstat 上游：独立的客户端、快照缓存、实时推送、备份目录及历史库"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.backup_dir = get_host_backup_dir(name)
+        self.upstream = get_upstream_client(url)
+        self.cache = SnapshotCache(
+            self.upstream.fetch, CONFIG["cache_ttl"], CONFIG["cache_stale_seconds"]
+        )
+        self.live = LiveFeed(
+            self.cache, CONFIG["live_interval"], CONFIG["live_max_clients"]
+        )
+        self.history = HistoryDB(get_history_db_path(name))
+
+
+HOSTS = {name: UpstreamHost(name, url) for name, url in CONFIG["hosts"].items()}
+# 请求未指定 host 参数时使用第一个上游
+DEFAULT_UPSTREAM = next(iter(HOSTS.values()))
+LIVE_HEARTBEAT_SECONDS = 15
+# 不剖析的接口：SSE 长连接及剖析、指标接口本身
+PROFILE_EXCLUDED_ENDPOINTS = {
+    "live_stream",
+    "get_metrics",
+    "profile_control",
+    "download_profile",
+}
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if CONFIG["server_timing"]:
+        g.timings_token = begin_request_timings()
+    if request.endpoint not in PROFILE_EXCLUDED_ENDPOINTS:
+        g.profile = PROFILER.begin()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """先于其他 after_request 注册，最后执行，记录的是压缩后的最终响应"""
+    started = g.get("request_started")
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    HTTP_REQUESTS.inc(
+        route=route, method=request.method, status=str(response.status_code)
+    )
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started, route=route, method=request.method
+    )
+    if response.content_length is not None:
+        HTTP_RESPONSE_BYTES.observe(response.content_length, route=route)
+    return response
+
+
+@app.after_request
+def add_server_timing(response):
+    """在压缩之后执行，各阶段耗时（毫秒）写入 Server-Timing，流式响应不含发送阶段"""
+    timings = current_timings()
+    if timings is not None:
+        total = time.perf_counter() - g.request_started
+        response.headers["Server-Timing"] = timings.header(total)
+    return response
+
+
+@app.teardown_request
+def finish_request_profiling(error=None):
+    PROFILER.end(g.pop("profile", None))
+    token = g.pop("timings_token", None)
+    if token is not None:
+        end_request_timings(token)
+
+
+@app.before_request
+def resolve_host():
+    """按 ?host= 选择上游，存入 g.host；未知上游先校验认证再返回404，
+    未登录时与其他接口一样返回401，无法借此探测配置了哪些上游
+    """
+    name = request.args.get("host")
+    if not name:
+        g.host = DEFAULT_UPSTREAM
+        return None
+    if name not in HOSTS:
+        auth_error = check_auth(allow_query_token=True)
+        if auth_error:
+            return auth_error
+        return jsonify({"error": f"Unknown host: {name}"}), 404
+    g.host = HOSTS[name]
+    return None
+
+
 def set_cors_headers(response):
     """设置CORS头"""
     response.headers["Access-Control-Allow-Origin"] = "*"
@@ -168,6 +645,29 @@ def set_cors_headers(response):
     return response
 
 
+def check_auth(allow_query_token=False):
+    """校验请求中的Bearer Token，失败时返回错误响应，通过或未启用认证时返回None
+
+    allow_query_token: 允许通过 ?token= 传递（EventSource 无法设置请求头）
+    """
+    if not AUTH_ENABLED:
+        return None
+
+    with timed("auth"):
+        auth_header = request.headers.get("Authorization", "")
+        if auth_header.startswith("Bearer "):
+            token = auth_header.split(" ")[1]
+        elif allow_query_token and request.args.get("token"):
+            token = request.args["token"]
+        else:
+            return jsonify({"error": "Missing authorization token"}), 401
+
+        verification = JWTManager.verify_token(token)
+        if not verification["valid"]:
+            return jsonify({"error": verification["error"]}), 401
+    return None
+
+
 # 登录路由
 @app.route("/auth/login", methods=["POST", "OPTIONS"])
 def login():
@@ -231,176 +731,444 @@ def verify():
 @app.route("/json.cgi", methods=["GET"])
 def proxy_vnstat_json():
     """代理请求到vnstat的json.cgi接口"""
-    if AUTH_ENABLED:
-        # 验证Token
-        auth_header = request.headers.get("Authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return jsonify({"error": "Missing authorization token"}), 401
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
 
-        token = auth_header.split(" ")[1]
-        verification = JWTManager.verify_token(token)
-        if not verification["valid"]:
-            return jsonify({"error": verification["error"]}), 401
-
-    ssl_context = ssl._create_unverified_context()
-    # 发起代理请求
     try:
-        req = urllib.request.Request(VNSTAT_PROXY_URL)
-        with urllib.request.urlopen(req, context=ssl_context) as response:
-            data = response.read().decode("utf-8")
-            json_data = json.loads(data)
-            response = jsonify(json_data)
-            return set_cors_headers(response)
-    except urllib.error.URLError as e:
+        snapshot, cache_status = g.host.cache.get()
+        encoding = preferred_encoding()
+        if _etag_matches(snapshot.etag):
+            response = Response(status=304)
+        else:
+            response = Response(
+                snapshot.encoded_body(encoding), mimetype="application/json"
+            )
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(_etag_variant(snapshot.etag, encoding))
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = _cache_control()
+        response.headers["X-Cache"] = cache_status
+        return set_cors_headers(response)
+    except CircuitOpenError as e:
+        return _upstream_unavailable(e)
+    except UpstreamError as e:
         logger.error(f"代理请求失败: {str(e)}")
         return jsonify({"error": f"Failed to proxy request: {str(e)}"}), 502
-    except json.JSONDecodeError:
-        logger.error("无效的JSON响应")
-        return jsonify({"error": "Invalid JSON response from upstream"}), 502
     except Exception as e:
         logger.error(f"代理请求异常: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+def _upstream_unavailable(error):
+    """熔断期间直接返回503，提示客户端稍后重试"""
+    response = jsonify({"error": f"Upstream unavailable: {str(error)}"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(int(error.retry_after) + 1)
+    return set_cors_headers(response)
+
+
+@app.route("/api/live", methods=["GET"])
+def live_stream():
+    """SSE 实时流量：delta 事件为变化的条目及合计，reset 事件表示客户端需重新加载全量数据"""
+    auth_error = check_auth(allow_query_token=True)
+    if auth_error:
+        return auth_error
+
+    live = g.host.live
+    q = live.subscribe()
+    if q is None:
+        return jsonify({"error": "Too many live subscribers"}), 503
+
+    def stream():
+        try:
+            hello = json.dumps({"seq": live.seq})
+            yield f"retry: 5000\nevent: hello\ndata: {hello}\n\n"
+            while True:
+                try:
+                    event, data = q.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event}\ndata: {data}\n\n"
+        finally:
+            live.unsubscribe(q)
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # 关闭反向代理缓冲，保证事件即时送达
+    response.headers["X-Accel-Buffering"] = "no"
+    return set_cors_headers(response)
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """快照缓存命中统计"""
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    result = g.host.cache.stats()
+    result["upstream"] = g.host.upstream.stats()
+    return jsonify(result), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus 文本格式的指标，合并各工作进程及定时任务写出的快照
+
+    VNA_METRICS_ENABLE=0 时关闭。启用认证时须携带登录 Token，或携带
+    Bearer <VNA_METRICS_TOKEN>（采集端不便刷新登录 Token）；未启用认证且未配置
+    VNA_METRICS_TOKEN 时与其他接口一样无需认证
+    """
+    if os.getenv("VNA_METRICS_ENABLE", "1") != "1":
+        return jsonify({"error": "Metrics disabled"}), 404
+    token = os.getenv("VNA_METRICS_TOKEN", "")
+    auth_header = request.headers.get("Authorization", "")
+    if not (
+        token
+        and hmac.compare_digest(auth_header.encode(), f"Bearer {token}".encode())
+    ):
+        if token and not AUTH_ENABLED:
+            return jsonify({"error": "Invalid metrics token"}), 401
+        auth_error = check_auth()
+        if auth_error:
+            return auth_error
+
+    body = render_metrics(collect_metrics())
+    return Response(body, mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+
+def check_profile_token():
+    """剖析接口仅限管理员：须配置 VNA_PROFILE_TOKEN 并携带 Bearer <token>，未配置时关闭"""
+    token = os.getenv("VNA_PROFILE_TOKEN", "")
+    if not token:
+        return jsonify({"error": "Profiling disabled"}), 404
+    auth_header = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(auth_header.encode(), f"Bearer {token}".encode()):
+        return jsonify({"error": "Invalid profile token"}), 401
+    return None
+
+
+@app.route("/debug/profile", methods=["GET", "POST", "DELETE"])
+def profile_control():
+    """按需剖析，所有工作进程同时生效
+
+    POST 开始采集，参数（查询参数或JSON）：mode=cprofile|sampling，
+    seconds=采集秒数 或 requests=每个工作进程剖析的请求数，interval_ms=采样间隔；
+    GET 查看进行中的采集及已有结果；DELETE 提前结束
+    """
+    auth_error = check_profile_token()
+    if auth_error:
+        return auth_error
+
+    if request.method == "GET":
+        return jsonify({"active": read_control(), "captures": list_captures()}), 200
+    if request.method == "DELETE":
+        control = stop_capture()
+        if control is None:
+            return jsonify({"error": "No active capture"}), 404
+        logger.info(f"剖析采集已手动结束: {control['id']}")
+        return jsonify({"stopped": control["id"]}), 200
+
+    params = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    try:
+        interval_ms = float(params.get("interval_ms", DEFAULT_SAMPLE_INTERVAL * 1000))
+        control = start_capture(
+            params.get("mode", "cprofile"),
+            seconds=float(params.get("seconds", 0)),
+            requests=int(params.get("requests", 0)),
+            interval=interval_ms / 1000,
+        )
+    except ProfileBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"开始剖析采集: {control['id']} ({control['mode']})")
+    return jsonify(control), 201
+
+
+@app.route("/debug/profile/<capture_id>", methods=["GET"])
+def download_profile(capture_id):
+    """下载合并各工作进程后的结果：cprofile 为 .prof（?format=text 为文本报告），
+    sampling 为折叠栈文本
+    """
+    auth_error = check_profile_token()
+    if auth_error:
+        return auth_error
+
+    result = load_capture(capture_id, text=request.args.get("format") == "text")
+    if result is None:
+        return jsonify({"error": "Capture not found"}), 404
+    body, filename = result
+    if filename.endswith(".prof"):
+        response = Response(body, mimetype="application/octet-stream")
+    else:
+        response = Response(body, mimetype="text/plain")
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 # 备份文件路由
+@app.route("/backups/index", methods=["GET"])
+def get_backup_index():
+    """备份索引：有天备份的日期及各月的月备份/月汇总，前端据此判断日期是否有历史数据"""
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    try:
+        etag = catalog_signature(g.host.backup_dir)
+        if _etag_matches(etag):
+            response = Response(status=304)
+        else:
+            result = catalog_index(g.host.backup_dir)
+            result["host"] = g.host.name
+            response = jsonify(result)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = _cache_control()
+        return set_cors_headers(response)
+    except Exception as e:
+        logger.error(f"读取备份索引失败: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/backups/<day>", methods=["GET"])
 def get_backup(day):
     """获取备份文件"""
-    if AUTH_ENABLED:
-        auth_header = request.headers.get("Authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return jsonify({"error": "Missing authorization token"}), 401
-
-        token = auth_header.split(" ")[1]
-        verification = JWTManager.verify_token(token)
-        if not verification["valid"]:
-            return jsonify({"error": verification["error"]}), 401
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
 
     try:
         if len(day) != 8 or not day.isdigit():
             return jsonify({"error": "Invalid day format, expected YYYYMMDD"}), 400
 
-        target_year = int(day[:4])
-        target_month = int(day[4:6])
-        month_dir = get_month_dir(JSON_DIR, target_year, target_month)
-        file_path = os.path.join(month_dir, f"vnstat_{day}.json")
+        path = _find_backup(_day_backup_base(day))
+        if path is None:
+            return jsonify({"error": "File not found"}), 500
 
-        if os.path.isfile(file_path):
-            with open(file_path, "r") as f:
-                content = json.load(f)
-            return jsonify(content), 200
-        else:
+        not_modified = _not_modified_response(path)
+        if not_modified is not None:
+            return not_modified
+
+        sidecar_response = _sidecar_response(path)
+        if sidecar_response is not None:
+            return sidecar_response
+        passthrough = _passthrough_response(path)
+        if passthrough is not None:
+            return passthrough
+
+        content = _load_day_backup(day)
+        if content is None:
             return jsonify({"error": "File not found"}), 500
-    except json.JSONDecodeError:
+        _refresh_sidecar(path, content)
+        return _with_validators(jsonify(content), path), 200
+    except FileNotFoundError:
+        _forget_backup(path)
+        return jsonify({"error": "File not found"}), 500
+    except ValueError:
         return jsonify({"error": "Invalid JSON file"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-def _merge_day_backups_to_month(target_year, target_month):
-    days_in_month = calendar.monthrange(target_year, target_month)[1]
-    day_files_data = []
-    month_dir = get_month_dir(JSON_DIR, target_year, target_month)
+def _day_backup_base(day):
+    return get_day_backup_base(
+        g.host.backup_dir, int(day[:4]), int(day[4:6]), int(day[6:8])
+    )
 
-    for day in range(1, days_in_month + 1):
-        day_str = f"{target_year}{target_month:02d}{day:02d}"
-        day_file = os.path.join(month_dir, f"vnstat_{day_str}.json")
 
-        if os.path.isfile(day_file):
-            try:
-                with open(day_file, "r") as f:
-                    day_data = json.load(f)
-                day_files_data.append(day_data)
-            except (json.JSONDecodeError, Exception):
-                pass
+def _find_backup(base_path):
+    """按备份索引查找文件；未登记时再探测文件系统，找到则补登索引，均不存在时返回None"""
+    path = find_in_catalog(g.host.backup_dir, base_path)
+    if path is not None:
+        return path
+    path = find_backup(base_path)
+    if path is not None:
+        logger.warning(f"备份文件未登记在索引中，已补登: {path}")
+        try:
+            update_catalog(path)
+        except Exception as e:
+            logger.warning(f"更新备份索引失败: {str(e)}")
+    return path
+
+
+def _forget_backup(path):
+    """索引中登记的文件已被外部删除时移除该条目"""
+    logger.warning(f"备份索引中的文件不存在: {path}")
+    try:
+        remove_from_catalog(path)
+    except Exception as e:
+        logger.warning(f"更新备份索引失败: {str(e)}")
+
 
-    if not day_files_data:
+def _load_day_backup(day):
+    """读取天备份文件，不存在时返回None"""
+    path = _find_backup(_day_backup_base(day))
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return decode_backup(f.read(), path)
+    except FileNotFoundError:
+        _forget_backup(path)
         return None
 
-    merged = {"interfaces": []}
-    interface_map = {}
-
-    for day_data in day_files_data:
-        for interface in day_data.get("interfaces", []):
-            iface_name = interface.get("name", "unknown")
-            if iface_name not in interface_map:
-                interface_map[iface_name] = {
-                    "name": iface_name,
-                    "alias": interface.get("alias", ""),
-                    "created": interface.get("created"),
-                    "updated": interface.get("updated"),
-                    "traffic": {
-                        "day": [],
-                        "month": [],
-                    },
-                }
-
-            iface = interface_map[iface_name]
-            traffic = interface.get("traffic", {})
-
-            for entry in traffic.get("day", []):
-                iface["traffic"]["day"].append(entry)
-
-            for entry in traffic.get("month", []):
-                existing = iface["traffic"]["month"]
-                entry_date = entry.get("date", {})
-                is_dup = False
-                for ex in existing:
-                    ex_date = ex.get("date", {})
-                    if ex_date.get("year") == entry_date.get("year") and ex_date.get(
-                        "month"
-                    ) == entry_date.get("month"):
-                        is_dup = True
-                        break
-                if not is_dup:
-                    iface["traffic"]["month"].append(entry)
-
-    for iface_name, iface_data in interface_map.items():
-        iface_data["traffic"]["day"].sort(key=lambda x: x.get("timestamp", 0))
-
-        if not iface_data["traffic"]["month"]:
-            total_rx = sum(d.get("rx", 0) for d in iface_data["traffic"]["day"])
-            total_tx = sum(d.get("tx", 0) for d in iface_data["traffic"]["day"])
-            first_day_ts = None
-            for d in iface_data["traffic"]["day"]:
-                d_date = d.get("date", {})
-                if (
-                    d_date.get("year") == target_year
-                    and d_date.get("month") == target_month
-                    and d_date.get("day") == 1
-                ):
-                    first_day_ts = d.get("timestamp")
-                    break
-            if first_day_ts is None and iface_data["traffic"]["day"]:
-                first_day_ts = iface_data["traffic"]["day"][0].get("timestamp")
-
-            iface_data["traffic"]["month"] = [
-                {
-                    "id": 0,
-                    "date": {"year": target_year, "month": target_month},
-                    "timestamp": first_day_ts or 0,
-                    "rx": total_rx,
-                    "tx": total_tx,
-                }
-            ]
-
-        merged["interfaces"].append(iface_data)
 
-    return merged
+def _find_month_backup_file(target_year, target_month):
+    """当前应返回的月数据文件：月备份文件优先，其次月汇总文件，均不存在时返回None"""
+    backup_dir = g.host.backup_dir
+    path = _find_backup(get_month_backup_base(backup_dir, target_year, target_month))
+    if path is not None:
+        return path
+    return _find_backup(get_rollup_base(backup_dir, target_year, target_month))
+
+
+def _file_validators(path):
+    """由文件大小和修改时间生成强ETag及Last-Modified，无需读取文件内容"""
+    st = os.stat(path)
+    etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+    return etag, last_modified
+
+
+def _cache_control():
+    """已结束的天/月备份仍会被改写（采集日志压实、按保留策略降精度），不能标记为 immutable；
+    客户端每次凭 ETag 重新验证，未变化时只返回304
+    """
+    return "private, no-cache"
+
+
+def _etag_variant(etag, encoding):
+    """同一资源不同压缩编码的表示使用不同的强ETag"""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def _etag_matches(etag):
+    return any(
+        request.if_none_match.contains(_etag_variant(etag, encoding))
+        for encoding in (None, "gzip", "br")
+    )
+
+
+def _not_modified_response(path):
+    """请求的 If-None-Match / If-Modified-Since 与文件一致时返回304响应，否则返回None"""
+    etag, last_modified = _file_validators(path)
+    if request.if_none_match:
+        matched = _etag_matches(etag)
+    elif request.if_modified_since:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+    response = Response(status=304)
+    return _with_validators(response, path, preferred_encoding())
+
+
+def _with_validators(response, path, encoding=None):
+    etag, last_modified = _file_validators(path)
+    response.set_etag(_etag_variant(etag, encoding))
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = _cache_control()
+    response.vary.add("Accept-Encoding")
+    return set_cors_headers(response)
+
+
+def _sidecar_response(path):
+    """客户端接受gzip且预压缩文件不早于备份文件时，直接发送预压缩文件，无需解析或压缩"""
+    if not request.accept_encodings["gzip"]:
+        return None
+    sidecar = find_fresh_sidecar(os.path.splitext(path)[0], path)
+    if sidecar is None:
+        return None
+
+    response = send_file(
+        sidecar, mimetype="application/json", conditional=False, etag=False
+    )
+    response.headers["Content-Encoding"] = "gzip"
+    return _with_validators(response, path, "gzip")
+
+
+def _refresh_sidecar(path, content):
+    """预压缩文件缺失或过期时补写，供后续请求直接发送
+
+    未启用预压缩文件的备份（默认为 compact 格式）不补写，每次解析后按请求压缩
+    """
+    _mark_validated(path)
+    if not request.accept_encodings["gzip"] or not sidecar_enabled(path):
+        return
+    try:
+        write_sidecar(os.path.splitext(path)[0], content)
+    except Exception as e:
+        logger.warning(f"写入预压缩文件失败: {str(e)}")
+
+
+# 已成功解析过的备份文件：路径 -> (大小, 修改时间)，文件变化后需重新校验
+_validated_files = {}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _mark_validated(path):
+    try:
+        _validated_files[path] = _file_signature(path)
+    except OSError:
+        pass
+
+
+def _is_validated(path):
+    """文件自上次解析后未变化、与 manifest 登记一致，或存在由 write_backup 在其之后写入的预压缩文件"""
+    try:
+        if _validated_files.get(path) == _file_signature(path):
+            return True
+    except OSError:
+        return False
+    if lookup_manifest(path) is not None:
+        return True
+    return find_fresh_sidecar(os.path.splitext(path)[0], path) is not None
+
+
+def _stream_gunzip(path):
+    with gzip.open(path, "rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _passthrough_response(path):
+    """不解析JSON直接返回备份内容：已校验的JSON文件原样发送，否则流式解压预压缩文件
+
+    两者均不可用时返回None，由调用方解析文件（首次解析即完成校验）
+    """
+    if path.endswith(JSON_EXT) and _is_validated(path):
+        response = send_file(
+            path, mimetype="application/json", conditional=False, etag=False
+        )
+        return _with_validators(response, path)
+
+    sidecar = find_fresh_sidecar(os.path.splitext(path)[0], path)
+    if sidecar is None:
+        return None
+    response = Response(_stream_gunzip(sidecar), mimetype="application/json")
+    return _with_validators(response, path)
 
 
 @app.route("/backups/month/<month>", methods=["GET"])
 def get_month_backup(month):
-    """获取月备份数据，优先读取月备份文件，不存在则合并天备份文件"""
-    if AUTH_ENABLED:
-        auth_header = request.headers.get("Authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return jsonify({"error": "Missing authorization token"}), 401
-
-        token = auth_header.split(" ")[1]
-        verification = JWTManager.verify_token(token)
-        if not verification["valid"]:
-            return jsonify({"error": verification["error"]}), 401
+    """获取月备份数据，优先读取月备份文件，其次月汇总文件，均不存在则合并天备份文件"""
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
 
     try:
         if len(month) != 6 or not month.isdigit():
@@ -412,38 +1180,532 @@ def get_month_backup(month):
         if target_month < 1 or target_month > 12:
             return jsonify({"error": "Invalid month value"}), 400
 
-        month_dir = get_month_dir(JSON_DIR, target_year, target_month)
-        month_file = os.path.join(month_dir, f"vnstat_month_{month}.json")
+        # 月备份、月汇总均可能被改写，按文件的 ETag 重新验证
+        path = _find_month_backup_file(target_year, target_month)
+        if path is not None:
+            not_modified = _not_modified_response(path)
+            if not_modified is not None:
+                return not_modified
+            sidecar_response = _sidecar_response(path)
+            if sidecar_response is not None:
+                return sidecar_response
+            passthrough = _passthrough_response(path)
+            if passthrough is not None:
+                return passthrough
+
+        content = _load_month_backup(target_year, target_month)
+        if content is None:
+            return jsonify({"error": "No backup data found for this month"}), 404
 
-        if os.path.isfile(month_file):
-            with open(month_file, "r") as f:
-                content = json.load(f)
+        path = _find_month_backup_file(target_year, target_month)
+        if path is None:
             return jsonify(content), 200
+        _refresh_sidecar(path, content)
+        return _with_validators(jsonify(content), path), 200
 
-        merged = _merge_day_backups_to_month(target_year, target_month)
+    except FileNotFoundError:
+        if path is not None:
+            _forget_backup(path)
+        return jsonify({"error": "No backup data found for this month"}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        if merged is None:
-            return jsonify({"error": "No backup data found for this month"}), 404
 
+def _load_month_backup(target_year, target_month):
+    """读取月备份：月备份文件 > 月汇总文件 > 合并天备份（并回写汇总），均无数据时返回None"""
+    backup_dir = g.host.backup_dir
+    content = read_backup(get_month_backup_base(backup_dir, target_year, target_month))
+    if content is not None:
+        return content
+
+    rollup = load_month_rollup(backup_dir, target_year, target_month)
+    if rollup is not None:
+        return rollup
+
+    merged = merge_day_backups_to_month(backup_dir, target_year, target_month)
+
+    if merged is None:
+        return None
+
+    try:
+        month_dir = ensure_month_dir(backup_dir, target_year, target_month)
+        rollup_base = get_rollup_base(backup_dir, target_year, target_month)
+        with backup_lock(month_dir):
+            # 等待锁期间定时任务可能已写入汇总，此时不再覆盖
+            if find_backup(rollup_base) is None:
+                rollup_file = write_backup(rollup_base, merged)
+                logger.info(f"合并天备份重建月汇总文件: {rollup_file}")
+    except Exception as e:
+        logger.warning(f"保存月汇总文件失败: {str(e)}")
+
+    return merged
+
+
+# 统计摘要路由
+@app.route("/api/summary", methods=["GET"])
+def get_summary():
+    """各网卡统计摘要：rx/tx 合计、五分钟及小时峰值速率、P95、流量最高的天、最繁忙的小时
+
+    不带 date 时由实时快照计算今天、昨天、本月（每个快照只计算一次）；
+    date 为 YYYYMMDD / YYYYMM 时返回天/月备份写入时记录在 manifest 中的摘要
+    """
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    date = request.args.get("date", "")
+    iface_name = request.args.get("iface", "")
+    path = None
+    try:
+        if not date:
+            today = datetime.now().date()
+            snapshot = g.host.cache.get()[0]
+            etag = f"{snapshot.etag}-{today:%Y%m%d}"
+            if _etag_matches(etag):
+                response = Response(status=304)
+            else:
+                interfaces = _select_interface(snapshot.summary(today), iface_name)
+                if interfaces is None:
+                    return jsonify({"error": f"Interface not found: {iface_name}"}), 404
+                response = jsonify({"interfaces": interfaces})
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = _cache_control()
+            return set_cors_headers(response)
+
+        if len(date) == 8 and date.isdigit():
+            path = _find_backup(_day_backup_base(date))
+        elif len(date) == 6 and date.isdigit() and 1 <= int(date[4:6]) <= 12:
+            path = _find_month_backup_file(int(date[:4]), int(date[4:6]))
+        else:
+            return jsonify({"error": "Invalid date, expected YYYYMMDD or YYYYMM"}), 400
+        if path is None:
+            return jsonify({"error": "No backup data found for this date"}), 404
+
+        not_modified = _not_modified_response(path)
+        if not_modified is not None:
+            return not_modified
+        interfaces = _select_interface(_backup_summary(path), iface_name)
+        if interfaces is None:
+            return jsonify({"error": f"Interface not found: {iface_name}"}), 404
+        response = jsonify({"date": date, "interfaces": interfaces})
+        return _with_validators(response, path), 200
+    except CircuitOpenError as e:
+        return _upstream_unavailable(e)
+    except FileNotFoundError:
+        if path is not None:
+            _forget_backup(path)
+        return jsonify({"error": "No backup data found for this date"}), 404
+    except Exception as e:
+        logger.error(f"统计摘要失败: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _select_interface(summaries, iface_name):
+    if not iface_name:
+        return summaries
+    if iface_name not in summaries:
+        return None
+    return {iface_name: summaries[iface_name]}
+
+
+# manifest 中缺少摘要的备份（写入早于摘要功能或由校验补登）：路径 -> (大小, 修改时间, 摘要)
+_summary_cache = {}
+
+
+def _backup_summary(path):
+    """优先使用写入时记录在 manifest 中的摘要，缺失时读取文件计算一次并缓存"""
+    entry = lookup_manifest(path)
+    if entry is not None and "summary" in entry:
+        return entry["summary"]
+
+    signature = _file_signature(path)
+    cached = _summary_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(path, "rb") as f:
+        summary = summarize_data(decode_backup(f.read(), path))
+    _summary_cache[path] = (signature, summary)
+    return summary
+
+
+# 计费路由
+@app.route("/api/billing", methods=["GET"])
+def get_billing():
+    """计费报告：按自定义起始日划分的计费周期内 P95/P99 速率、用量及配额
+
+    参数 iface、start_day（1-31）、cycles（从当前周期向前的周期数，1-24）、quota_gb；
+    已结束周期的结果缓存在历史库中，上游不可用时仍可基于历史库及备份计算
+    """
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    try:
+        start_day = int(request.args.get("start_day", get_billing_start_day()))
+        cycles = int(request.args.get("cycles", 1))
+        quota_gb = request.args.get("quota_gb")
+        quota = int(float(quota_gb) * 1024**3) if quota_gb else get_billing_quota()
+    except ValueError:
+        return jsonify({"error": "Invalid billing parameters"}), 400
+    if not 1 <= start_day <= 31 or not 1 <= cycles <= 24 or quota < 0:
+        return jsonify({"error": "Invalid billing parameters"}), 400
+
+    try:
+        try:
+            store = g.host.cache.get()[0].store
+        except UpstreamError as e:
+            logger.warning(f"计费报告未使用实时数据: {str(e)}")
+            store = None
+
+        names = set(g.host.history.interface_names())
+        if store is not None:
+            names.update(store.interface_names())
+        iface_name = request.args.get("iface", "")
+        if not iface_name:
+            iface_name = min(names) if names else ""
+            if store is not None and store.interface_names():
+                iface_name = store.interface_names()[0]
+        if iface_name not in names:
+            return jsonify({"error": f"Interface not found: {iface_name}"}), 404
+
+        started = time.perf_counter()
+        reports = billing_report(
+            iface_name,
+            start_day,
+            cycles,
+            quota,
+            history=g.host.history,
+            store=store,
+            backup_dir=g.host.backup_dir,
+        )
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        return jsonify(
+            {"iface": iface_name, "cycles": reports, "elapsed_ms": elapsed_ms}
+        )
+    except Exception as e:
+        logger.error(f"计费报告失败: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+# 区间查询路由
+@app.route("/api/traffic", methods=["GET"])
+def get_traffic():
+    """返回单个网卡单个时间维度在 [from, to] 内的条目及 rx/tx 合计
+
+    from/to 格式为 YYYY[MM[DD[HH[MM]]]]，缺省部分按区间起止补齐；
+    source=backup 时从天/月备份读取，区间须落在同一天或同一月内；
+    source=history 时从SQLite历史库查询，区间不限
+    """
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    iface_name = request.args.get("iface", "")
+    granularity = request.args.get("granularity", "day")
+    source = request.args.get("source", "live")
+    range_from = request.args.get("from", "")
+    range_to = request.args.get("to", range_from)
+
+    if granularity not in GRANULARITY_PRECISION:
+        return jsonify({"error": f"Invalid granularity: {granularity}"}), 400
+    if source not in ("live", "backup", "history"):
+        return jsonify({"error": f"Invalid source: {source}"}), 400
+    try:
+        start = parse_range_bound(range_from)
+        end = parse_range_bound(range_to, upper=True)
+    except ValueError:
+        return jsonify({"error": "Invalid range, expected YYYY[MM[DD[HH[MM]]]]"}), 400
+
+    etag = None
+    try:
+        if source == "live":
+            store = g.host.cache.get()[0].store
+            if not iface_name:
+                names = store.interface_names()
+                iface_name = names[0] if names else ""
+            result = store.query_interface_range(iface_name, granularity, start, end)
+        elif source == "history":
+            if not iface_name:
+                names = g.host.history.interface_names()
+                iface_name = names[0] if names else ""
+            result = g.host.history.query_interface_range(
+                iface_name, granularity, start, end
+            )
+        else:
+            if start[:3] == end[:3]:
+                day = f"{start[0]}{start[1]:02d}{start[2]:02d}"
+                path = _find_backup(_day_backup_base(day))
+            elif start[:2] == end[:2]:
+                path = _find_month_backup_file(start[0], start[1])
+            else:
+                return (
+                    jsonify(
+                        {"error": "Backup range must stay within one day or month"}
+                    ),
+                    400,
+                )
+
+            # 结果由备份文件和查询参数决定，前端据此重新验证本地缓存的切片
+            if path is not None:
+                query = sha256(request.query_string).hexdigest()[:16]
+                etag = f"{_file_validators(path)[0]}-{query}"
+                if _etag_matches(etag):
+                    response = Response(status=304)
+                    response.set_etag(etag)
+                    response.headers["Cache-Control"] = _cache_control()
+                    return set_cors_headers(response)
+
+            if start[:3] == end[:3]:
+                data = _load_day_backup(day)
+            else:
+                data = _load_month_backup(start[0], start[1])
+
+            if data is None:
+                return jsonify({"error": "No backup data found for this range"}), 404
+
+            if not iface_name:
+                interfaces = data.get("interfaces", [])
+                iface_name = interfaces[0].get("name", "") if interfaces else ""
+            result = TrafficStore(data).query_interface_range(
+                iface_name, granularity, start, end
+            )
+
+        if result is None:
+            return jsonify({"error": f"Interface not found: {iface_name}"}), 404
+
+        result.update(
+            {
+                "iface": iface_name,
+                "granularity": granularity,
+                "source": source,
+                "from": range_from,
+                "to": range_to,
+            }
+        )
+        response = jsonify(result)
+        if etag is not None:
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = _cache_control()
+        return set_cors_headers(response)
+    except CircuitOpenError as e:
+        return _upstream_unavailable(e)
+    except UpstreamError as e:
+        logger.error(f"代理请求失败: {str(e)}")
+        return jsonify({"error": f"Failed to proxy request: {str(e)}"}), 502
+    except ValueError:
+        return jsonify({"error": "Invalid JSON data"}), 502 if source == "live" else 500
+    except Exception as e:
+        logger.error(f"区间查询异常: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/traffic/aggregate", methods=["GET"])
+def get_traffic_aggregate():
+    """任意 [from, to] 区间按 hour/day/week/month 聚合的 rx/tx 序列及合计
+
+    历史部分来自SQLite历史库，实时快照覆盖的日期（如今天）以快照为准
+    """
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    iface_name = request.args.get("iface", "")
+    bucket = request.args.get("bucket", "day")
+    range_from = request.args.get("from", "")
+    range_to = request.args.get("to", range_from)
+
+    if bucket not in BUCKET_SOURCE:
+        return jsonify({"error": f"Invalid bucket: {bucket}"}), 400
+    try:
+        start = parse_range_bound(range_from)
+        end = parse_range_bound(range_to, upper=True)
+    except ValueError:
+        return jsonify({"error": "Invalid range, expected YYYY[MM[DD[HH[MM]]]]"}), 400
+
+    granularity = BUCKET_SOURCE[bucket]
+    history = g.host.history
+    try:
         try:
-            ensure_month_dir(JSON_DIR, target_year, target_month)
-            with open(month_file, "w") as f:
-                json.dump(merged, f, indent=2)
-            logger.info(f"合并天备份生成月备份文件: {month_file}")
+            store = g.host.cache.get()[0].store
         except Exception as e:
-            logger.warning(f"保存合并月备份文件失败: {str(e)}")
+            logger.warning(f"实时快照不可用，仅使用历史库聚合: {str(e)}")
+            store = None
 
-        return jsonify(merged), 200
+        if not iface_name:
+            names = history.interface_names() or (
+                store.interface_names() if store else []
+            )
+            iface_name = names[0] if names else ""
 
+        if not history.has_interface(iface_name) and not (
+            store and iface_name in store.interfaces
+        ):
+            return jsonify({"error": f"Interface not found: {iface_name}"}), 404
+
+        rows = {
+            key: (rx, tx)
+            for key, rx, tx in history.iter_rows(iface_name, granularity, start, end)
+        }
+        # 实时快照的数据至少与历史库一样新，重叠部分以快照为准
+        live_index = store.get_series(iface_name, granularity) if store else None
+        if live_index is not None:
+            for key, rx, tx in live_index.rows(start, end):
+                rows[key] = (rx, tx)
+
+        result = aggregate_rows(
+            ((key, rx, tx) for key, (rx, tx) in rows.items()), bucket
+        )
+        result.update(
+            {
+                "iface": iface_name,
+                "bucket": bucket,
+                "from": range_from,
+                "to": range_to,
+            }
+        )
+        return set_cors_headers(jsonify(result))
     except Exception as e:
+        logger.error(f"区间聚合异常: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/hosts", methods=["GET"])
+def get_hosts():
+    """已配置的上游名称，第一个为默认上游"""
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    return jsonify({"hosts": list(HOSTS)}), 200
+
+
+def _fleet_snapshots():
+    """并发读取所有上游的快照，返回 名称 -> Snapshot 或异常；耗时取决于最慢的上游而非总和"""
+
+    def load(host):
+        try:
+            return host.cache.get()[0]
+        except Exception as e:
+            return e
+
+    workers = max(1, min(len(HOSTS), get_fetch_concurrency()))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(HOSTS, executor.map(load, HOSTS.values())))
+
+
+@app.route("/api/fleet", methods=["GET"])
+def get_fleet():
+    """所有上游的汇总视图：各上游各网卡在 [from, to] 内的合计，及全部网卡按桶聚合的序列
+
+    默认区间为本月，按天聚合；不可用的上游列在 errors 中，不影响其余上游
+    """
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    bucket = request.args.get("bucket", "day")
+    range_from = request.args.get("from", datetime.now().strftime("%Y%m"))
+    range_to = request.args.get("to", range_from)
+
+    if bucket not in BUCKET_SOURCE:
+        return jsonify({"error": f"Invalid bucket: {bucket}"}), 400
+    try:
+        start = parse_range_bound(range_from)
+        end = parse_range_bound(range_to, upper=True)
+    except ValueError:
+        return jsonify({"error": "Invalid range, expected YYYY[MM[DD[HH[MM]]]]"}), 400
+
+    granularity = BUCKET_SOURCE[bucket]
+    hosts = []
+    errors = {}
+    rows = []
+    for name, snapshot in _fleet_snapshots().items():
+        if isinstance(snapshot, Exception):
+            errors[name] = str(snapshot)
+            continue
+
+        store = snapshot.store
+        interfaces = []
+        host_rx = 0
+        host_tx = 0
+        for iface_name in store.interface_names():
+            index = store.get_series(iface_name, granularity)
+            if index is None:
+                continue
+            rx, tx = index.totals(start, end)
+            host_rx += rx
+            host_tx += tx
+            interfaces.append({"name": iface_name, "total": {"rx": rx, "tx": tx}})
+            rows.extend(index.rows(start, end))
+        hosts.append(
+            {
+                "name": name,
+                "interfaces": interfaces,
+                "total": {"rx": host_rx, "tx": host_tx},
+            }
+        )
+
+    result = aggregate_rows(rows, bucket)
+    result.update(
+        {
+            "hosts": hosts,
+            "errors": errors,
+            "bucket": bucket,
+            "from": range_from,
+            "to": range_to,
+        }
+    )
+    return set_cors_headers(jsonify(result))
+
+
+@app.route("/api/history/coverage", methods=["GET"])
+def get_history_coverage():
+    """历史库中每个网卡每个时间维度的条目数及首末日期"""
+    auth_error = check_auth()
+    if auth_error:
+        return auth_error
+
+    try:
+        return jsonify({"coverage": g.host.history.coverage()}), 200
+    except Exception as e:
+        logger.error(f"查询历史库失败: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.after_request
+def compress_response(response):
+    """对未压缩的文本/JSON响应按 Accept-Encoding 动态压缩"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = preferred_encoding()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress_body(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(_etag_variant(etag, encoding), weak)
+    return response
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 
+# 开发模式：python3 api_server.py；生产环境由 gunicorn 加载 app（见 gunicorn.conf.py）
 if __name__ == "__main__":
     organize_backup_files(JSON_DIR)
     port = int(os.environ.get("PORT", 19328))
@@ -0,0 +1,45 @@
+"""gunicorn 生产环境配置，由 supervisord 启动：gunicorn -c gunicorn.conf.py api_server:app
+
+平滑重载：supervisorctl signal HUP api（主进程逐个替换工作进程，不中断在途请求）
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 19328)}"
+
+# 线程型工作进程：上游请求阻塞时只占用一个线程，其余线程继续处理请求
+worker_class = "gthread"
+workers = int(os.environ.get("VNA_WORKERS", 2))
+threads = int(os.environ.get("VNA_THREADS", 16))
+
+# 单个请求超过该秒数未完成时重启工作进程
+timeout = int(os.environ.get("VNA_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("VNA_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("VNA_KEEPALIVE", 5))
+
+# 工作进程处理指定数量请求后自动重启，0 表示不限制
+max_requests = int(os.environ.get("VNA_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# 不预加载应用：快照缓存的刷新线程、SQLite 连接等须在各工作进程内创建，不能跨 fork 共享
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+
+def on_starting(server):
+    """主进程启动时整理一次各上游的备份目录并清理旧的指标快照及剖析控制文件，避免每个工作进程重复执行"""
+    import sys
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    from backup.metrics import clear_snapshots
+    from backup.profiling import clear_capture
+    from backup.vnstat_backup import organize_all_backups
+
+    organize_all_backups()
+    # 上次运行遗留的工作进程指标快照，不清理会与新进程的计数叠加
+    clear_snapshots("api")
+    # 上次运行未结束的剖析采集不再延续到新的工作进程
+    clear_capture()
@@ -0,0 +1,354 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    from .backup_manifest import backup_lock
+except ImportError:
+    from backup_manifest import backup_lock
+
+# 目录索引存放于备份根目录下的子目录，索引写入不会改变根目录的修改时间
+CATALOG_DIR = ".index"
+CATALOG_NAME = "catalog.json"
+CATALOG_VERSION = 1
+# 索引变更追加到日志（每行一条），读取时在快照上重放；日志超过快照大小后合并回快照，
+# 每次写入的摊销代价与备份数量无关
+CATALOG_LOG_NAME = "catalog.log"
+CATALOG_LOG_MIN_COMPACT = 64 * 1024
+
+MONTH_DIR_PATTERN = re.compile(r"^\d{6}$")
+CATALOG_FILE_PATTERN = re.compile(
+    r"^vnstat_(month_|rollup_)?(\d{6}|\d{8})(\.json|\.vnb)$"
+)
+
+# 备份根目录 -> ((快照修改时间, 大小), 已重放的日志字节数, 内容)
+_catalog_cache: Dict[str, Tuple[Tuple[int, int], int, Dict[str, Any]]] = {}
+_catalog_cache_lock = threading.Lock()
+
+
+def get_catalog_path(base_dir: str) -> str:
+    return os.path.join(base_dir, CATALOG_DIR, CATALOG_NAME)
+
+
+def get_catalog_log_path(base_dir: str) -> str:
+    return os.path.join(base_dir, CATALOG_DIR, CATALOG_LOG_NAME)
+
+
+def catalog_base_dir(path: str) -> Optional[str]:
+    """备份文件所属的备份根目录（<根目录>/YYYYMM/文件），不在月目录下时返回None"""
+    month_dir = os.path.dirname(os.path.abspath(path))
+    if not MONTH_DIR_PATTERN.match(os.path.basename(month_dir)):
+        return None
+    return os.path.dirname(month_dir)
+
+
+def _catalog_key(base_dir: str, base_path: str) -> str:
+    """索引键为不含扩展名的相对路径，如 202610/vnstat_20261015"""
+    return os.path.relpath(os.path.abspath(base_path), os.path.abspath(base_dir))
+
+
+def _file_entry(path: str, st: os.stat_result) -> Dict[str, Any]:
+    return {
+        "ext": os.path.splitext(path)[1],
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def list_month_dirs(base_dir: str) -> Dict[str, int]:
+    """备份根目录下的月目录及其修改时间"""
+    months: Dict[str, int] = {}
+    try:
+        with os.scandir(base_dir) as it:
+            for entry in it:
+                if MONTH_DIR_PATTERN.match(entry.name) and entry.is_dir():
+                    months[entry.name] = entry.stat().st_mtime_ns
+    except OSError:
+        pass
+    return months
+
+
+def scan_catalog(base_dir: str) -> Dict[str, Dict[str, Any]]:
+    """用 os.scandir 扫描各月目录，返回 索引键 -> 文件信息"""
+    files: Dict[str, Dict[str, Any]] = {}
+    for month in list_month_dirs(base_dir):
+        files.update(scan_month(base_dir, month))
+    return files
+
+
+def scan_month(base_dir: str, month: str) -> Dict[str, Dict[str, Any]]:
+    """扫描单个月目录，返回 索引键 -> 文件信息"""
+    files: Dict[str, Dict[str, Any]] = {}
+    try:
+        with os.scandir(os.path.join(base_dir, month)) as it:
+            for entry in it:
+                if not CATALOG_FILE_PATTERN.match(entry.name) or not entry.is_file():
+                    continue
+                key = os.path.join(month, os.path.splitext(entry.name)[0])
+                files[key] = _file_entry(entry.name, entry.stat())
+    except OSError:
+        pass
+    return files
+
+
+def _save_catalog(base_dir: str, catalog: Dict[str, Any]):
+    """写入快照并删除已合并的日志；索引可随时由目录重建，原子替换即可，无需 fsync
+
+    两步之间崩溃时旧日志会在新快照上重放一次，各条变更均为幂等的覆盖/删除
+    """
+    path = get_catalog_path(base_dir)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(catalog, f, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    try:
+        os.remove(get_catalog_log_path(base_dir))
+    except FileNotFoundError:
+        pass
+
+
+def _apply_record(catalog: Dict[str, Any], record: Dict[str, Any]):
+    files = catalog["files"]
+    for key in record.get("removed", ()):
+        files.pop(key, None)
+    files.update(record.get("files", {}))
+    if "organized_mtime_ns" in record:
+        catalog["organized_mtime_ns"] = record["organized_mtime_ns"]
+    catalog.setdefault("verified", {}).update(record.get("verified", {}))
+
+
+def _replay_log(
+    base_dir: str, catalog: Dict[str, Any], offset: int
+) -> Optional[Tuple[Dict[str, Any], int]]:
+    """在索引上重放日志中 offset 之后的完整行，返回 (新内容, 新偏移)；日志损坏时返回None
+
+    有新记录时复制一份再修改，其他线程持有的旧内容保持不变
+    """
+    try:
+        with open(get_catalog_log_path(base_dir), "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return catalog, offset
+    end = chunk.rfind(b"\n") + 1
+    if end == 0:
+        return catalog, offset
+
+    updated = dict(catalog)
+    updated["files"] = dict(catalog["files"])
+    updated["verified"] = dict(catalog.get("verified", {}))
+    for line in chunk[:end].splitlines():
+        try:
+            _apply_record(updated, json.loads(line))
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"备份索引日志损坏 {base_dir}: {str(e)}")
+            return None
+    return updated, offset + end
+
+
+def _read_catalog(base_dir: str) -> Optional[Dict[str, Any]]:
+    path = get_catalog_path(base_dir)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size)
+    try:
+        log_size = os.stat(get_catalog_log_path(base_dir)).st_size
+    except OSError:
+        log_size = 0
+
+    with _catalog_cache_lock:
+        cached = _catalog_cache.get(base_dir)
+    if cached is not None and cached[0] == signature and cached[1] <= log_size:
+        if cached[1] == log_size:
+            return cached[2]
+        catalog, offset = cached[2], cached[1]
+    else:
+        try:
+            with open(path, "r") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取备份索引失败 {path}: {str(e)}")
+            return None
+        if catalog.get("version") != CATALOG_VERSION:
+            return None
+        catalog.setdefault("files", {})
+        catalog.setdefault("verified", {})
+        offset = 0
+
+    replayed = _replay_log(base_dir, catalog, offset)
+    if replayed is None:
+        return None
+    catalog, offset = replayed
+    with _catalog_cache_lock:
+        _catalog_cache[base_dir] = (signature, offset, catalog)
+    return catalog
+
+
+def rebuild_catalog(base_dir: str) -> Dict[str, Any]:
+    """扫描备份目录重建索引，保留已记录的整理及校验状态"""
+    with backup_lock(os.path.join(base_dir, CATALOG_DIR)):
+        previous = _read_catalog(base_dir) or {}
+        catalog = {
+            "version": CATALOG_VERSION,
+            "organized_mtime_ns": previous.get("organized_mtime_ns"),
+            "verified": previous.get("verified", {}),
+            "files": scan_catalog(base_dir),
+        }
+        _save_catalog(base_dir, catalog)
+    logging.info(f"已重建备份索引 {base_dir}，共 {len(catalog['files'])} 个文件")
+    return catalog
+
+
+def load_catalog(base_dir: str) -> Dict[str, Any]:
+    """读取备份索引，缺失或损坏时扫描目录重建一次"""
+    base_dir = os.path.abspath(base_dir)
+    catalog = _read_catalog(base_dir)
+    if catalog is None:
+        catalog = rebuild_catalog(base_dir)
+    return catalog
+
+
+def _append_catalog(base_dir: str, record: Dict[str, Any]):
+    """追加一条变更记录；索引缺失或损坏时改为扫描重建（结果已包含本次变更）"""
+    with backup_lock(os.path.join(base_dir, CATALOG_DIR)):
+        catalog = _read_catalog(base_dir)
+        if catalog is None:
+            rebuild_catalog(base_dir)
+            return
+
+        log_path = get_catalog_log_path(base_dir)
+        line = json.dumps(record, separators=(",", ":"), sort_keys=True) + "\n"
+        with open(log_path, "a") as f:
+            f.write(line)
+            log_size = f.tell()
+
+        snapshot_size = os.stat(get_catalog_path(base_dir)).st_size
+        if log_size > max(snapshot_size, CATALOG_LOG_MIN_COMPACT):
+            catalog = _read_catalog(base_dir)
+            if catalog is None:
+                rebuild_catalog(base_dir)
+            else:
+                _save_catalog(base_dir, catalog)
+
+
+def update_catalog(path: str, removed: Tuple[str, ...] = ()):
+    """登记新写入的备份文件并移除已删除的文件，非月目录下的文件忽略"""
+    base_dir = catalog_base_dir(path)
+    if base_dir is None:
+        return
+    st = os.stat(path)
+    key = _catalog_key(base_dir, os.path.splitext(path)[0])
+    record = {
+        "removed": [
+            _catalog_key(base_dir, os.path.splitext(removed_path)[0])
+            for removed_path in removed
+        ],
+        "files": {key: _file_entry(path, st)},
+    }
+    _append_catalog(base_dir, record)
+
+
+def remove_from_catalog(*paths: str):
+    """从索引中移除已删除的备份文件"""
+    by_base: Dict[str, list] = {}
+    for path in paths:
+        base_dir = catalog_base_dir(path)
+        if base_dir is not None:
+            key = _catalog_key(base_dir, os.path.splitext(path)[0])
+            by_base.setdefault(base_dir, []).append(key)
+
+    for base_dir, keys in by_base.items():
+        _append_catalog(base_dir, {"removed": keys})
+
+
+def mark_organized(base_dir: str, mtime_ns: int):
+    """记录整理完成时备份根目录的修改时间，目录未变化时下次启动可跳过整理"""
+    _append_catalog(os.path.abspath(base_dir), {"organized_mtime_ns": mtime_ns})
+
+
+def reconcile_month(base_dir: str, month: str) -> int:
+    """按月目录的实际文件修正索引中该月的条目，返回修正的条目数"""
+    base_dir = os.path.abspath(base_dir)
+    actual = scan_month(base_dir, month)
+    prefix = month + os.sep
+    indexed = {
+        key: entry
+        for key, entry in load_catalog(base_dir)["files"].items()
+        if key.startswith(prefix)
+    }
+    removed = [key for key in indexed if key not in actual]
+    changed = {
+        key: entry for key, entry in actual.items() if indexed.get(key) != entry
+    }
+    if removed or changed:
+        _append_catalog(base_dir, {"removed": removed, "files": changed})
+    return len(removed) + len(changed)
+
+
+def mark_verified(base_dir: str, month: str, mtime_ns: int):
+    """记录月目录校验通过时的修改时间，目录未变化时下次启动无需再校验"""
+    _append_catalog(os.path.abspath(base_dir), {"verified": {month: mtime_ns}})
+
+
+def find_in_catalog(base_dir: str, base_path: str) -> Optional[str]:
+    """按索引查找备份文件路径，不访问文件系统；未登记时返回None"""
+    base_dir = os.path.abspath(base_dir)
+    entry = load_catalog(base_dir)["files"].get(_catalog_key(base_dir, base_path))
+    if entry is None:
+        return None
+    return base_path + entry["ext"]
+
+
+def catalog_signature(base_dir: str) -> str:
+    """索引快照的大小、修改时间及日志长度，用作 /backups/index 的 ETag"""
+    base_dir = os.path.abspath(base_dir)
+    load_catalog(base_dir)
+    st = os.stat(get_catalog_path(base_dir))
+    try:
+        log_size = os.stat(get_catalog_log_path(base_dir)).st_size
+    except OSError:
+        log_size = 0
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}-{log_size:x}"
+
+
+def catalog_index(base_dir: str) -> Dict[str, Any]:
+    """按天、按月汇总索引：days 为有天备份的日期，months 含月备份/月汇总及当月天备份数"""
+    days: Dict[str, Dict[str, Any]] = {}
+    months: Dict[str, Dict[str, Any]] = {}
+
+    def month_info(month: str) -> Dict[str, Any]:
+        return months.setdefault(
+            month, {"days": 0, "month_backup": None, "rollup": None}
+        )
+
+    for key, entry in load_catalog(base_dir)["files"].items():
+        m = CATALOG_FILE_PATTERN.match(os.path.basename(key) + entry["ext"])
+        if not m:
+            continue
+        info = {
+            "format": "compact" if entry["ext"] == ".vnb" else "json",
+            "size": entry["size"],
+            "modified": entry["mtime_ns"] // 1_000_000_000,
+        }
+        prefix, stamp = m.group(1), m.group(2)
+        if prefix is None and len(stamp) == 8:
+            days[stamp] = info
+            month_info(stamp[:6])["days"] += 1
+        elif prefix == "month_":
+            month_info(stamp)["month_backup"] = info
+        elif prefix == "rollup_":
+            month_info(stamp)["rollup"] = info
+
+    return {
+        "days": dict(sorted(days.items())),
+        "months": dict(sorted(months.items())),
+    }
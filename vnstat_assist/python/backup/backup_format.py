@@ -0,0 +1,435 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from .backup_catalog import (
+        list_month_dirs,
+        load_catalog,
+        mark_verified,
+        reconcile_month,
+        remove_from_catalog,
+        update_catalog,
+    )
+    from .traffic_summary import summarize_data
+    from .backup_manifest import (
+        backup_lock,
+        fsync_dir,
+        make_entry,
+        update_manifest,
+        verify_dir,
+    )
+    from .metrics import BYTES_BUCKETS, Counter, Histogram
+    from .profiling import timed
+except ImportError:
+    from backup_catalog import (
+        list_month_dirs,
+        load_catalog,
+        mark_verified,
+        reconcile_month,
+        remove_from_catalog,
+        update_catalog,
+    )
+    from traffic_summary import summarize_data
+    from backup_manifest import (
+        backup_lock,
+        fsync_dir,
+        make_entry,
+        update_manifest,
+        verify_dir,
+    )
+    from metrics import BYTES_BUCKETS, Counter, Histogram
+    from profiling import timed
+
+JSON_EXT = ".json"
+COMPACT_EXT = ".vnb"
+EXTENSIONS = {"json": JSON_EXT, "compact": COMPACT_EXT}
+# 预压缩的响应体（紧凑JSON的gzip），API可直接发送而无需解析或重新压缩
+SIDECAR_EXT = ".json.gz"
+
+# 紧凑格式文件头，后接 gzip 压缩的列式 JSON
+COMPACT_MAGIC = b"VNB1"
+
+BACKUP_NAME_PATTERN = re.compile(
+    r"^(vnstat_(?:month_|rollup_)?\d{6,8})(\.json|\.vnb)$"
+)
+
+BACKUP_FILE_BYTES = Histogram(
+    "vna_backup_file_bytes",
+    "写入的备份文件大小（字节），kind 为 day / month / rollup",
+    BYTES_BUCKETS,
+)
+BACKUP_ROWS_WRITTEN = Counter("vna_backup_rows_written_total", "写入备份文件的流量条目数")
+
+
+def get_backup_format() -> str:
+    """从环境变量 VNA_BACKUP_FORMAT 读取备份写入格式（json / compact）"""
+    fmt = os.getenv("VNA_BACKUP_FORMAT", "json")
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"VNA_BACKUP_FORMAT 无效: {fmt}，可选 json / compact")
+    return fmt
+
+
+def _entry_layout(entry: Dict[str, Any]) -> Optional[Tuple[Tuple[str, ...], ...]]:
+    """条目字段布局：顶层标量字段及一层嵌套字典的字段路径，出现更深嵌套时返回None"""
+    layout = []
+    for key, value in entry.items():
+        if isinstance(value, dict):
+            if not value:
+                return None
+            for sub_key, sub_value in value.items():
+                if isinstance(sub_value, (dict, list)):
+                    return None
+                layout.append((key, sub_key))
+        elif isinstance(value, list):
+            return None
+        else:
+            layout.append((key,))
+    return tuple(layout)
+
+
+def _is_int_column(values: List[Any]) -> bool:
+    return all(type(v) is int for v in values)
+
+
+def _encode_series(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """将同构条目列表编码为列式结构，整数列做差分；不同构时原样保留"""
+    if not entries:
+        return {"rows": entries}
+
+    layout = _entry_layout(entries[0])
+    if layout is None or any(_entry_layout(e) != layout for e in entries[1:]):
+        return {"rows": entries}
+
+    columns = []
+    delta = []
+    for path in layout:
+        if len(path) == 1:
+            values = [e[path[0]] for e in entries]
+        else:
+            values = [e[path[0]][path[1]] for e in entries]
+        if _is_int_column(values):
+            values = [values[0]] + [b - a for a, b in zip(values, values[1:])]
+            delta.append(1)
+        else:
+            delta.append(0)
+        columns.append(values)
+
+    return {
+        "layout": [list(path) for path in layout],
+        "delta": delta,
+        "columns": columns,
+    }
+
+
+def _decode_series(encoded: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "rows" in encoded:
+        return encoded["rows"]
+
+    columns = []
+    for values, is_delta in zip(encoded["columns"], encoded["delta"]):
+        if is_delta:
+            total = 0
+            restored = []
+            for v in values:
+                total += v
+                restored.append(total)
+            values = restored
+        columns.append(values)
+
+    layout = [tuple(path) for path in encoded["layout"]]
+    entries = []
+    for row in zip(*columns):
+        entry: Dict[str, Any] = {}
+        for path, value in zip(layout, row):
+            if len(path) == 1:
+                entry[path[0]] = value
+            else:
+                entry.setdefault(path[0], {})[path[1]] = value
+        entries.append(entry)
+    return entries
+
+
+def encode_compact(data: Dict[str, Any]) -> bytes:
+    doc = dict(data)
+    interfaces = []
+    for interface in data.get("interfaces", []):
+        new_interface = dict(interface)
+        if "traffic" in interface:
+            new_interface["traffic"] = {
+                key: (
+                    {"series": _encode_series(value)}
+                    if isinstance(value, list)
+                    else {"raw": value}
+                )
+                for key, value in interface["traffic"].items()
+            }
+        interfaces.append(new_interface)
+    if "interfaces" in data:
+        doc["interfaces"] = interfaces
+
+    payload = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+    return COMPACT_MAGIC + gzip.compress(payload, compresslevel=6, mtime=0)
+
+
+def decode_compact(blob: bytes) -> Dict[str, Any]:
+    if not blob.startswith(COMPACT_MAGIC):
+        raise ValueError("不是有效的紧凑格式备份文件")
+
+    try:
+        payload = gzip.decompress(blob[len(COMPACT_MAGIC) :])
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError(f"紧凑格式备份文件损坏: {str(e)}")
+
+    doc = json.loads(payload)
+    for interface in doc.get("interfaces", []):
+        if "traffic" in interface:
+            interface["traffic"] = {
+                key: (
+                    _decode_series(value["series"]) if "series" in value else value["raw"]
+                )
+                for key, value in interface["traffic"].items()
+            }
+    return doc
+
+
+def encode_backup(data: Dict[str, Any], fmt: str) -> bytes:
+    if fmt == "compact":
+        return encode_compact(data)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def decode_backup(blob: bytes, path: str) -> Dict[str, Any]:
+    if path.endswith(COMPACT_EXT):
+        return decode_compact(blob)
+    return json.loads(blob.decode("utf-8"))
+
+
+def find_backup(base_path: str) -> Optional[str]:
+    """按 json、compact 顺序查找备份文件，base_path 为不含扩展名的路径"""
+    for ext in (JSON_EXT, COMPACT_EXT):
+        path = base_path + ext
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_backup(base_path: str) -> Optional[Dict[str, Any]]:
+    """读取任一格式的备份，不存在时返回None，内容损坏时抛出异常"""
+    with timed("disk"):
+        path = find_backup(base_path)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            blob = f.read()
+    with timed("parse"):
+        return decode_backup(blob, path)
+
+
+def write_atomic(path: str, blob: bytes):
+    """先写临时文件并 fsync 再 rename，读者只会看到完整的旧文件或新文件，崩溃后也不会残留半截文件"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_dir(os.path.dirname(path) or ".")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def encode_response_gzip(data: Dict[str, Any]) -> bytes:
+    payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(payload, compresslevel=9, mtime=0)
+
+
+def write_sidecar(base_path: str, data: Dict[str, Any]) -> str:
+    """写入预压缩响应体，需在备份文件之后写入，以保证其修改时间不早于备份文件"""
+    path = base_path + SIDECAR_EXT
+    with backup_lock(os.path.dirname(path) or "."):
+        write_atomic(path, encode_response_gzip(data))
+    return path
+
+
+def sidecar_enabled(backup_path: str) -> bool:
+    """备份文件是否附带预压缩响应体：VNA_BACKUP_SIDECAR 为 1/0 时强制开启/关闭，
+    未设置时仅 json 备份附带，compact 备份本身已压缩，附带后总占用反而大于 json.gz
+    """
+    value = os.getenv("VNA_BACKUP_SIDECAR", "")
+    if value:
+        return value == "1"
+    return backup_path.endswith(JSON_EXT)
+
+
+def find_fresh_sidecar(base_path: str, backup_path: str) -> Optional[str]:
+    """返回不早于备份文件的预压缩响应体路径，缺失或已过期时返回None"""
+    path = base_path + SIDECAR_EXT
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(backup_path).st_mtime_ns:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def backup_kind(path: str) -> str:
+    name = os.path.basename(path)
+    if name.startswith("vnstat_month_"):
+        return "month"
+    if name.startswith("vnstat_rollup_"):
+        return "rollup"
+    return "day"
+
+
+def write_backup(
+    base_path: str, data: Dict[str, Any], fmt: Optional[str] = None
+) -> str:
+    """按指定格式原子写入备份（及按需写入预压缩响应体），删除另一种格式的同名旧文件并更新 manifest
+    （含统计摘要）及备份索引，返回写入路径；全程持有所在目录的锁
+    """
+    fmt = fmt or get_backup_format()
+    path = base_path + EXTENSIONS[fmt]
+    with timed("write"):
+        blob = encode_backup(data, fmt)
+        summary = summarize_data(data)
+
+        with backup_lock(os.path.dirname(path) or "."):
+            write_atomic(path, blob)
+            sidecar = base_path + SIDECAR_EXT
+            if sidecar_enabled(path):
+                write_sidecar(base_path, data)
+            elif os.path.exists(sidecar):
+                os.remove(sidecar)
+
+            removed = []
+            for other_ext in EXTENSIONS.values():
+                other = base_path + other_ext
+                if other != path and os.path.exists(other):
+                    os.remove(other)
+                    removed.append(other)
+            entry = make_entry(path, blob, data)
+            entry["summary"] = summary
+            update_manifest(path, entry, tuple(removed))
+            update_catalog(path, tuple(removed))
+
+    kind = backup_kind(path)
+    BACKUP_FILE_BYTES.observe(len(blob), kind=kind, format=fmt)
+    rows = sum(sum(counts.values()) for counts in entry["records"].values())
+    BACKUP_ROWS_WRITTEN.inc(rows, kind=kind)
+    return path
+
+
+def remove_backup(path: str):
+    """删除备份文件及其预压缩响应体，并从 manifest 和备份索引中移除"""
+    base_path = os.path.splitext(path)[0]
+    with backup_lock(os.path.dirname(path) or "."):
+        for target in (path, base_path + SIDECAR_EXT):
+            if os.path.exists(target):
+                os.remove(target)
+        update_manifest(path, None, (path,))
+        remove_from_catalog(path)
+
+
+def migrate_tree(base_dir: str, fmt: str) -> Tuple[int, int]:
+    """将备份目录下所有备份转换为指定格式，返回 (转换数, 跳过数)"""
+    target_ext = EXTENSIONS[fmt]
+    converted = 0
+    skipped = 0
+
+    for root, _, files in os.walk(base_dir):
+        for filename in sorted(files):
+            m = BACKUP_NAME_PATTERN.match(filename)
+            if not m:
+                continue
+            if m.group(2) == target_ext:
+                skipped += 1
+                continue
+
+            path = os.path.join(root, filename)
+            try:
+                with open(path, "rb") as f:
+                    data = decode_backup(f.read(), path)
+            except Exception as e:
+                logging.warning(f"读取备份文件失败，跳过 {path}: {str(e)}")
+                skipped += 1
+                continue
+
+            new_path = write_backup(os.path.join(root, m.group(1)), data, fmt)
+            converted += 1
+            logging.info(f"转换: {path} -> {new_path}")
+
+    return converted, skipped
+
+
+def verify_backup_tree(base_dir: str, full: bool = False) -> Dict[str, int]:
+    """按备份索引增量校验备份目录，返回 ok / adopted / corrupt / skipped 计数
+
+    修改时间与上次校验通过时一致的月目录直接跳过（计入 skipped），其余月目录按 manifest
+    校验，未登记的文件解析成功后补登，并按目录中的实际文件修正该月的索引条目；
+    full 为 True 时校验全部月目录
+    """
+    result = {"ok": 0, "adopted": 0, "corrupt": 0, "skipped": 0}
+    verified = load_catalog(base_dir).get("verified", {})
+    for month, mtime_ns in sorted(list_month_dirs(base_dir).items()):
+        if not full and verified.get(month) == mtime_ns:
+            result["skipped"] += 1
+            continue
+        month_dir = os.path.join(base_dir, month)
+        with backup_lock(month_dir):
+            month_result = verify_dir(month_dir, decode_backup, BACKUP_NAME_PATTERN)
+            reconcile_month(base_dir, month)
+            # 补登 manifest 会改变目录修改时间，记录最终的修改时间
+            if not month_result["corrupt"]:
+                mark_verified(base_dir, month, os.stat(month_dir).st_mtime_ns)
+        for key, count in month_result.items():
+            result[key] += count
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转换或校验vnstat备份文件")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--to", choices=sorted(EXTENSIONS), help="目标存储格式")
+    action.add_argument(
+        "--verify", action="store_true", help="校验备份文件并补全各月 manifest"
+    )
+    parser.add_argument(
+        "--dir", default="/app/backups/json", help="备份目录（默认 /app/backups/json）"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    if not os.path.isdir(args.dir):
+        logging.error(f"备份目录不存在: {args.dir}")
+        sys.exit(1)
+
+    if args.verify:
+        result = verify_backup_tree(args.dir, full=True)
+        logging.info(
+            f"校验完成，一致 {result['ok']} 个，补登 {result['adopted']} 个，"
+            f"损坏 {result['corrupt']} 个"
+        )
+        if result["corrupt"]:
+            sys.exit(3)
+        return
+
+    converted, skipped = migrate_tree(args.dir, args.to)
+    logging.info(f"转换完成，共转换 {converted} 个文件，跳过 {skipped} 个文件")
+
+
+if __name__ == "__main__":
+    main()
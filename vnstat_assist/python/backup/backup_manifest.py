@@ -0,0 +1,183 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+
+# 当前线程已持有锁的目录，同一线程嵌套加锁时直接放行
+_held = threading.local()
+# 目录 -> ((manifest 修改时间, 大小), 内容)，manifest 未变化时不重复读取
+_manifest_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+_manifest_cache_lock = threading.Lock()
+
+
+@contextmanager
+def backup_lock(directory: str):
+    """目录级排他锁（flock），API 与定时任务进程间互斥写同一月目录，同一线程可重入"""
+    held = getattr(_held, "dirs", None)
+    if held is None:
+        held = _held.dirs = set()
+    directory = os.path.abspath(directory)
+    if directory in held:
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held.add(directory)
+        try:
+            yield
+        finally:
+            held.discard(directory)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(directory: str):
+    """rename 后同步目录项，保证掉电后新文件名已落盘"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def count_records(data: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """各网卡各时间维度的条目数"""
+    return {
+        interface.get("name", "unknown"): {
+            key: len(value)
+            for key, value in interface.get("traffic", {}).items()
+            if isinstance(value, list)
+        }
+        for interface in data.get("interfaces", [])
+    }
+
+
+def load_manifest(directory: str) -> Dict[str, Any]:
+    """读取目录的 manifest，缺失或损坏时返回空清单"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {"files": {}}
+    signature = (st.st_mtime_ns, st.st_size)
+
+    with _manifest_cache_lock:
+        cached = _manifest_cache.get(directory)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"读取 manifest 失败 {path}: {str(e)}")
+        return {"files": {}}
+
+    manifest.setdefault("files", {})
+    with _manifest_cache_lock:
+        _manifest_cache[directory] = (signature, manifest)
+    return manifest
+
+
+def _save_manifest(directory: str, manifest: Dict[str, Any]):
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def make_entry(path: str, blob: bytes, data: Dict[str, Any]) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": hashlib.sha256(blob).hexdigest(),
+        "records": count_records(data),
+        "written_at": int(time.time()),
+    }
+
+
+def update_manifest(
+    path: str, entry: Optional[Dict[str, Any]], removed: Tuple[str, ...] = ()
+):
+    """写入/移除文件在其目录 manifest 中的条目，调用方需持有该目录的 backup_lock"""
+    directory = os.path.dirname(os.path.abspath(path))
+    manifest = json.loads(json.dumps(load_manifest(directory)))
+    files = manifest["files"]
+    if entry is not None:
+        files[os.path.basename(path)] = entry
+    for removed_path in removed:
+        files.pop(os.path.basename(removed_path), None)
+    _save_manifest(directory, manifest)
+
+
+def lookup_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """返回与文件当前大小、修改时间一致的 manifest 条目，不一致或缺失时返回None"""
+    directory = os.path.dirname(os.path.abspath(path))
+    entry = load_manifest(directory)["files"].get(os.path.basename(path))
+    if entry is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if st.st_size != entry.get("size") or st.st_mtime_ns != entry.get("mtime_ns"):
+        return None
+    return entry
+
+
+def verify_dir(directory: str, decode, pattern) -> Dict[str, int]:
+    """检查单个目录：大小和修改时间与 manifest 一致的文件直接通过；
+    其余文件读取并解析，成功则补登 manifest，失败记为损坏
+
+    decode(blob, path) 用于解析文件，pattern 为备份文件名正则
+    """
+    result = {"ok": 0, "adopted": 0, "corrupt": 0}
+    try:
+        names = sorted(f for f in os.listdir(directory) if pattern.match(f))
+    except OSError:
+        return result
+    if not names:
+        return result
+
+    with backup_lock(directory):
+        for filename in names:
+            path = os.path.join(directory, filename)
+            if lookup_manifest(path) is not None:
+                result["ok"] += 1
+                continue
+            try:
+                with open(path, "rb") as f:
+                    blob = f.read()
+                data = decode(blob, path)
+            except Exception as e:
+                logging.error(f"备份文件损坏: {path}: {str(e)}")
+                result["corrupt"] += 1
+                continue
+            update_manifest(path, make_entry(path, blob, data))
+            result["adopted"] += 1
+    return result
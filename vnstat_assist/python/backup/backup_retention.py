@@ -0,0 +1,446 @@
+import argparse
+import calendar
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from dateutil import tz
+
+try:
+    from .backup_catalog import catalog_index
+    from .capture_journal import prune_journal
+    from .backup_format import (
+        EXTENSIONS,
+        find_backup,
+        read_backup,
+        remove_backup,
+        write_backup,
+    )
+    from .backup_manifest import backup_lock, lookup_manifest
+    from .history_db import HistoryDB, get_history_db_path
+    from .traffic_store import entry_date_key
+    from .vnstat_backup import (
+        apply_day_to_rollup,
+        get_day_backup_base,
+        get_month_backup_base,
+        get_month_dir,
+        get_rollup_base,
+        list_backup_hosts,
+    )
+except ImportError:
+    from backup_catalog import catalog_index
+    from capture_journal import prune_journal
+    from backup_format import (
+        EXTENSIONS,
+        find_backup,
+        read_backup,
+        remove_backup,
+        write_backup,
+    )
+    from backup_manifest import backup_lock, lookup_manifest
+    from history_db import HistoryDB, get_history_db_path
+    from traffic_store import entry_date_key
+    from vnstat_backup import (
+        apply_day_to_rollup,
+        get_day_backup_base,
+        get_month_backup_base,
+        get_month_dir,
+        get_rollup_base,
+        list_backup_hosts,
+    )
+
+
+class RetentionPolicy:
+    """保留策略
+
+    - full_days 天内的天备份保持原样
+    - 更早的天备份及月备份去掉 fiveminute，仅保留小时及以上精度
+    - hourly_months 个月之前的月份合并为只含天/月条目的月备份，删除当月天备份及月汇总
+
+    0 表示关闭对应层级；降精度后的文件按 fmt 格式写入
+    """
+
+    def __init__(
+        self, full_days: int = 90, hourly_months: int = 24, fmt: str = "compact"
+    ):
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"VNA_RETENTION_FORMAT 无效: {fmt}，可选 json / compact")
+        self.full_days = full_days
+        self.hourly_months = hourly_months
+        self.fmt = fmt
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            full_days=int(os.getenv("VNA_RETENTION_FULL_DAYS", 90)),
+            hourly_months=int(os.getenv("VNA_RETENTION_HOURLY_MONTHS", 24)),
+            fmt=os.getenv("VNA_RETENTION_FORMAT", "compact"),
+        )
+
+
+def downsample_day(data: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉 fiveminute 条目；小时序列中缺失的小时由对应的五分钟条目求和补齐，rx/tx 合计不变"""
+    doc = dict(data)
+    interfaces = []
+    for interface in data.get("interfaces", []):
+        traffic = dict(interface.get("traffic", {}))
+        fiveminute = traffic.pop("fiveminute", None) or []
+
+        hours = {entry_date_key(e, 4): e for e in traffic.get("hour", [])}
+        filled: Dict[Tuple[int, ...], Dict[str, Any]] = {}
+        for entry in fiveminute:
+            key = entry_date_key(entry, 4)
+            if key in hours:
+                continue
+            slot = filled.get(key)
+            if slot is None:
+                slot = filled[key] = {
+                    "id": 0,
+                    "date": dict(zip(("year", "month", "day"), key[:3])),
+                    "timestamp": entry.get("timestamp", 0),
+                    "time": {"hour": key[3], "minute": 0},
+                    "rx": 0,
+                    "tx": 0,
+                }
+            slot["rx"] += entry.get("rx", 0)
+            slot["tx"] += entry.get("tx", 0)
+        if filled:
+            hours.update(filled)
+            traffic["hour"] = [hours[key] for key in sorted(hours)]
+
+        new_interface = dict(interface)
+        new_interface["traffic"] = traffic
+        interfaces.append(new_interface)
+
+    if "interfaces" in data:
+        doc["interfaces"] = interfaces
+    doc["retention"] = {"tier": "hourly"}
+    return doc
+
+
+def _day_totals(
+    data: Dict[str, Any], year: int, month: int
+) -> Dict[Tuple[str, Tuple[int, ...]], Tuple[int, int]]:
+    """(网卡, 日期) -> 当月天条目的 (rx, tx)"""
+    totals = {}
+    for interface in data.get("interfaces", []):
+        name = interface.get("name", "unknown")
+        for entry in interface.get("traffic", {}).get("day", []):
+            key = entry_date_key(entry, 3)
+            if key[:2] == (year, month):
+                totals[(name, key)] = (entry.get("rx", 0), entry.get("tx", 0))
+    return totals
+
+
+def _carry_top_and_year(
+    summary: Dict[str, Any], sources: List[Dict[str, Any]], year: int, month: int
+):
+    """保留各来源中属于当月的 top 条目（按日期去重，按流量降序）及当年的年条目
+
+    年条目与月条目相同，取流量最大者即最新的累计值
+    """
+    interface_map = {iface["name"]: iface for iface in summary["interfaces"]}
+    top: Dict[str, Dict[Tuple[int, ...], Dict[str, Any]]] = {}
+    years: Dict[str, List[Dict[str, Any]]] = {}
+    for source in sources:
+        for interface in source.get("interfaces", []):
+            name = interface.get("name", "unknown")
+            traffic = interface.get("traffic", {})
+            for entry in traffic.get("top", []):
+                key = entry_date_key(entry, 3)
+                if key[:2] == (year, month):
+                    top.setdefault(name, {})[key] = entry
+            years.setdefault(name, []).extend(
+                e for e in traffic.get("year", []) if entry_date_key(e, 1) == (year,)
+            )
+
+    for name, iface in interface_map.items():
+        if top.get(name):
+            iface["traffic"]["top"] = sorted(
+                top[name].values(),
+                key=lambda e: e.get("rx", 0) + e.get("tx", 0),
+                reverse=True,
+            )
+        if years.get(name):
+            iface["traffic"]["year"] = [
+                max(years[name], key=lambda e: e.get("rx", 0) + e.get("tx", 0))
+            ]
+
+
+def summarize_month(
+    sources: List[Dict[str, Any]], year: int, month: int
+) -> Optional[Dict[str, Any]]:
+    """按 月备份 > 月汇总 > 天备份 的顺序合并为只含天/月条目的月备份
+
+    后合并的天备份覆盖同日条目；任一来源中的天条目在结果中缺失时返回None。
+    同时保留当月的 top 条目及当年的年条目，五分钟/小时条目不再保留
+    """
+    summary: Dict[str, Any] = {"interfaces": []}
+    expected = {}
+    for source in sources:
+        apply_day_to_rollup(summary, source, year, month)
+        expected.update(_day_totals(source, year, month))
+
+    if _day_totals(summary, year, month) != expected:
+        return None
+    _carry_top_and_year(summary, sources, year, month)
+    for key in ("vnstatversion", "jsonversion"):
+        for source in sources:
+            if key in source:
+                summary[key] = source[key]
+                break
+    summary["retention"] = {"tier": "daily"}
+    return summary
+
+
+def _is_hourly(path: str, fmt: str) -> bool:
+    """manifest 登记的条目数显示已无五分钟数据且格式一致时，无需再读取文件"""
+    if not path.endswith(EXTENSIONS[fmt]):
+        return False
+    entry = lookup_manifest(path)
+    if entry is None:
+        return False
+    return all(not counts.get("fiveminute") for counts in entry["records"].values())
+
+
+def _is_daily(base_dir: str, year: int, month: int, info: Dict[str, Any]) -> bool:
+    """月目录只剩月备份，且 manifest 登记的条目数显示已无小时及五分钟数据"""
+    if info["days"] or info["rollup"] is not None or info["month_backup"] is None:
+        return False
+    path = find_backup(get_month_backup_base(base_dir, year, month))
+    entry = lookup_manifest(path) if path else None
+    if entry is None:
+        return False
+    return all(
+        not counts.get("hour") and not counts.get("fiveminute")
+        for counts in entry["records"].values()
+    )
+
+
+def _month_index(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+
+def summarize_old_months(
+    base_dir: str, policy: RetentionPolicy, today: datetime, dry_run: bool = False
+) -> Dict[str, int]:
+    result = {"months": 0, "pruned": 0, "failed": 0}
+    if policy.hourly_months <= 0:
+        return result
+    cutoff = _month_index(today.year, today.month) - policy.hourly_months
+
+    for stamp, info in catalog_index(base_dir)["months"].items():
+        year, month = int(stamp[:4]), int(stamp[4:6])
+        if _month_index(year, month) >= cutoff:
+            break
+        if _is_daily(base_dir, year, month, info):
+            continue
+
+        with backup_lock(get_month_dir(base_dir, year, month)):
+            try:
+                pruned = _summarize_month_dir(base_dir, year, month, policy, dry_run)
+            except Exception as e:
+                logging.error(f"合并 {year}-{month:02d} 失败，保留原文件: {str(e)}")
+                result["failed"] += 1
+                continue
+        if pruned is None:
+            result["failed"] += 1
+            continue
+        result["months"] += 1
+        result["pruned"] += pruned
+    return result
+
+
+def _summarize_month_dir(
+    base_dir: str, year: int, month: int, policy: RetentionPolicy, dry_run: bool
+) -> Optional[int]:
+    """合并单个月目录，返回删除的文件数；数据不一致时返回None"""
+    month_base = get_month_backup_base(base_dir, year, month)
+    rollup_base = get_rollup_base(base_dir, year, month)
+    days_in_month = calendar.monthrange(year, month)[1]
+    bases = [month_base, rollup_base] + [
+        get_day_backup_base(base_dir, year, month, day)
+        for day in range(1, days_in_month + 1)
+    ]
+
+    sources = []
+    paths = []
+    for base in bases:
+        path = find_backup(base)
+        if path is None:
+            continue
+        sources.append(read_backup(base))
+        paths.append(path)
+    if not sources:
+        return 0
+
+    summary = summarize_month(sources, year, month)
+    if summary is None:
+        logging.error(f"{year}-{month:02d} 合并后天条目与原文件不一致，保留原文件")
+        return None
+
+    obsolete = [p for p in paths if os.path.splitext(p)[0] != month_base]
+    if dry_run:
+        logging.info(
+            f"[dry-run] {year}-{month:02d} 将合并为天精度月备份，"
+            f"删除 {len(obsolete)} 个文件"
+        )
+        return len(obsolete)
+
+    month_file = write_backup(month_base, summary, policy.fmt)
+    for path in obsolete:
+        remove_backup(path)
+    logging.info(
+        f"{year}-{month:02d} 已合并为天精度月备份 {month_file}，"
+        f"删除 {len(obsolete)} 个文件"
+    )
+    return len(obsolete)
+
+
+def downsample_old_days(
+    base_dir: str, policy: RetentionPolicy, today: datetime, dry_run: bool = False
+) -> Dict[str, int]:
+    result = {"downsampled": 0, "failed": 0}
+    cutoff = _hourly_cutoff(policy, today)
+    if cutoff is None:
+        return result
+
+    # 天备份及整月都早于窗口的月备份
+    index = catalog_index(base_dir)
+    candidates = []
+    for stamp in index["days"]:
+        if stamp < cutoff:
+            candidates.append((int(stamp[:4]), int(stamp[4:6]), int(stamp[6:8])))
+    for stamp, info in index["months"].items():
+        if info["month_backup"] is not None and f"{stamp}31" < cutoff:
+            candidates.append((int(stamp[:4]), int(stamp[4:6]), None))
+
+    for year, month, day in candidates:
+        if day is None:
+            base = get_month_backup_base(base_dir, year, month)
+        else:
+            base = get_day_backup_base(base_dir, year, month, day)
+        path = find_backup(base)
+        if path is None or _is_hourly(path, policy.fmt):
+            continue
+
+        try:
+            with backup_lock(get_month_dir(base_dir, year, month)):
+                data = read_backup(base)
+                if dry_run:
+                    logging.info(f"[dry-run] 将降为小时精度: {path}")
+                else:
+                    write_backup(base, downsample_day(data), policy.fmt)
+        except Exception as e:
+            logging.error(f"备份降精度失败，保留原文件 {path}: {str(e)}")
+            result["failed"] += 1
+            continue
+        result["downsampled"] += 1
+    return result
+
+
+def _hourly_cutoff(policy: RetentionPolicy, today: datetime) -> Optional[str]:
+    """早于该日期（YYYYMMDD）的数据只保留小时精度，层级关闭时返回None"""
+    if policy.full_days <= 0:
+        return None
+    return (today - timedelta(days=policy.full_days)).strftime("%Y%m%d")
+
+
+def _daily_cutoff(policy: RetentionPolicy, today: datetime) -> Optional[str]:
+    """早于该月（YYYYMM01）的数据只保留天精度，层级关闭时返回None"""
+    if policy.hourly_months <= 0:
+        return None
+    cutoff = _month_index(today.year, today.month) - policy.hourly_months
+    year, month = divmod(cutoff, 12)
+    return f"{year}{month + 1:02d}01"
+
+
+def prune_history(
+    history: HistoryDB, policy: RetentionPolicy, today: datetime, dry_run: bool = False
+) -> int:
+    """对历史库应用与备份文件相同的层级，返回删除的行数"""
+    hourly = _hourly_cutoff(policy, today)
+    daily = _daily_cutoff(policy, today)
+    if hourly is None and daily is None:
+        return 0
+    if dry_run:
+        logging.info(f"[dry-run] 历史库将按 {hourly} / {daily} 之前的层级精简")
+        return 0
+
+    def to_key(stamp):
+        return (int(stamp[:4]), int(stamp[4:6]), int(stamp[6:8])) if stamp else None
+
+    return history.downsample(to_key(hourly), to_key(daily))
+
+
+def apply_retention(
+    base_dir: str,
+    policy: RetentionPolicy,
+    today: Optional[datetime] = None,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """先合并过期月份（其天备份随之删除），再对剩余的旧天备份及月备份降精度，
+    最后删除已超出完整精度窗口仍未压实的采集日志
+    """
+    today = today or datetime.now(tz=tz.gettz("Asia/Shanghai"))
+    months = summarize_old_months(base_dir, policy, today, dry_run)
+    files = downsample_old_days(base_dir, policy, today, dry_run)
+    journal_cutoff = _hourly_cutoff(policy, today) or _daily_cutoff(policy, today)
+    journals = prune_journal(base_dir, journal_cutoff, dry_run) if journal_cutoff else 0
+    return {
+        "months": months["months"],
+        "pruned": months["pruned"],
+        "downsampled": files["downsampled"],
+        "journals": journals,
+        "failed": months["failed"] + files["failed"],
+    }
+
+
+def run_retention(dry_run: bool = False):
+    """对默认及各上游的备份目录及历史库执行保留策略"""
+    if os.getenv("VNA_RETENTION_ENABLE", "1") != "1":
+        logging.info("备份保留策略未启用，跳过")
+        return
+    policy = RetentionPolicy.from_env()
+    today = datetime.now(tz=tz.gettz("Asia/Shanghai"))
+    for host, base_dir in list_backup_hosts().items():
+        report = apply_retention(base_dir, policy, today, dry_run)
+        logging.info(
+            f"保留策略 {base_dir}: 合并 {report['months']} 个月"
+            f"（删除 {report['pruned']} 个文件），降精度 {report['downsampled']} 个文件，"
+            f"删除采集日志 {report['journals']} 个，失败 {report['failed']} 个"
+        )
+
+        db_path = get_history_db_path(host)
+        if not os.path.exists(db_path):
+            continue
+        history = HistoryDB(db_path)
+        try:
+            rows = prune_history(history, policy, today, dry_run)
+        except Exception as e:
+            logging.error(f"[{host}] 历史库精简失败: {str(e)}")
+            continue
+        finally:
+            history.close()
+        logging.info(f"[{host}] 历史库按保留策略删除 {rows} 行")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按保留策略对旧备份降精度")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="只输出将处理的文件，不写入"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    run_retention(args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
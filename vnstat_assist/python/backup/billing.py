@@ -0,0 +1,291 @@
+import calendar
+import logging
+import os
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from .backup_format import read_backup
+    from .history_db import HistoryDB
+    from .traffic_store import (
+        GRANULARITY_PRECISION,
+        TrafficStore,
+        entry_date_key,
+        pack_date_key,
+    )
+    from .traffic_summary import SERIES_SECONDS, percentile
+    from .vnstat_backup import get_day_backup_base
+except ImportError:
+    from backup_format import read_backup
+    from history_db import HistoryDB
+    from traffic_store import (
+        GRANULARITY_PRECISION,
+        TrafficStore,
+        entry_date_key,
+        pack_date_key,
+    )
+    from traffic_summary import SERIES_SECONDS, percentile
+    from vnstat_backup import get_day_backup_base
+
+SAMPLE_SECONDS = SERIES_SECONDS["fiveminute"]
+# 周期结束后留出一天，等天备份写入并入库后再缓存结果
+CACHE_GRACE = timedelta(days=1)
+
+
+def get_billing_start_day() -> int:
+    return int(os.getenv("VNA_BILLING_START_DAY", 1))
+
+
+def get_billing_quota() -> int:
+    """每周期流量配额（字节），0 表示不限"""
+    return int(float(os.getenv("VNA_BILLING_QUOTA_GB", 0)) * 1024**3)
+
+
+def get_billing_cache_coverage() -> float:
+    """已结束周期的五分钟样本数至少达到应有数的该比例才缓存结果"""
+    return float(os.getenv("VNA_BILLING_CACHE_COVERAGE", 0.99))
+
+
+def cycle_bounds(
+    year: int, month: int, start_day: int
+) -> Tuple[datetime, datetime]:
+    """从 year-month 开始的计费周期 [开始, 结束)，起始日超过当月天数时取月末"""
+    if not 1 <= start_day <= 31:
+        raise ValueError(f"计费起始日无效: {start_day}")
+
+    def start_of(y: int, m: int) -> datetime:
+        return datetime(y, m, min(start_day, calendar.monthrange(y, m)[1]))
+
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return start_of(year, month), start_of(next_year, next_month)
+
+
+def cycle_containing(now: datetime, start_day: int) -> Tuple[int, int]:
+    """当前时间所在计费周期的开始年月"""
+    year, month = now.year, now.month
+    start, _ = cycle_bounds(year, month, start_day)
+    if now < start:
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return year, month
+
+
+def _key(moment: datetime) -> Tuple[int, ...]:
+    return (moment.year, moment.month, moment.day, moment.hour, moment.minute)
+
+
+def _days(start: datetime, end: datetime):
+    day = start
+    while day < end:
+        yield day
+        day += timedelta(days=1)
+
+
+def collect_cycle(
+    iface_name: str,
+    start: datetime,
+    end: datetime,
+    history: Optional[HistoryDB] = None,
+    store: Optional[TrafficStore] = None,
+    backup_dir: Optional[str] = None,
+) -> Tuple[Dict[int, Tuple[int, int]], Dict[int, Tuple[int, int]]]:
+    """汇集 [start, end) 内的五分钟及天条目，返回 (五分钟, 天) 两个 日期键 -> (rx, tx)
+
+    优先使用历史库；库中缺少五分钟数据的天从天备份文件补齐；实时快照覆盖最近的条目
+    """
+    first = _key(start)
+    last = _key(end - timedelta(minutes=1))
+    samples: Dict[int, Tuple[int, int]] = {}
+    days: Dict[int, Tuple[int, int]] = {}
+
+    if history is not None:
+        for key, rx, tx in history.iter_rows(iface_name, "fiveminute", first, last):
+            samples[key] = (rx, tx)
+        for key, rx, tx in history.iter_rows(iface_name, "day", first, last):
+            days[key] = (rx, tx)
+
+    if backup_dir is not None:
+        day_step = 10000
+        covered = {key - key % day_step for key in samples}
+        for day in _days(start, end):
+            day_key = pack_date_key(_key(day)[:3])
+            if day_key in covered:
+                continue
+            base = get_day_backup_base(backup_dir, day.year, day.month, day.day)
+            try:
+                data = read_backup(base)
+            except Exception as e:
+                logging.warning(f"读取天备份失败 {base}: {str(e)}")
+                continue
+            if data is None:
+                continue
+            for interface in data.get("interfaces", []):
+                if interface.get("name") != iface_name:
+                    continue
+                traffic = interface.get("traffic", {})
+                for time_key, target in (("fiveminute", samples), ("day", days)):
+                    precision = GRANULARITY_PRECISION[time_key]
+                    for entry in traffic.get(time_key, []):
+                        key = entry_date_key(entry, precision)
+                        if first[:precision] <= key <= last[:precision]:
+                            target.setdefault(
+                                pack_date_key(key),
+                                (entry.get("rx", 0), entry.get("tx", 0)),
+                            )
+
+    if store is not None:
+        for time_key, target in (("fiveminute", samples), ("day", days)):
+            index = store.get_series(iface_name, time_key)
+            if index is not None:
+                for key, rx, tx in index.rows(first, last):
+                    target[key] = (rx, tx)
+
+    return samples, days
+
+
+def _rate(value: int) -> int:
+    return value * 8 // SAMPLE_SECONDS
+
+
+def compute_cycle(
+    samples: Dict[int, Tuple[int, int]],
+    days: Dict[int, Tuple[int, int]],
+    start: datetime,
+    end: datetime,
+) -> Dict[str, Any]:
+    """周期统计：P95/P99 速率（bit/s，rx、tx 及逐点较大值）、用量，
+    expected_samples 为 [start, end) 应有的五分钟样本数
+    """
+    rx = array("q", (v[0] for v in samples.values()))
+    tx = array("q", (v[1] for v in samples.values()))
+    peak = array("q", map(max, rx, tx))
+
+    rates = {}
+    for pct in (95, 99):
+        rates[f"p{pct}"] = {
+            "rx_bps": _rate(percentile(rx, pct)),
+            "tx_bps": _rate(percentile(tx, pct)),
+            "max_bps": _rate(percentile(peak, pct)),
+        }
+
+    usage_rx = sum(v[0] for v in days.values())
+    usage_tx = sum(v[1] for v in days.values())
+    expected = int((end - start).total_seconds()) // SAMPLE_SECONDS
+    return {
+        **rates,
+        "usage": {"rx": usage_rx, "tx": usage_tx, "total": usage_rx + usage_tx},
+        "samples": len(rx),
+        "expected_samples": expected,
+        "days": len(days),
+    }
+
+
+def apply_quota(
+    result: Dict[str, Any],
+    quota: int,
+    start: datetime,
+    end: datetime,
+    now: datetime,
+) -> Optional[Dict[str, Any]]:
+    """配额使用情况；未结束的周期按已用时间线性外推周期末用量"""
+    used = result["usage"]["total"]
+    if now >= end:
+        projected = used
+    else:
+        elapsed = (now - start).total_seconds()
+        total = (end - start).total_seconds()
+        projected = used * total / elapsed if elapsed > 0 else 0
+    projected = int(projected)
+
+    if quota <= 0:
+        return {"limit": 0, "used": used, "projected": projected}
+    return {
+        "limit": quota,
+        "used": used,
+        "remaining": max(quota - used, 0),
+        "percent": round(used * 100 / quota, 2),
+        "projected": projected,
+        "projected_percent": round(projected * 100 / quota, 2),
+    }
+
+
+def billing_cycle(
+    iface_name: str,
+    year: int,
+    month: int,
+    start_day: int,
+    quota: int = 0,
+    history: Optional[HistoryDB] = None,
+    store: Optional[TrafficStore] = None,
+    backup_dir: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """单个计费周期的报告，已结束的周期结果缓存在历史库中"""
+    now = now or datetime.now()
+    start, end = cycle_bounds(year, month, start_day)
+    closed = now >= end
+    cache_key = (pack_date_key(_key(start)), pack_date_key(_key(end)))
+
+    result = None
+    cached = False
+    if closed and history is not None:
+        result = history.get_billing_cycle(iface_name, *cache_key)
+        cached = result is not None
+    if result is None:
+        until = min(end, now)
+        samples, days = collect_cycle(
+            iface_name, start, until, history, store, backup_dir
+        )
+        result = compute_cycle(samples, days, start, until)
+        # 五分钟数据缺失的周期不缓存，待历史库或日志补齐后重新计算
+        complete = (
+            result["samples"]
+            >= result["expected_samples"] * get_billing_cache_coverage()
+        )
+        if history is not None and complete and now >= end + CACHE_GRACE:
+            history.put_billing_cycle(iface_name, *cache_key, result)
+
+    return {
+        "iface": iface_name,
+        "cycle": {
+            "start": start.strftime("%Y-%m-%d"),
+            "end": (end - timedelta(days=1)).strftime("%Y-%m-%d"),
+            "start_day": start_day,
+            "closed": closed,
+        },
+        **result,
+        "quota": apply_quota(result, quota, start, end, now),
+        "cached": cached,
+    }
+
+
+def billing_report(
+    iface_name: str,
+    start_day: int,
+    cycles: int = 1,
+    quota: int = 0,
+    history: Optional[HistoryDB] = None,
+    store: Optional[TrafficStore] = None,
+    backup_dir: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """从当前周期起向前 cycles 个计费周期的报告，最近的在前"""
+    now = now or datetime.now()
+    year, month = cycle_containing(now, start_day)
+    reports = []
+    for _ in range(cycles):
+        reports.append(
+            billing_cycle(
+                iface_name,
+                year,
+                month,
+                start_day,
+                quota,
+                history,
+                store,
+                backup_dir,
+                now,
+            )
+        )
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return reports
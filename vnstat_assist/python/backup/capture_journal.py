@@ -0,0 +1,420 @@
+import bisect
+import json
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from dateutil import tz
+
+try:
+    from .backup_format import EXTENSIONS, find_backup, read_backup, write_backup
+    from .backup_manifest import backup_lock, fsync_dir
+    from .history_db import HistoryDB, get_history_db_path
+    from .traffic_store import (
+        GRANULARITY_PRECISION,
+        TrafficStore,
+        entry_date_key,
+        pack_date_key,
+        unpack_date_key,
+    )
+    from .vnstat_backup import (
+        ensure_month_dir,
+        fetch_hosts_data,
+        get_day_backup_base,
+        get_host_backup_dir,
+        get_month_backup_base,
+        get_month_dir,
+        ingest_history,
+        load_hosts,
+        update_month_rollup,
+    )
+except ImportError:
+    from backup_format import EXTENSIONS, find_backup, read_backup, write_backup
+    from backup_manifest import backup_lock, fsync_dir
+    from history_db import HistoryDB, get_history_db_path
+    from traffic_store import (
+        GRANULARITY_PRECISION,
+        TrafficStore,
+        entry_date_key,
+        pack_date_key,
+        unpack_date_key,
+    )
+    from vnstat_backup import (
+        ensure_month_dir,
+        fetch_hosts_data,
+        get_day_backup_base,
+        get_host_backup_dir,
+        get_month_backup_base,
+        get_month_dir,
+        ingest_history,
+        load_hosts,
+        update_month_rollup,
+    )
+
+# 采集日志存放于备份根目录下的子目录，按条目所属日期每天一个只追加的 JSONL 文件
+JOURNAL_DIR = ".journal"
+CURSOR_NAME = "cursor.json"
+JOURNAL_FILE_PATTERN = re.compile(r"^(\d{8})\.jsonl$")
+
+# vnstat 保留时间较短的维度，天及以上的条目由天/月备份记录
+CAPTURE_KEYS = ("fiveminute", "hour")
+DAY_STEP = 10000
+# 一天结束后留出的时间，等 vnstat 保存当天最后的条目后再压实
+COMPACT_GRACE = timedelta(minutes=15)
+
+# 网卡名 -> 维度 -> 日期键 -> 条目
+JournalRows = Dict[str, Dict[str, Dict[int, Dict[str, Any]]]]
+
+
+def get_capture_interval() -> int:
+    """采集间隔（分钟），0 表示关闭"""
+    return int(os.getenv("VNA_CAPTURE_INTERVAL", 5))
+
+
+def get_journal_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, JOURNAL_DIR)
+
+
+def _load_cursor(journal_dir: str) -> Dict[str, Dict[str, int]]:
+    path = os.path.join(journal_dir, CURSOR_NAME)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        # 游标丢失只会导致重复追加，压实时按日期键去重
+        logging.warning(f"读取采集游标失败 {path}: {str(e)}")
+        return {}
+
+
+def _save_cursor(journal_dir: str, cursor: Dict[str, Dict[str, int]]):
+    path = os.path.join(journal_dir, CURSOR_NAME)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(cursor, f, separators=(",", ":"), sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _day_stamp(packed: int) -> str:
+    year, month, day = unpack_date_key(packed)[:3]
+    return f"{year}{month:02d}{day:02d}"
+
+
+def collect_new_rows(
+    store: TrafficStore, cursor: Dict[str, Dict[str, int]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """快照中晚于游标的条目，按所属日期分组为日志行，并前移游标
+
+    每个序列的最新条目所在时段可能尚未结束，留到出现更新的条目后再记录
+    """
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for name in store.interface_names():
+        for time_key in CAPTURE_KEYS:
+            index = store.get_series(name, time_key)
+            if index is None:
+                continue
+            last = cursor.get(name, {}).get(time_key, 0)
+            lo = bisect.bisect_right(index.keys, last)
+            hi = len(index) - 1
+            if hi <= lo:
+                continue
+            for i in range(lo, hi):
+                stamp = _day_stamp(index.keys[i] - index.keys[i] % DAY_STEP)
+                by_day.setdefault(stamp, []).append(
+                    {"iface": name, "time_key": time_key, "entry": index.entries[i]}
+                )
+            cursor.setdefault(name, {})[time_key] = index.keys[hi - 1]
+    return by_day
+
+
+def append_snapshot(base_dir: str, store: TrafficStore) -> int:
+    """将快照中的新条目追加到采集日志，返回追加的条目数
+
+    先追加并 fsync 日志再替换游标；两者之间崩溃只会重复追加
+    """
+    journal_dir = get_journal_dir(base_dir)
+    os.makedirs(journal_dir, exist_ok=True)
+
+    with backup_lock(journal_dir):
+        cursor = _load_cursor(journal_dir)
+        by_day = collect_new_rows(store, cursor)
+        if not by_day:
+            return 0
+
+        created = False
+        for stamp, lines in sorted(by_day.items()):
+            path = os.path.join(journal_dir, f"{stamp}.jsonl")
+            created = created or not os.path.exists(path)
+            with open(path, "a") as f:
+                f.write(
+                    "".join(
+                        json.dumps(line, separators=(",", ":")) + "\n"
+                        for line in lines
+                    )
+                )
+                f.flush()
+                os.fsync(f.fileno())
+        if created:
+            fsync_dir(journal_dir)
+        _save_cursor(journal_dir, cursor)
+    return sum(len(lines) for lines in by_day.values())
+
+
+def read_journal(path: str) -> JournalRows:
+    """读取单天的采集日志，同一日期键以后追加的为准；末尾不完整的行忽略"""
+    rows: JournalRows = {}
+    with open(path, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+                time_key = record["time_key"]
+                entry = record["entry"]
+                key = pack_date_key(
+                    entry_date_key(entry, GRANULARITY_PRECISION[time_key])
+                )
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning(f"跳过无效的采集日志行 {path}:{lineno}: {str(e)}")
+                continue
+            series = rows.setdefault(record["iface"], {})
+            series.setdefault(time_key, {})[key] = entry
+    return rows
+
+
+def merge_rows(
+    data: Dict[str, Any], rows: JournalRows, skip: Tuple[str, ...] = ()
+) -> int:
+    """将日志条目并入备份文档，文档中已有的日期键保持不变，返回新增的条目数"""
+    interfaces = data.setdefault("interfaces", [])
+    by_name = {interface.get("name"): interface for interface in interfaces}
+    added = 0
+    for name, series in rows.items():
+        interface = by_name.get(name)
+        if interface is None:
+            interface = by_name[name] = {"name": name, "traffic": {}}
+            interfaces.append(interface)
+        traffic = interface.setdefault("traffic", {})
+        for time_key, entries in series.items():
+            if time_key in skip:
+                continue
+            precision = GRANULARITY_PRECISION[time_key]
+            merged = {
+                pack_date_key(entry_date_key(entry, precision)): entry
+                for entry in traffic.get(time_key, [])
+            }
+            before = len(merged)
+            for key, entry in entries.items():
+                merged.setdefault(key, entry)
+            if len(merged) > before:
+                added += len(merged) - before
+                traffic[time_key] = [merged[key] for key in sorted(merged)]
+    return added
+
+
+def fill_day_entries(data: Dict[str, Any], year: int, month: int, day: int) -> int:
+    """快照中已没有该天的天条目时，由小时（或五分钟）条目求和补出，返回补出的网卡数"""
+    filled = 0
+    for interface in data.get("interfaces", []):
+        traffic = interface.setdefault("traffic", {})
+        if traffic.get("day"):
+            continue
+        source = traffic.get("hour") or traffic.get("fiveminute") or []
+        if not source:
+            continue
+        traffic["day"] = [
+            {
+                "id": 0,
+                "date": {"year": year, "month": month, "day": day},
+                "timestamp": source[0].get("timestamp", 0),
+                "rx": sum(entry.get("rx", 0) for entry in source),
+                "tx": sum(entry.get("tx", 0) for entry in source),
+            }
+        ]
+        filled += 1
+    return filled
+
+
+def _merge_skip(data: Dict[str, Any]) -> Tuple[str, ...]:
+    """已被保留策略降精度的文件不再并入对应维度"""
+    tier = data.get("retention", {}).get("tier")
+    if tier == "hourly":
+        return ("fiveminute",)
+    if tier == "daily":
+        return CAPTURE_KEYS
+    return ()
+
+
+def _backup_format(path: str) -> str:
+    ext = os.path.splitext(path)[1]
+    return next(fmt for fmt, value in EXTENSIONS.items() if value == ext)
+
+
+def compact_day(
+    base_dir: str, store: TrafficStore, rows: JournalRows, day: Tuple[int, int, int]
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """将单天的日志并入天备份及已存在的月备份
+
+    天备份不存在时由快照切出当天数据再并入日志；返回 (有变化时的天备份文档, 是否新建)
+    """
+    year, month, _ = day
+    ensure_month_dir(base_dir, year, month)
+    with backup_lock(get_month_dir(base_dir, year, month)):
+        base = get_day_backup_base(base_dir, *day)
+        path = find_backup(base)
+        if path is not None:
+            data = read_backup(base)
+            created = False
+            added = merge_rows(data, rows, _merge_skip(data))
+            if added:
+                write_backup(base, data, _backup_format(path))
+        else:
+            data = store.partition_by_day([day])[day]
+            created = True
+            added = merge_rows(data, rows)
+            if fill_day_entries(data, *day):
+                logging.warning(
+                    f"快照中已无 {year}-{month:02d}-{day[2]:02d} 的天条目，"
+                    f"由采集日志求和补出"
+                )
+            write_backup(base, data)
+
+        month_base = get_month_backup_base(base_dir, year, month)
+        month_path = find_backup(month_base)
+        if month_path is not None:
+            month_data = read_backup(month_base)
+            if merge_rows(month_data, rows, _merge_skip(month_data)):
+                write_backup(month_base, month_data, _backup_format(month_path))
+
+    if not created and not added:
+        return None, False
+    return data, created
+
+
+def compact_journal(
+    base_dir: str,
+    store: TrafficStore,
+    now: datetime,
+    history: Optional[HistoryDB] = None,
+) -> Dict[str, List[str]]:
+    """将已结束的天的采集日志压实到天/月备份，成功后删除对应日志文件
+
+    返回 compacted / failed 日期列表
+    """
+    report: Dict[str, List[str]] = {"compacted": [], "failed": []}
+    journal_dir = get_journal_dir(base_dir)
+    if not os.path.isdir(journal_dir):
+        return report
+    cutoff = (now - COMPACT_GRACE).strftime("%Y%m%d")
+
+    with backup_lock(journal_dir):
+        stamps = []
+        for name in sorted(os.listdir(journal_dir)):
+            m = JOURNAL_FILE_PATTERN.match(name)
+            if m and m.group(1) < cutoff:
+                stamps.append(m.group(1))
+
+        created_days: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        for stamp in stamps:
+            path = os.path.join(journal_dir, f"{stamp}.jsonl")
+            day = (int(stamp[:4]), int(stamp[4:6]), int(stamp[6:8]))
+            try:
+                data, created = compact_day(base_dir, store, read_journal(path), day)
+            except Exception as e:
+                logging.error(f"压实采集日志失败，保留日志 {path}: {str(e)}")
+                report["failed"].append(stamp)
+                continue
+            if created:
+                created_days.setdefault(day[:2], []).append(data)
+            if data is not None:
+                ingest_history(data, history)
+            os.remove(path)
+            report["compacted"].append(stamp)
+        if report["compacted"]:
+            fsync_dir(journal_dir)
+
+    # 新建的天备份按月各更新一次月汇总
+    for (year, month), days in sorted(created_days.items()):
+        try:
+            update_month_rollup(base_dir, year, month, *days)
+        except Exception as e:
+            logging.warning(f"更新月汇总失败: {str(e)}")
+    return report
+
+
+def prune_journal(base_dir: str, before: str, dry_run: bool = False) -> int:
+    """删除早于 before（YYYYMMDD）的采集日志，返回删除的文件数
+
+    正常压实后日志即被删除，留到这里的是多次压实失败的天；其数据已超出保留窗口，不再重试
+    """
+    journal_dir = get_journal_dir(base_dir)
+    if not os.path.isdir(journal_dir):
+        return 0
+
+    with backup_lock(journal_dir):
+        stale = []
+        for name in sorted(os.listdir(journal_dir)):
+            m = JOURNAL_FILE_PATTERN.match(name)
+            if m and m.group(1) < before:
+                stale.append(os.path.join(journal_dir, name))
+        for path in stale:
+            if dry_run:
+                logging.info(f"[dry-run] 将删除过期的采集日志: {path}")
+                continue
+            logging.warning(f"删除未能压实的过期采集日志: {path}")
+            os.remove(path)
+        if stale and not dry_run:
+            fsync_dir(journal_dir)
+    return len(stale)
+
+
+def capture_host(
+    host: str, data: Dict[str, Any], now: datetime
+) -> Tuple[int, Dict[str, List[str]]]:
+    """追加单个上游的新条目并压实已结束的天，返回 (追加条目数, 压实结果)"""
+    base_dir = get_host_backup_dir(host)
+    os.makedirs(base_dir, exist_ok=True)
+    store = TrafficStore(data)
+    appended = append_snapshot(base_dir, store)
+    report = compact_journal(
+        base_dir, store, now, HistoryDB(get_history_db_path(host))
+    )
+    return appended, report
+
+
+def run_capture(now: Optional[datetime] = None):
+    """拉取所有上游的快照写入采集日志，由调度器每隔 VNA_CAPTURE_INTERVAL 分钟执行"""
+    now = now or datetime.now(tz=tz.gettz("Asia/Shanghai"))
+    for host, data in fetch_hosts_data(load_hosts()).items():
+        try:
+            appended, report = capture_host(host, data, now)
+        except Exception as e:
+            logging.error(f"[{host}] 采集失败: {str(e)}")
+            continue
+        if report["compacted"] or report["failed"]:
+            logging.info(
+                f"[{host}] 采集日志已压实 {len(report['compacted'])} 天，"
+                f"失败 {len(report['failed'])} 天"
+            )
+        logging.debug(f"[{host}] 采集日志追加 {appended} 条")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    run_capture()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from .backup_format import BACKUP_NAME_PATTERN, read_backup
+    from .traffic_store import (
+        GRANULARITY_PRECISION,
+        TIME_KEYS,
+        entry_date_key,
+        pack_date_key,
+        unpack_date_key,
+    )
+    from .upstream_client import DEFAULT_HOST
+except ImportError:
+    from backup_format import BACKUP_NAME_PATTERN, read_backup
+    from traffic_store import (
+        GRANULARITY_PRECISION,
+        TIME_KEYS,
+        entry_date_key,
+        pack_date_key,
+        unpack_date_key,
+    )
+    from upstream_client import DEFAULT_HOST
+
+DEFAULT_DB_PATH = "/app/backups/history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interfaces (
+    name TEXT PRIMARY KEY,
+    meta TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS traffic (
+    iface TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    date_key INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    rx INTEGER NOT NULL,
+    tx INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (iface, granularity, date_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS billing_cycles (
+    iface TEXT NOT NULL,
+    cycle_start INTEGER NOT NULL,
+    cycle_end INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (iface, cycle_start, cycle_end)
+) WITHOUT ROWID;
+"""
+
+
+def get_history_db_path(host: str = DEFAULT_HOST) -> str:
+    """默认上游使用 VNA_HISTORY_DB，其余上游的库位于其同级的 hosts/<名称>/ 下"""
+    path = os.getenv("VNA_HISTORY_DB", DEFAULT_DB_PATH)
+    if host == DEFAULT_HOST:
+        return path
+    return os.path.join(os.path.dirname(path), "hosts", host, "history.db")
+
+
+class HistoryDB:
+    """按 (网卡, 时间维度, 日期) 索引的历史流量库，每个线程持有独立连接"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def ingest(self, data: Dict[str, Any]) -> int:
+        """写入一份 vnstat 文档（通常为 filter_data 的输出），同日期条目覆盖，返回写入行数"""
+        iface_rows = []
+        traffic_rows = []
+        # 每个网卡写入的五分钟/天条目的日期键范围，用于失效覆盖这些日期的计费缓存
+        billing_spans: Dict[str, List[int]] = {}
+
+        for interface in data.get("interfaces", []):
+            name = interface.get("name", "unknown")
+            meta = {k: v for k, v in interface.items() if k != "traffic"}
+            iface_rows.append((name, json.dumps(meta)))
+
+            traffic = interface.get("traffic", {})
+            for time_key in TIME_KEYS:
+                precision = GRANULARITY_PRECISION[time_key]
+                for entry in traffic.get(time_key, []):
+                    date_key = pack_date_key(entry_date_key(entry, precision))
+                    if time_key in ("fiveminute", "day"):
+                        span = billing_spans.setdefault(name, [date_key, date_key])
+                        span[0] = min(span[0], date_key)
+                        span[1] = max(span[1], date_key)
+                    traffic_rows.append(
+                        (
+                            name,
+                            time_key,
+                            date_key,
+                            entry.get("timestamp", 0),
+                            entry.get("rx", 0),
+                            entry.get("tx", 0),
+                            json.dumps(entry, separators=(",", ":")),
+                        )
+                    )
+
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO interfaces (name, meta) VALUES (?, ?)",
+                iface_rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO traffic "
+                "(iface, granularity, date_key, timestamp, rx, tx, entry) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                traffic_rows,
+            )
+            conn.executemany(
+                "DELETE FROM billing_cycles "
+                "WHERE iface = ? AND cycle_start <= ? AND cycle_end > ?",
+                [(name, last, first) for name, (first, last) in billing_spans.items()],
+            )
+        return len(traffic_rows)
+
+    def _key_range(
+        self, granularity: str, start: Tuple[int, ...], end: Tuple[int, ...]
+    ) -> Tuple[int, int]:
+        precision = GRANULARITY_PRECISION[granularity]
+        return pack_date_key(start[:precision]), pack_date_key(end[:precision])
+
+    def has_interface(self, iface_name: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM interfaces WHERE name = ?", (iface_name,)
+        ).fetchone()
+        return row is not None
+
+    def interface_names(self) -> List[str]:
+        rows = self._conn().execute("SELECT name FROM interfaces ORDER BY name")
+        return [name for (name,) in rows]
+
+    def query_interface_range(
+        self,
+        iface_name: str,
+        granularity: str,
+        start: Tuple[int, ...],
+        end: Tuple[int, ...],
+    ) -> Optional[Dict[str, Any]]:
+        """返回单个网卡单个时间维度在范围内的条目及 rx/tx 合计，网卡不存在时返回None"""
+        if not self.has_interface(iface_name):
+            return None
+
+        lower, upper = self._key_range(granularity, start, end)
+        order = "rx + tx DESC" if granularity == "top" else "date_key"
+        rows = self._conn().execute(
+            "SELECT entry FROM traffic "
+            "WHERE iface = ? AND granularity = ? AND date_key BETWEEN ? AND ? "
+            f"ORDER BY {order}",
+            (iface_name, granularity, lower, upper),
+        )
+        entries = [json.loads(entry) for (entry,) in rows]
+        total_rx, total_tx = self._conn().execute(
+            "SELECT COALESCE(SUM(rx), 0), COALESCE(SUM(tx), 0) FROM traffic "
+            "WHERE iface = ? AND granularity = ? AND date_key BETWEEN ? AND ?",
+            (iface_name, granularity, lower, upper),
+        ).fetchone()
+        return {"entries": entries, "total": {"rx": total_rx, "tx": total_tx}}
+
+    def iter_rows(
+        self,
+        iface_name: str,
+        granularity: str,
+        start: Tuple[int, ...],
+        end: Tuple[int, ...],
+    ):
+        """按日期升序流式返回范围内的 (date_key, rx, tx)"""
+        lower, upper = self._key_range(granularity, start, end)
+        return self._conn().execute(
+            "SELECT date_key, rx, tx FROM traffic "
+            "WHERE iface = ? AND granularity = ? AND date_key BETWEEN ? AND ? "
+            "ORDER BY date_key",
+            (iface_name, granularity, lower, upper),
+        )
+
+    def get_billing_cycle(
+        self, iface_name: str, cycle_start: int, cycle_end: int
+    ) -> Optional[Dict[str, Any]]:
+        """读取已结束计费周期的缓存结果，周期以打包日期键表示"""
+        row = self._conn().execute(
+            "SELECT result FROM billing_cycles "
+            "WHERE iface = ? AND cycle_start = ? AND cycle_end = ?",
+            (iface_name, cycle_start, cycle_end),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_billing_cycle(
+        self,
+        iface_name: str,
+        cycle_start: int,
+        cycle_end: int,
+        result: Dict[str, Any],
+    ):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO billing_cycles "
+                "(iface, cycle_start, cycle_end, result) VALUES (?, ?, ?, ?)",
+                (iface_name, cycle_start, cycle_end, json.dumps(result)),
+            )
+
+    def downsample(
+        self,
+        hourly_before: Optional[Tuple[int, ...]],
+        daily_before: Optional[Tuple[int, ...]],
+    ) -> int:
+        """按备份保留层级精简：早于 hourly_before 的五分钟条目并入缺失的小时后删除，
+        早于 daily_before 的小时及五分钟条目删除，天及以上的条目保留；
+        None 表示关闭该层级，返回删除的行数
+        """
+        daily_key = pack_date_key(daily_before) if daily_before else 0
+        fiveminute_key = max(
+            pack_date_key(hourly_before) if hourly_before else 0, daily_key
+        )
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT f.iface, f.date_key, f.timestamp, f.rx, f.tx FROM traffic f "
+            "WHERE f.granularity = 'fiveminute' AND f.date_key BETWEEN ? AND ? "
+            "AND NOT EXISTS (SELECT 1 FROM traffic h WHERE h.iface = f.iface "
+            "AND h.granularity = 'hour' "
+            "AND h.date_key = f.date_key - f.date_key % 100) "
+            "ORDER BY f.iface, f.date_key",
+            (daily_key, fiveminute_key - 1),
+        )
+        filled: Dict[Tuple[str, int], List[int]] = {}
+        for iface, date_key, timestamp, rx, tx in rows:
+            slot = filled.setdefault(
+                (iface, date_key - date_key % 100), [timestamp, 0, 0]
+            )
+            slot[1] += rx
+            slot[2] += tx
+
+        hour_rows = []
+        for (iface, date_key), (timestamp, rx, tx) in filled.items():
+            year, month, day, hour, _ = unpack_date_key(date_key)
+            entry = {
+                "id": 0,
+                "date": {"year": year, "month": month, "day": day},
+                "timestamp": timestamp,
+                "time": {"hour": hour, "minute": 0},
+                "rx": rx,
+                "tx": tx,
+            }
+            hour_rows.append(
+                (iface, "hour", date_key, timestamp, rx, tx, json.dumps(entry))
+            )
+
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO traffic "
+                "(iface, granularity, date_key, timestamp, rx, tx, entry) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                hour_rows,
+            )
+            deleted = conn.execute(
+                "DELETE FROM traffic WHERE granularity = 'fiveminute' AND date_key < ?",
+                (fiveminute_key,),
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM traffic WHERE granularity = 'hour' AND date_key < ?",
+                (daily_key,),
+            ).rowcount
+        return deleted
+
+    def coverage(self) -> List[Dict[str, Any]]:
+        """每个网卡每个时间维度的条目数及首末日期"""
+        rows = self._conn().execute(
+            "SELECT iface, granularity, COUNT(*), MIN(date_key), MAX(date_key) "
+            "FROM traffic GROUP BY iface, granularity ORDER BY iface, granularity"
+        )
+        return [
+            {
+                "iface": iface,
+                "granularity": granularity,
+                "count": count,
+                "first": first,
+                "last": last,
+            }
+            for iface, granularity, count, first, last in rows
+        ]
+
+
+def import_tree(db: HistoryDB, base_dir: str) -> Tuple[int, int]:
+    """将备份目录下所有天/月备份导入数据库，返回 (文件数, 行数)"""
+    files = 0
+    rows = 0
+
+    for root, _, filenames in os.walk(base_dir):
+        for filename in sorted(filenames):
+            m = BACKUP_NAME_PATTERN.match(filename)
+            # 月汇总由天备份派生，无需重复导入
+            if not m or filename.startswith("vnstat_rollup_"):
+                continue
+            try:
+                data = read_backup(os.path.join(root, m.group(1)))
+            except Exception as e:
+                logging.warning(f"读取备份文件失败，跳过 {filename}: {str(e)}")
+                continue
+            if data is None:
+                continue
+
+            rows += db.ingest(data)
+            files += 1
+            logging.info(f"导入: {filename}")
+
+    return files, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将vnstat备份导入SQLite历史库")
+    parser.add_argument(
+        "--dir", default="/app/backups/json", help="备份目录（默认 /app/backups/json）"
+    )
+    parser.add_argument(
+        "--db", default=get_history_db_path(), help=f"数据库路径（默认 {DEFAULT_DB_PATH}）"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    if not os.path.isdir(args.dir):
+        logging.error(f"备份目录不存在: {args.dir}")
+        sys.exit(1)
+
+    db = HistoryDB(args.db)
+    files, rows = import_tree(db, args.dir)
+    db.close()
+    logging.info(f"导入完成，共导入 {files} 个文件，{rows} 条记录")
+
+
+if __name__ == "__main__":
+    main()
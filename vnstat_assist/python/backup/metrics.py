@@ -0,0 +1,430 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+try:
+    from .backup_manifest import backup_lock
+except ImportError:
+    from backup_manifest import backup_lock
+
+# 各进程（gunicorn 工作进程、定时任务）将本进程的指标快照写入该目录，/metrics 读取后合并输出
+DEFAULT_METRICS_DIR = "/tmp/vnstat_assist_metrics"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4**i for i in range(10))  # 1KB .. 256MB
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 各进程的快照为 {role}_{pid}.json；已退出进程的累计值并入 {role}_retired.json
+SNAPSHOT_NAME_PATTERN = re.compile(r"^([a-z]+)_(\d+)\.json$")
+RETIRED_SUFFIX = "retired"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def get_metrics_dir() -> str:
+    return os.getenv("VNA_METRICS_DIR", DEFAULT_METRICS_DIR)
+
+
+def get_flush_interval() -> float:
+    return float(os.getenv("VNA_METRICS_FLUSH_INTERVAL", 10))
+
+
+class Registry:
+    """进程内的指标集合，role 设置后可写出快照供其他进程合并"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, "_Metric"] = {}
+        self.role: Optional[str] = None
+        # 每次更新递增，快照未变化时不重写文件
+        self.version = 0
+        self._written_version = -1
+        self._flusher: Optional[threading.Thread] = None
+
+    def register(self, metric: "_Metric"):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is None:
+                self.metrics[metric.name] = metric
+                return
+            if existing.kind != metric.kind:
+                raise ValueError(f"指标重复注册: {metric.name}")
+            # 同一模块分别以包内、顶层名称导入时，两个对象共用同一份数据
+            metric.values = existing.values
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "role": self.role,
+                "updated": time.time(),
+                "metrics": {
+                    name: metric.describe() for name, metric in self.metrics.items()
+                },
+            }
+
+    def snapshot_path(self) -> Optional[str]:
+        if self.role is None:
+            return None
+        return os.path.join(get_metrics_dir(), f"{self.role}_{os.getpid()}.json")
+
+    def write_snapshot(self, force: bool = False):
+        """原子写出本进程的快照；指标只用于监控，写入失败只记录日志"""
+        path = self.snapshot_path()
+        if path is None or (not force and self.version == self._written_version):
+            return
+        version = self.version
+        try:
+            _write_snapshot_file(path, self.snapshot())
+            self._written_version = version
+        except OSError as e:
+            logging.warning(f"写入指标快照失败 {path}: {str(e)}")
+
+    def start_flusher(self, role: str, interval: Optional[float] = None):
+        """设置进程角色并启动后台线程，每隔 interval 秒写出有变化的快照"""
+        self.role = role
+        interval = get_flush_interval() if interval is None else interval
+        with self.lock:
+            if self._flusher is not None or interval <= 0:
+                return
+
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    self.write_snapshot()
+
+            self._flusher = threading.Thread(
+                target=loop, name="metrics-flusher", daemon=True
+            )
+            self._flusher.start()
+
+
+REGISTRY = Registry()
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry
+        self.values: Dict[LabelKey, Any] = {}
+        registry.register(self)
+
+    def describe(self) -> Dict[str, Any]:
+        """调用方持有 registry.lock"""
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "samples": [[dict(key), value] for key, value in self.values.items()],
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.version += 1
+
+    def total(self) -> float:
+        """各标签组合之和"""
+        with self.registry.lock:
+            return sum(self.values.values())
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = value
+            self.registry.version += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, registry)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0,
+                    "count": 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+            self.registry.version += 1
+
+    def describe(self) -> Dict[str, Any]:
+        result = super().describe()
+        result["buckets"] = list(self.buckets)
+        # 快照中的样本须为副本，避免写出时被并发修改
+        result["samples"] = [
+            [labels, {**state, "buckets": list(state["buckets"])}]
+            for labels, state in result["samples"]
+        ]
+        return result
+
+
+def _write_snapshot_file(path: str, snapshot: Dict[str, Any]):
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots(skip: Optional[str]) -> List[Dict[str, Any]]:
+    snapshots = []
+    directory = get_metrics_dir()
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return snapshots
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.endswith(".json") or path == skip:
+            continue
+        try:
+            with open(path, "r") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取指标快照失败 {path}: {str(e)}")
+    return snapshots
+
+
+def collect(registry: Registry = REGISTRY) -> Dict[str, Dict[str, Any]]:
+    """合并本进程及目录中其他进程的快照
+
+    计数器和直方图按标签求和（已退出进程的累计值先并入 retired 快照，不回退也不重复）；
+    仪表取最近更新的存活进程的值
+    """
+    retire_dead_snapshots()
+    snapshots = _read_snapshots(registry.snapshot_path())
+    snapshots.append(registry.snapshot())
+    snapshots.sort(key=lambda s: s.get("updated", 0))
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        _merge_metrics(merged, snapshot.get("metrics", {}))
+    return merged
+
+
+def _merge_metrics(
+    merged: Dict[str, Dict[str, Any]],
+    metrics: Dict[str, Dict[str, Any]],
+    gauges: bool = True,
+):
+    """将一个快照的指标并入 merged；gauges=False 时跳过仪表"""
+    for name, metric in metrics.items():
+        if metric["type"] == "gauge" and not gauges:
+            continue
+        target = merged.setdefault(
+            name,
+            {
+                "type": metric["type"],
+                "help": metric["help"],
+                "buckets": metric.get("buckets"),
+                "samples": {},
+            },
+        )
+        if target["type"] != metric["type"]:
+            continue
+        samples = target["samples"]
+        for labels, value in metric["samples"]:
+            key = _label_key(labels)
+            current = samples.get(key)
+            if metric["type"] == "gauge" or current is None:
+                samples[key] = value
+            elif metric["type"] == "counter":
+                samples[key] = current + value
+            elif metric.get("buckets") == target["buckets"]:
+                samples[key] = {
+                    "buckets": [
+                        a + b for a, b in zip(current["buckets"], value["buckets"])
+                    ],
+                    "sum": current["sum"] + value["sum"],
+                    "count": current["count"] + value["count"],
+                }
+
+
+def retire_dead_snapshots():
+    """将已退出进程（工作进程重启、崩溃）的快照并入所属角色的 retired 快照后删除
+
+    计数器和直方图的累计值保留，不随进程重启回退；仪表只反映存活进程，直接丢弃。
+    在目录锁内执行，retired 快照记录已并入的文件，同一快照不会被重复累加
+    """
+    directory = get_metrics_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    dead = []
+    for name in names:
+        match = SNAPSHOT_NAME_PATTERN.match(name)
+        if match is None:
+            continue
+        pid = int(match.group(2))
+        if pid != os.getpid() and not _pid_alive(pid):
+            dead.append((match.group(1), name))
+    if not dead:
+        return
+
+    with backup_lock(directory):
+        by_role: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        for role, name in dead:
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r") as f:
+                    snapshot = json.load(f)
+            except FileNotFoundError:
+                # 已被其他进程并入
+                continue
+            except (OSError, ValueError) as e:
+                logging.warning(f"丢弃损坏的指标快照 {path}: {str(e)}")
+                os.remove(path)
+                continue
+            by_role.setdefault(role, []).append((name, snapshot))
+
+        for role, items in by_role.items():
+            retired_path = os.path.join(directory, f"{role}_{RETIRED_SUFFIX}.json")
+            retired: Dict[str, Any] = {"metrics": {}, "folded": {}}
+            try:
+                with open(retired_path, "r") as f:
+                    retired = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logging.warning(f"读取指标快照失败 {retired_path}: {str(e)}")
+
+            merged: Dict[str, Dict[str, Any]] = {}
+            _merge_metrics(merged, retired.get("metrics", {}), gauges=False)
+            # 只需记录仍存在的文件
+            folded = {
+                name: updated
+                for name, updated in retired.get("folded", {}).items()
+                if os.path.exists(os.path.join(directory, name))
+            }
+            for name, snapshot in items:
+                # 上次并入后未能删除的文件不再重复累加
+                if folded.get(name) != snapshot.get("updated"):
+                    _merge_metrics(merged, snapshot.get("metrics", {}), gauges=False)
+                    folded[name] = snapshot.get("updated")
+
+            _write_snapshot_file(
+                retired_path,
+                {
+                    "pid": None,
+                    "role": role,
+                    "updated": time.time(),
+                    "metrics": {
+                        name: {
+                            "type": metric["type"],
+                            "help": metric["help"],
+                            "buckets": metric["buckets"],
+                            "samples": [
+                                [dict(key), value]
+                                for key, value in metric["samples"].items()
+                            ],
+                        }
+                        for name, metric in merged.items()
+                    },
+                    "folded": folded,
+                },
+            )
+            for name, _ in items:
+                os.remove(os.path.join(directory, name))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(merged: Dict[str, Dict[str, Any]]) -> str:
+    """Prometheus 文本格式"""
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {_escape(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value["buckets"]):
+                cumulative += count
+                le = (("le", _format_value(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+            inf = (("le", "+Inf"),)
+            lines.append(f"{name}_bucket{_format_labels(key, inf)} {value['count']}")
+            total = _format_value(value["sum"])
+            lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def clear_snapshots(role: str):
+    """删除指定角色遗留的快照，服务重启时调用，使计数从零开始"""
+    directory = get_metrics_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(f"{role}_"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,509 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Any, List, Optional, Tuple
+
+# 采集控制文件及各工作进程的剖析结果所在目录，各工作进程据此同步开始、结束采集
+DEFAULT_PROFILE_DIR = "/tmp/vnstat_assist_profiles"
+CONTROL_NAME = "control.json"
+PROFILE_MODES = ("cprofile", "sampling")
+# 单次采集的最长时间，按请求数采集时同样以此为上限
+MAX_PROFILE_SECONDS = 600
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# 工作进程最多每隔该秒数检查一次控制文件，未采集时请求只多一次时间比较
+CONTROL_CHECK_INTERVAL = 1.0
+# 保留最近的采集结果数
+KEEP_CAPTURES = 10
+CAPTURE_ID_PATTERN = re.compile(r"^\d{14}_[0-9a-f]{6}$")
+RESULT_EXTENSIONS = {"cprofile": ".prof", "sampling": ".folded"}
+
+
+class ProfileBusyError(Exception):
+    """已有进行中的采集"""
+
+
+class RequestTimings:
+    """单个请求内各阶段的耗时，生成 Server-Timing 响应头
+
+    阶段可以嵌套（如合并天备份期间的读盘、解析），外层只记录扣除内层后的自身耗时，
+    各阶段之和不超过请求总耗时
+    """
+
+    def __init__(self):
+        self.spans: Dict[str, List[float]] = {}
+        # 进行中的各层阶段已累计的内层耗时
+        self._children: List[float] = []
+
+    def add(self, name: str, seconds: float):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+    def header(self, total: Optional[float] = None) -> str:
+        parts = []
+        for name, (seconds, count) in self.spans.items():
+            part = f"{name};dur={seconds * 1000:.2f}"
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "vna_request_timings", default=None
+)
+
+
+def begin_request_timings() -> Token:
+    return _current_timings.set(RequestTimings())
+
+
+def end_request_timings(token: Token):
+    _current_timings.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def timed(name: str):
+    """记录一个阶段的耗时；不在请求内（定时任务、后台刷新线程）时不做任何事"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    timings._children.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings.add(name, elapsed - timings._children.pop())
+        if timings._children:
+            timings._children[-1] += elapsed
+
+
+def get_profile_dir() -> str:
+    return os.getenv("VNA_PROFILE_DIR", DEFAULT_PROFILE_DIR)
+
+
+def _control_path() -> str:
+    return os.path.join(get_profile_dir(), CONTROL_NAME)
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_control() -> Optional[Dict[str, Any]]:
+    """进行中的采集，已到期或不存在时返回None"""
+    control = _read_json(_control_path())
+    if control is None or time.time() >= control.get("deadline", 0):
+        return None
+    return control
+
+
+def start_capture(
+    mode: str,
+    seconds: float = 0,
+    requests: int = 0,
+    interval: float = DEFAULT_SAMPLE_INTERVAL,
+) -> Dict[str, Any]:
+    """开始一次采集：持续 seconds 秒，或每个工作进程剖析接下来的 requests 个请求
+
+    已有进行中的采集时抛出 ProfileBusyError，参数无效时抛出 ValueError
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"未知的剖析方式: {mode}")
+    if seconds < 0 or requests < 0 or not (seconds or requests):
+        raise ValueError("须指定 seconds 或 requests")
+    if seconds > MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds 不能超过 {MAX_PROFILE_SECONDS}")
+    if interval <= 0:
+        raise ValueError("采样间隔须大于0")
+    if read_control() is not None:
+        raise ProfileBusyError("已有进行中的采集")
+
+    directory = get_profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    _prune_captures(KEEP_CAPTURES - 1)
+    now = time.time()
+    control = {
+        "id": f"{time.strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(3)}",
+        "mode": mode,
+        "created": now,
+        "deadline": now + (seconds or MAX_PROFILE_SECONDS),
+        "requests": requests,
+        "interval": interval,
+    }
+    _write_json_atomic(_control_path(), control)
+    return control
+
+
+def stop_capture() -> Optional[Dict[str, Any]]:
+    """提前结束进行中的采集，各工作进程在下次检查控制文件时写出结果"""
+    control = read_control()
+    clear_capture()
+    return control
+
+
+def clear_capture():
+    try:
+        os.remove(_control_path())
+    except OSError:
+        pass
+
+
+def _result_files() -> Dict[str, List[str]]:
+    """采集ID -> 各工作进程的结果文件（不含扩展名）"""
+    directory = get_profile_dir()
+    captures: Dict[str, List[str]] = {}
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return captures
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        capture_id = stem.rpartition("_")[0]
+        if ext == ".json" and CAPTURE_ID_PATTERN.match(capture_id):
+            captures.setdefault(capture_id, []).append(os.path.join(directory, stem))
+    return captures
+
+
+def _prune_captures(keep: int):
+    captures = _result_files()
+    for capture_id in sorted(captures)[: max(len(captures) - keep, 0)]:
+        for stem in captures[capture_id]:
+            for ext in (".json", *RESULT_EXTENSIONS.values()):
+                try:
+                    os.remove(stem + ext)
+                except OSError:
+                    pass
+
+
+def list_captures() -> List[Dict[str, Any]]:
+    """已有的采集结果，按各工作进程的记录汇总，最新的在前"""
+    control = read_control()
+    active = control["id"] if control else None
+    result = []
+    for capture_id, stems in _result_files().items():
+        workers = [_read_json(stem + ".json") for stem in stems]
+        workers = [meta for meta in workers if meta]
+        if not workers:
+            continue
+        result.append(
+            {
+                "id": capture_id,
+                "mode": workers[0]["mode"],
+                "workers": len(workers),
+                "requests": sum(w["requests"] for w in workers),
+                "samples": sum(w["samples"] for w in workers),
+                "active": capture_id == active,
+                "done": all(w["done"] for w in workers),
+                "updated": max(w["updated"] for w in workers),
+            }
+        )
+    result.sort(key=lambda capture: capture["updated"], reverse=True)
+    return result
+
+
+def load_capture(capture_id: str, text: bool = False) -> Optional[Tuple[bytes, str]]:
+    """合并各工作进程的结果，返回 (内容, 文件名)，不存在时返回None
+
+    cprofile 为 pstats 格式（可用 snakeviz 等打开），text=True 时为按累计耗时排序的文本；
+    sampling 为折叠栈格式（flamegraph.pl / speedscope）
+    """
+    if not CAPTURE_ID_PATTERN.match(capture_id):
+        return None
+    stems = _result_files().get(capture_id)
+    if not stems:
+        return None
+    meta = _read_json(stems[0] + ".json") or {}
+    ext = RESULT_EXTENSIONS.get(meta.get("mode"), "")
+    paths = [stem + ext for stem in stems if os.path.exists(stem + ext)]
+    if not paths:
+        return None
+
+    if ext == ".folded":
+        samples: Counter = Counter()
+        for path in paths:
+            with open(path, "r") as f:
+                for line in f:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack:
+                        samples[stack] += int(count)
+        body = "".join(f"{stack} {n}\n" for stack, n in samples.most_common())
+        return body.encode(), f"{capture_id}.folded"
+
+    stats = pstats.Stats(*paths, stream=io.StringIO())
+    if text:
+        stats.sort_stats("cumulative").print_stats(100)
+        return stats.stream.getvalue().encode(), f"{capture_id}.txt"
+    tmp_path = os.path.join(get_profile_dir(), f".{capture_id}.{os.getpid()}.prof")
+    try:
+        stats.dump_stats(tmp_path)
+        with open(tmp_path, "rb") as f:
+            return f.read(), f"{capture_id}.prof"
+    finally:
+        os.remove(tmp_path)
+
+
+def _frame_name(code) -> str:
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """工作进程内的采集状态，由请求前后的钩子调用
+
+    cprofile：同一时刻只剖析一个请求（并发请求照常处理但不计入）；Python 3.12 起
+    cProfile 基于 sys.monitoring，剖析期间其他线程的调用同样会被记录。
+    sampling：后台线程按间隔采样正在处理请求的线程的调用栈，开销与请求数无关
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.capture: Optional[Dict[str, Any]] = None
+        self.handled = 0
+        self._checked = 0.0
+        self._finished = set()
+        self._busy = False
+        self._stats: Optional[pstats.Stats] = None
+        self._samples: Counter = Counter()
+        self._sample_count = 0
+        self._threads = set()
+        self._stop = threading.Event()
+
+    def _stem(self, capture_id: str) -> str:
+        return os.path.join(get_profile_dir(), f"{capture_id}_{os.getpid()}")
+
+    def _refresh(self, now: float):
+        """按控制文件开始新的采集，或在控制文件被删除、替换时结束当前采集"""
+        self._checked = now
+        control = read_control()
+        current = self.capture
+        if current is not None and (control is None or control["id"] != current["id"]):
+            self._finish(current["id"])
+        if (
+            control is not None
+            and self.capture is None
+            and control["id"] not in self._finished
+        ):
+            with self.lock:
+                self.capture = control
+                self.handled = 0
+                self._stats = None
+                self._samples = Counter()
+                self._sample_count = 0
+                self._threads = set()
+                self._stop = threading.Event()
+            if control["mode"] == "sampling":
+                threading.Thread(
+                    target=self._sample_loop,
+                    args=(control, self._stop),
+                    name="profile-sampler",
+                    daemon=True,
+                ).start()
+            self._write_meta(control, done=False)
+
+    def begin(self) -> Optional[Tuple[str, Any]]:
+        """请求开始时调用，需要剖析时返回句柄，交给 end"""
+        now = time.time()
+        if now - self._checked >= CONTROL_CHECK_INTERVAL:
+            self._refresh(now)
+        capture = self.capture
+        if capture is None:
+            return None
+        if now >= capture["deadline"]:
+            self._finish(capture["id"])
+            return None
+
+        with self.lock:
+            if self.capture is not capture or (
+                capture["requests"] and self.handled >= capture["requests"]
+            ):
+                return None
+            if capture["mode"] == "sampling":
+                self.handled += 1
+                ident = threading.get_ident()
+                self._threads.add(ident)
+                return capture["id"], ident
+            if self._busy:
+                return None
+            self._busy = True
+            self.handled += 1
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # 其他剖析工具（如调试器）已占用
+            logging.warning(f"无法启动 cProfile: {str(e)}")
+            with self.lock:
+                self._busy = False
+            return None
+        return capture["id"], profile
+
+    def end(self, handle: Optional[Tuple[str, Any]]):
+        """请求结束时调用（无论是否出错）"""
+        if handle is None:
+            return
+        capture_id, target = handle
+        if isinstance(target, cProfile.Profile):
+            target.disable()
+            with self.lock:
+                self._busy = False
+                capture = self.capture
+                if capture is None or capture["id"] != capture_id:
+                    return
+                if self._stats is None:
+                    self._stats = pstats.Stats(target, stream=io.StringIO())
+                else:
+                    self._stats.add(target)
+                self._dump_stats(capture_id)
+                done = bool(capture["requests"]) and self.handled >= capture["requests"]
+            self._write_meta(capture, done=False)
+            if done:
+                self._finish(capture_id)
+            return
+
+        with self.lock:
+            self._threads.discard(target)
+            capture = self.capture
+            done = (
+                capture is not None
+                and capture["id"] == capture_id
+                and bool(capture["requests"])
+                and self.handled >= capture["requests"]
+                and not self._threads
+            )
+        if done:
+            self._finish(capture_id)
+
+    def _dump_stats(self, capture_id: str):
+        """调用方持有 self.lock"""
+        path = self._stem(capture_id) + RESULT_EXTENSIONS["cprofile"]
+        tmp_path = f"{path}.tmp"
+        try:
+            self._stats.dump_stats(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"写入剖析结果失败 {path}: {str(e)}")
+
+    def _write_samples(self, capture_id: str, lines: List[str]):
+        path = self._stem(capture_id) + RESULT_EXTENSIONS["sampling"]
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"写入采样结果失败 {path}: {str(e)}")
+
+    def _sample_lines(self) -> List[str]:
+        """调用方持有 self.lock"""
+        return [f"{stack} {n}\n" for stack, n in self._samples.items()]
+
+    def _write_meta(self, capture: Dict[str, Any], done: bool):
+        meta = {
+            "id": capture["id"],
+            "mode": capture["mode"],
+            "pid": os.getpid(),
+            "requests": self.handled,
+            "samples": self._sample_count,
+            "done": done,
+            "updated": time.time(),
+        }
+        try:
+            os.makedirs(get_profile_dir(), exist_ok=True)
+            _write_json_atomic(self._stem(capture["id"]) + ".json", meta)
+        except OSError as e:
+            logging.warning(f"写入剖析记录失败: {str(e)}")
+
+    def _sample_loop(self, capture: Dict[str, Any], stop: threading.Event):
+        """采样线程；控制文件被删除或替换时即使没有新请求也能及时结束"""
+        own = threading.get_ident()
+        last_dump = time.monotonic()
+        while not stop.wait(capture["interval"]):
+            with self.lock:
+                threads = [ident for ident in self._threads if ident != own]
+            frames = sys._current_frames()
+            stacks = []
+            for ident in threads:
+                frame = frames.get(ident)
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if names:
+                    stacks.append(";".join(reversed(names)))
+            del frames
+            with self.lock:
+                if self.capture is not capture:
+                    return
+                self._samples.update(stacks)
+                self._sample_count += len(stacks)
+
+            if time.time() >= capture["deadline"]:
+                self._finish(capture["id"])
+                return
+            if time.monotonic() - last_dump >= CONTROL_CHECK_INTERVAL:
+                last_dump = time.monotonic()
+                control = read_control()
+                if control is None or control["id"] != capture["id"]:
+                    self._finish(capture["id"])
+                    return
+                with self.lock:
+                    if self.capture is not capture:
+                        return
+                    lines = self._sample_lines()
+                self._write_samples(capture["id"], lines)
+                self._write_meta(capture, done=False)
+
+    def _finish(self, capture_id: str):
+        """结束当前采集并写出结果，同一采集只执行一次"""
+        with self.lock:
+            capture = self.capture
+            if capture is None or capture["id"] != capture_id:
+                return
+            self.capture = None
+            self._finished.add(capture_id)
+            self._stop.set()
+            if capture["mode"] == "cprofile" and self._stats is not None:
+                self._dump_stats(capture_id)
+            lines = self._sample_lines()
+        if capture["mode"] == "sampling":
+            self._write_samples(capture_id, lines)
+        self._write_meta(capture, done=True)
+        logging.info(f"剖析采集结束: {capture_id}，处理请求 {self.handled} 个")
+
+
+PROFILER = Profiler()
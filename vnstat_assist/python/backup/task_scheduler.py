@@ -1,23 +1,93 @@
+import time
+from contextlib import contextmanager
+
 from apscheduler.schedulers.blocking import BlockingScheduler
-from vnstat_backup import main, backup_last_month, organize_backup_files, JSON_DIR
+from backup_format import BACKUP_ROWS_WRITTEN
+from backup_retention import run_retention
+from capture_journal import get_capture_interval, run_capture
+from metrics import REGISTRY, Counter, Gauge, Histogram, clear_snapshots
+from vnstat_backup import (
+    main,
+    backup_last_month,
+    organize_all_backups,
+    verify_backups,
+)
+
+JOB_RUNS = Counter("vna_job_runs_total", "定时任务执行次数，outcome 为 success / failure")
+JOB_SECONDS = Histogram(
+    "vna_job_duration_seconds",
+    "定时任务耗时",
+    (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+JOB_ROWS_WRITTEN = Counter("vna_job_rows_written_total", "定时任务写入备份的条目数")
+JOB_LAST_SUCCESS = Gauge(
+    "vna_job_last_success_timestamp_seconds", "定时任务最近一次成功完成的时间"
+)
+
+
+@contextmanager
+def track_job(job: str):
+    """记录任务耗时、写入条目数及结果，结束后写出本进程的指标快照"""
+    start = time.perf_counter()
+    rows_before = BACKUP_ROWS_WRITTEN.total()
+    outcome = "failure"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - start, job=job)
+        JOB_ROWS_WRITTEN.inc(BACKUP_ROWS_WRITTEN.total() - rows_before, job=job)
+        JOB_RUNS.inc(job=job, outcome=outcome)
+        if outcome == "success":
+            JOB_LAST_SUCCESS.set(time.time(), job=job)
+        REGISTRY.write_snapshot()
 
 
 def daily_job():
     try:
-        main()
+        with track_job("daily"):
+            main()
     except Exception as e:
         print(f"天备份任务执行失败: {e}")
 
 
+def retention_job():
+    try:
+        with track_job("retention"):
+            run_retention()
+    except Exception as e:
+        print(f"备份保留策略执行失败: {e}")
+
+
+def capture_job():
+    try:
+        with track_job("capture"):
+            run_capture()
+    except Exception as e:
+        print(f"采集任务执行失败: {e}")
+
+
 def monthly_job():
     try:
-        backup_last_month()
+        with track_job("monthly"):
+            backup_last_month()
     except Exception as e:
         print(f"月备份任务执行失败: {e}")
 
 
 if __name__ == "__main__":
-    organize_backup_files(JSON_DIR)
+    # 定时任务进程的指标写入共享目录，由 API 的 /metrics 合并输出
+    clear_snapshots("scheduler")
+    REGISTRY.role = "scheduler"
+    organize_all_backups()
+    try:
+        verify_backups()
+    except Exception as e:
+        print(f"备份校验失败: {e}")
+    capture_interval = get_capture_interval()
+    # 先压实采集日志，已由日志补齐的天备份不再重复写入
+    if capture_interval > 0:
+        capture_job()
     daily_job()
     monthly_job()
     scheduler = BlockingScheduler()
@@ -25,4 +95,13 @@ if __name__ == "__main__":
     scheduler.add_job(
         monthly_job, "cron", day=1, hour=0, minute=30, timezone="Asia/Shanghai"
     )
+    scheduler.add_job(retention_job, "cron", hour=3, minute=0, timezone="Asia/Shanghai")
+    if capture_interval > 0:
+        scheduler.add_job(
+            capture_job,
+            "interval",
+            minutes=capture_interval,
+            max_instances=1,
+            coalesce=True,
+        )
     scheduler.start()
@@ -0,0 +1,321 @@
+import bisect
+from array import array
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+TIME_KEYS = ["fiveminute", "hour", "day", "month", "year", "top"]
+
+# 各时间维度条目日期的有效精度：(年, 月, 日, 时, 分) 中前N项
+GRANULARITY_PRECISION = {
+    "fiveminute": 5,
+    "hour": 4,
+    "day": 3,
+    "top": 3,
+    "month": 2,
+    "year": 1,
+}
+
+RANGE_MIN = (0, 1, 1, 0, 0)
+RANGE_MAX = (9999, 12, 31, 23, 59)
+
+# (年, 月, 日, 时, 分) 打包为单个整数时各字段的权重
+_KEY_WEIGHTS = (100000000, 1000000, 10000, 100, 1)
+
+
+def entry_date_key(entry: Dict[str, Any], precision: int) -> Tuple[int, ...]:
+    entry_date = entry.get("date", {})
+    entry_time = entry.get("time", {})
+    key = (
+        entry_date.get("year", 0),
+        entry_date.get("month", 0),
+        entry_date.get("day", 0),
+        entry_time.get("hour", 0),
+        entry_time.get("minute", 0),
+    )
+    return key[:precision]
+
+
+def pack_date_key(key: Tuple[int, ...]) -> int:
+    """将日期元组打包为可排序整数，缺省字段视为0"""
+    return sum(v * w for v, w in zip(key, _KEY_WEIGHTS))
+
+
+def unpack_date_key(key: int) -> Tuple[int, ...]:
+    """pack_date_key 的逆运算，返回完整的 (年, 月, 日, 时, 分)"""
+    parts = []
+    for weight in _KEY_WEIGHTS:
+        value, key = divmod(key, weight)
+        parts.append(value)
+    return tuple(parts)
+
+
+# 聚合桶 -> 使用的源数据时间维度
+BUCKET_SOURCE = {
+    "hour": "hour",
+    "day": "day",
+    "week": "day",
+    "month": "month",
+}
+
+
+def bucket_key(key: Tuple[int, ...], bucket: str) -> Tuple[int, ...]:
+    """将 (年, 月, 日, 时, 分) 归入聚合桶，周以周一的日期表示"""
+    if bucket == "hour":
+        return key[:4]
+    if bucket == "day":
+        return key[:3]
+    if bucket == "week":
+        day = date(key[0], key[1], key[2])
+        monday = day - timedelta(days=day.weekday())
+        return (monday.year, monday.month, monday.day)
+    return key[:2]
+
+
+def aggregate_rows(rows, bucket: str) -> Dict[str, Any]:
+    """将按日期升序的 (date_key, rx, tx) 行聚合为桶序列及合计"""
+    buckets: Dict[Tuple[int, ...], List[int]] = {}
+    total_rx = 0
+    total_tx = 0
+
+    for key, rx, tx in rows:
+        slot = buckets.setdefault(bucket_key(unpack_date_key(key), bucket), [0, 0])
+        slot[0] += rx
+        slot[1] += tx
+        total_rx += rx
+        total_tx += tx
+
+    series = []
+    for key in sorted(buckets):
+        rx, tx = buckets[key]
+        entry: Dict[str, Any] = {"date": dict(zip(("year", "month", "day"), key))}
+        if bucket == "hour":
+            entry["time"] = {"hour": key[3], "minute": 0}
+        entry["rx"] = rx
+        entry["tx"] = tx
+        series.append(entry)
+
+    return {"series": series, "total": {"rx": total_rx, "tx": total_tx}}
+
+
+class SeriesIndex:
+    """单个网卡单个时间维度的有序索引
+
+    keys/timestamps/rx/tx 为按日期排序的紧凑数组，entries 保留原始条目用于输出
+    """
+
+    def __init__(self, time_key: str, entries: List[Dict[str, Any]]):
+        self.time_key = time_key
+        self.precision = GRANULARITY_PRECISION[time_key]
+
+        keyed = sorted(
+            (pack_date_key(entry_date_key(entry, self.precision)), i)
+            for i, entry in enumerate(entries)
+        )
+        self.keys = array("q", (k for k, _ in keyed))
+        self.positions = array("q", (i for _, i in keyed))
+        # 原始顺序不是时间顺序时（如 top 按流量排序），输出需按原始位置还原
+        self.preserve_order = any(
+            self.positions[i] > self.positions[i + 1]
+            for i in range(len(self.positions) - 1)
+        )
+        self.entries = [entries[i] for i in self.positions]
+        self.timestamps = array("q", (e.get("timestamp", 0) for e in self.entries))
+        self.rx = array("q", (e.get("rx", 0) for e in self.entries))
+        self.tx = array("q", (e.get("tx", 0) for e in self.entries))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def bounds(self, start: Tuple[int, ...], end: Tuple[int, ...]) -> Tuple[int, int]:
+        """返回 [start, end] 在索引中的下标区间 [lo, hi)"""
+        lower = pack_date_key(start[: self.precision])
+        upper = pack_date_key(end[: self.precision])
+        lo = bisect.bisect_left(self.keys, lower)
+        hi = bisect.bisect_right(self.keys, upper, lo)
+        return lo, hi
+
+    def query(
+        self, start: Tuple[int, ...], end: Tuple[int, ...]
+    ) -> List[Dict[str, Any]]:
+        lo, hi = self.bounds(start, end)
+        if not self.preserve_order:
+            return self.entries[lo:hi]
+        order = sorted(range(lo, hi), key=lambda i: self.positions[i])
+        return [self.entries[i] for i in order]
+
+    def totals(self, start: Tuple[int, ...], end: Tuple[int, ...]) -> Tuple[int, int]:
+        lo, hi = self.bounds(start, end)
+        return sum(self.rx[lo:hi]), sum(self.tx[lo:hi])
+
+    def rows(self, start: Tuple[int, ...], end: Tuple[int, ...]):
+        """按日期升序返回范围内的 (date_key, rx, tx)"""
+        lo, hi = self.bounds(start, end)
+        return zip(self.keys[lo:hi], self.rx[lo:hi], self.tx[lo:hi])
+
+
+class TrafficStore:
+    """vnstat 快照的按网卡、按时间维度索引，区间提取为 O(log n + k)"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.interfaces: Dict[str, Dict[str, Any]] = {}
+        self.series: Dict[str, Dict[str, SeriesIndex]] = {}
+        self.totals: Dict[str, Any] = {}
+
+        for interface in data.get("interfaces", []):
+            name = interface.get("name", "unknown")
+            traffic = interface.get("traffic", {})
+            self.interfaces[name] = {
+                k: v for k, v in interface.items() if k != "traffic"
+            }
+            self.series[name] = {
+                time_key: SeriesIndex(time_key, traffic[time_key])
+                for time_key in TIME_KEYS
+                if time_key in traffic
+            }
+            self.totals[name] = traffic.get("total")
+
+    def interface_names(self) -> List[str]:
+        return list(self.interfaces)
+
+    def get_series(self, iface_name: str, time_key: str) -> Optional[SeriesIndex]:
+        return self.series.get(iface_name, {}).get(time_key)
+
+    def query_interface_range(
+        self,
+        iface_name: str,
+        time_key: str,
+        start: Tuple[int, ...],
+        end: Tuple[int, ...],
+    ) -> Optional[Dict[str, Any]]:
+        """返回单个网卡单个时间维度在范围内的条目及 rx/tx 合计，网卡不存在时返回None"""
+        if iface_name not in self.series:
+            return None
+
+        index = self.get_series(iface_name, time_key)
+        if index is None:
+            return {"entries": [], "total": {"rx": 0, "tx": 0}}
+
+        rx, tx = index.totals(start, end)
+        return {"entries": index.query(start, end), "total": {"rx": rx, "tx": tx}}
+
+    def filter_range_data(
+        self, start: Tuple[int, ...], end: Tuple[int, ...]
+    ) -> Dict[str, Any]:
+        filtered = {"interfaces": []}
+
+        for name, meta in self.interfaces.items():
+            new_traffic = {}
+            for time_key, index in self.series[name].items():
+                entries = index.query(start, end)
+                if entries:
+                    new_traffic[time_key] = entries
+
+            if new_traffic:
+                new_interface = dict(meta)
+                new_interface["traffic"] = new_traffic
+                filtered["interfaces"].append(new_interface)
+
+        return filtered
+
+    def partition_by_day(
+        self, days: List[Tuple[int, int, int]]
+    ) -> Dict[Tuple[int, int, int], Dict[str, Any]]:
+        """单次遍历将快照切分为多天的文档，结果与逐天调用 filter_range_data 相同
+
+        天及更细维度的条目按所属日期归入对应天，月/年条目归入该月/年内的所有目标天
+        """
+        wanted = {pack_date_key(day): day for day in days}
+        by_day = {packed: (packed,) for packed in wanted}
+        by_month: Dict[int, List[int]] = {}
+        by_year: Dict[int, List[int]] = {}
+        for packed in wanted:
+            by_month.setdefault(packed - packed % _KEY_WEIGHTS[1], []).append(packed)
+            by_year.setdefault(packed - packed % _KEY_WEIGHTS[0], []).append(packed)
+
+        parts = {packed: {"interfaces": []} for packed in wanted}
+        for name, meta in self.interfaces.items():
+            traffic_by_day: Dict[int, Dict[str, List[Dict[str, Any]]]] = {
+                packed: {} for packed in wanted
+            }
+            for time_key, index in self.series[name].items():
+                if index.precision >= 3:
+                    targets = by_day
+                    step = _KEY_WEIGHTS[2]
+                elif index.precision == 2:
+                    targets = by_month
+                    step = _KEY_WEIGHTS[1]
+                else:
+                    targets = by_year
+                    step = _KEY_WEIGHTS[0]
+
+                order = range(len(index))
+                if index.preserve_order:
+                    order = sorted(order, key=index.positions.__getitem__)
+                for i in order:
+                    key = index.keys[i]
+                    for packed in targets.get(key - key % step, ()):
+                        traffic_by_day[packed].setdefault(time_key, []).append(
+                            index.entries[i]
+                        )
+
+            for packed, traffic in traffic_by_day.items():
+                if traffic:
+                    new_interface = dict(meta)
+                    new_interface["traffic"] = traffic
+                    parts[packed]["interfaces"].append(new_interface)
+
+        return {wanted[packed]: doc for packed, doc in parts.items()}
+
+
+# 实时推送比较的时间维度，top 为排行榜，不做增量
+LIVE_TIME_KEYS = ("fiveminute", "hour", "day", "month", "year")
+
+
+def diff_series(old: Optional[SeriesIndex], new: SeriesIndex) -> List[Dict[str, Any]]:
+    """返回 new 中新增或变化的条目（按日期升序）
+
+    vnstat 只会更新最近的条目，因此从末尾向前比较，遇到第一条未变化的条目即停止
+    """
+    changed = []
+    for i in range(len(new) - 1, -1, -1):
+        entry = new.entries[i]
+        if old is not None:
+            j = bisect.bisect_left(old.keys, new.keys[i])
+            if j < len(old) and old.keys[j] == new.keys[i] and old.entries[j] == entry:
+                break
+        changed.append(entry)
+    changed.reverse()
+    return changed
+
+
+def diff_stores(
+    old: "TrafficStore", new: "TrafficStore"
+) -> Optional[List[Dict[str, Any]]]:
+    """比较两份快照，返回各网卡变化的条目、合计及更新时间；网卡集合变化时返回None"""
+    if old.interface_names() != new.interface_names():
+        return None
+
+    interfaces = []
+    for name in new.interface_names():
+        traffic = {}
+        for time_key in LIVE_TIME_KEYS:
+            index = new.get_series(name, time_key)
+            if index is None:
+                continue
+            changed = diff_series(old.get_series(name, time_key), index)
+            if changed:
+                traffic[time_key] = changed
+
+        total_changed = new.totals[name] != old.totals[name]
+        if not traffic and not total_changed:
+            continue
+
+        delta: Dict[str, Any] = {"name": name}
+        if "updated" in new.interfaces[name]:
+            delta["updated"] = new.interfaces[name]["updated"]
+        if traffic:
+            delta["traffic"] = traffic
+        if total_changed:
+            delta["total"] = new.totals[name]
+        interfaces.append(delta)
+    return interfaces
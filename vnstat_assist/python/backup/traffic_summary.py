@@ -0,0 +1,154 @@
+import os
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from .traffic_store import (
+        RANGE_MAX,
+        RANGE_MIN,
+        SeriesIndex,
+        TrafficStore,
+        unpack_date_key,
+    )
+except ImportError:
+    from traffic_store import (
+        RANGE_MAX,
+        RANGE_MIN,
+        SeriesIndex,
+        TrafficStore,
+        unpack_date_key,
+    )
+
+# 各时间维度单个条目覆盖的秒数，用于将字节数换算为速率
+SERIES_SECONDS = {"fiveminute": 300, "hour": 3600}
+PERCENTILE = 95
+
+
+def get_summary_top_n() -> int:
+    return int(os.getenv("VNA_SUMMARY_TOP_N", 5))
+
+
+def _date_fields(packed: int, precision: int) -> Dict[str, Any]:
+    key = unpack_date_key(packed)
+    fields: Dict[str, Any] = {"date": dict(zip(("year", "month", "day"), key[:3]))}
+    if precision >= 4:
+        fields["time"] = {"hour": key[3], "minute": key[4]}
+    return fields
+
+
+def percentile(values: List[int], pct: float) -> int:
+    """最近秩百分位，values 为空时返回0"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _peak_rate(
+    index: Optional[SeriesIndex], lo: int, hi: int
+) -> Optional[Dict[str, Any]]:
+    """区间内 rx、tx 各自的最高速率（bit/s）及出现时间"""
+    if index is None or lo >= hi:
+        return None
+    seconds = SERIES_SECONDS[index.time_key]
+    result = {}
+    for direction, values in (("rx", index.rx), ("tx", index.tx)):
+        i = max(range(lo, hi), key=values.__getitem__)
+        result[direction] = {
+            "bps": values[i] * 8 // seconds,
+            **_date_fields(index.keys[i], index.precision),
+        }
+    return result
+
+
+def _percentile_rate(
+    index: Optional[SeriesIndex], lo: int, hi: int
+) -> Dict[str, Any]:
+    """五分钟速率的 P95（bit/s），samples 为参与计算的条目数"""
+    if index is None or lo >= hi:
+        return {"rx_bps": 0, "tx_bps": 0, "samples": 0}
+    seconds = SERIES_SECONDS[index.time_key]
+    return {
+        "rx_bps": percentile(index.rx[lo:hi], PERCENTILE) * 8 // seconds,
+        "tx_bps": percentile(index.tx[lo:hi], PERCENTILE) * 8 // seconds,
+        "samples": hi - lo,
+    }
+
+
+def summarize_series(
+    series: Dict[str, SeriesIndex],
+    start: Tuple[int, ...] = RANGE_MIN,
+    end: Tuple[int, ...] = RANGE_MAX,
+    top_n: Optional[int] = None,
+) -> Dict[str, Any]:
+    """单个网卡在 [start, end] 内的统计摘要
+
+    - rx/tx 合计取区间内覆盖最完整的维度（天 > 小时 > 五分钟）
+    - peak_fiveminute / peak_hour：最高速率及出现时间
+    - p95：五分钟速率的95百分位
+    - top_days：流量最高的若干天
+    - busiest_hours：按一天中的小时累计流量最高的若干小时
+    """
+    top_n = get_summary_top_n() if top_n is None else top_n
+    bounds = {
+        time_key: index.bounds(start, end) for time_key, index in series.items()
+    }
+
+    rx = tx = 0
+    for time_key in ("day", "hour", "fiveminute"):
+        if time_key in series and bounds[time_key][0] < bounds[time_key][1]:
+            rx, tx = series[time_key].totals(start, end)
+            break
+
+    summary: Dict[str, Any] = {"rx": rx, "tx": tx}
+    fiveminute = series.get("fiveminute")
+    hour = series.get("hour")
+    day = series.get("day")
+    fiveminute_bounds = bounds.get("fiveminute", (0, 0))
+    summary["peak_fiveminute"] = _peak_rate(fiveminute, *fiveminute_bounds)
+    summary["peak_hour"] = _peak_rate(hour, *bounds.get("hour", (0, 0)))
+    summary["p95"] = _percentile_rate(fiveminute, *fiveminute_bounds)
+
+    top_days = []
+    if day is not None:
+        lo, hi = bounds["day"]
+        ranked = sorted(
+            range(lo, hi), key=lambda i: day.rx[i] + day.tx[i], reverse=True
+        )
+        for i in ranked[:top_n]:
+            top_days.append(
+                {**_date_fields(day.keys[i], 3), "rx": day.rx[i], "tx": day.tx[i]}
+            )
+    summary["top_days"] = top_days
+
+    by_hour: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+    if hour is not None:
+        lo, hi = bounds["hour"]
+        for i in range(lo, hi):
+            slot = by_hour[unpack_date_key(hour.keys[i])[3]]
+            slot[0] += hour.rx[i]
+            slot[1] += hour.tx[i]
+    busiest = sorted(by_hour.items(), key=lambda item: sum(item[1]), reverse=True)
+    summary["busiest_hours"] = [
+        {"hour": h, "rx": values[0], "tx": values[1]} for h, values in busiest[:top_n]
+    ]
+    return summary
+
+
+def summarize_store(
+    store: TrafficStore,
+    start: Tuple[int, ...] = RANGE_MIN,
+    end: Tuple[int, ...] = RANGE_MAX,
+    top_n: Optional[int] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """网卡名 -> 区间摘要"""
+    return {
+        name: summarize_series(store.series[name], start, end, top_n)
+        for name in store.interface_names()
+    }
+
+
+def summarize_data(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """整份备份文档的摘要，写入备份时记录到 manifest"""
+    return summarize_store(TrafficStore(data))
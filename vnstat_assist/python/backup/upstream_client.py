@@ -0,0 +1,332 @@
+import json
+import logging
+import os
+import random
+import re
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+try:
+    from .metrics import BYTES_BUCKETS, Counter, Histogram
+    from .profiling import timed
+except ImportError:
+    from metrics import BYTES_BUCKETS, Counter, Histogram
+    from profiling import timed
+
+# 不校验证书时每次请求都会产生警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 仅配置 VNSTAT_API_URL 时的上游名称，其备份沿用原有目录
+DEFAULT_HOST = "default"
+# 上游名称用作备份子目录名
+HOST_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+UPSTREAM_FETCH_SECONDS = Histogram(
+    "vna_upstream_fetch_duration_seconds",
+    "上游拉取耗时（含重试），outcome 为 success / failure",
+)
+UPSTREAM_FAILURES = Counter(
+    "vna_upstream_failures_total",
+    "上游请求失败次数，reason 为 network / http / invalid_json / circuit_open",
+)
+UPSTREAM_RETRIES = Counter("vna_upstream_retries_total", "上游请求重试次数")
+UPSTREAM_RESPONSE_BYTES = Histogram(
+    "vna_upstream_response_bytes", "上游响应体大小（字节）", BYTES_BUCKETS
+)
+
+
+class UpstreamError(Exception):
+    """上游 vnstat 接口请求失败（网络错误、超时、5xx 或无效JSON）"""
+
+
+class CircuitOpenError(UpstreamError):
+    """熔断器打开期间拒绝请求，retry_after 为距下次试探的秒数"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开，reset_timeout 秒后放行一次试探请求（半开），成功则关闭"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def allow(self):
+        """不允许请求时抛出 CircuitOpenError"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError("上游熔断中，暂停请求", max(remaining, 0.0))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logging.warning(f"上游连续失败 {self._failures} 次，熔断打开")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing:
+                return "half-open"
+            if time.monotonic() >= self._opened_at + self.reset_timeout:
+                return "half-open"
+            return "open"
+
+
+class _SSLContextAdapter(HTTPAdapter):
+    """所有连接复用同一个 SSL 上下文"""
+
+    def __init__(self, ssl_context: ssl.SSLContext, **kwargs):
+        self._ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self._ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+
+class UpstreamClient:
+    """vnstat json.cgi 客户端
+
+    - 所有线程共享一个 Session 及连接池（urllib3 连接池线程安全），后台刷新线程、
+      fetch_all 的临时线程同样复用已建立的长连接，不必每次重新握手
+    - 连接/读取超时分别配置
+    - 网络错误、超时及 5xx 按指数退避加随机抖动重试
+    - 连续失败后熔断，避免慢上游占满工作线程
+    """
+
+    def __init__(
+        self,
+        url: str,
+        connect_timeout: float = 3,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.5,
+        backoff_max: float = 5,
+        breaker: Optional[CircuitBreaker] = None,
+        pool_size: int = 4,
+    ):
+        self.url = url
+        # 指标标签只取主机和端口，不暴露地址中的认证信息及路径
+        self.label = urlsplit(url).netloc.rpartition("@")[2] or url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(5, 30)
+        # vnstat 常为自签名证书，与原实现一致不校验证书
+        self._ssl_context = ssl._create_unverified_context()
+        self._pool_size = pool_size
+        self._session_lock = threading.Lock()
+        self._shared_session: Optional[requests.Session] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def _session(self) -> requests.Session:
+        session = self._shared_session
+        if session is not None:
+            return session
+        with self._session_lock:
+            if self._shared_session is None:
+                session = requests.Session()
+                session.verify = False
+                pool = {"pool_maxsize": self._pool_size, "max_retries": 0}
+                session.mount(
+                    "https://", _SSLContextAdapter(self._ssl_context, **pool)
+                )
+                session.mount("http://", HTTPAdapter(**pool))
+                self._shared_session = session
+            return self._shared_session
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _request(self) -> bytes:
+        response = self._session().get(self.url, timeout=self.timeout)
+        if response.status_code >= 500:
+            raise requests.HTTPError(
+                f"上游返回 HTTP {response.status_code}", response=response
+            )
+        if response.status_code >= 400:
+            # 4xx 为配置问题，重试无意义
+            raise UpstreamError(f"上游返回 HTTP {response.status_code}")
+        return response.content
+
+    def _fail(self, reason: str):
+        self.breaker.record_failure()
+        self._count("failures")
+        UPSTREAM_FAILURES.inc(upstream=self.label, reason=reason)
+
+    def fetch(self) -> Tuple[bytes, Dict[str, Any]]:
+        """请求上游，返回原始字节和解析后的数据，最终失败时抛出 UpstreamError"""
+        start = time.perf_counter()
+        try:
+            body, data = self._fetch()
+        except CircuitOpenError:
+            UPSTREAM_FAILURES.inc(upstream=self.label, reason="circuit_open")
+            raise
+        except UpstreamError:
+            UPSTREAM_FETCH_SECONDS.observe(
+                time.perf_counter() - start, upstream=self.label, outcome="failure"
+            )
+            raise
+        UPSTREAM_FETCH_SECONDS.observe(
+            time.perf_counter() - start, upstream=self.label, outcome="success"
+        )
+        UPSTREAM_RESPONSE_BYTES.observe(len(body), upstream=self.label)
+        return body, data
+
+    def _fetch(self) -> Tuple[bytes, Dict[str, Any]]:
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            self._count("requests")
+            try:
+                with timed("upstream"):
+                    body = self._request()
+            except requests.RequestException as e:
+                self._fail("http" if isinstance(e, requests.HTTPError) else "network")
+                if attempt >= self.retries:
+                    raise UpstreamError(f"上游请求失败: {str(e)}") from e
+                delay = min(self.backoff_max, self.backoff * 2**attempt)
+                delay *= random.uniform(0.5, 1.0)
+                logging.warning(
+                    f"上游请求失败，{delay:.2f}s 后重试（{attempt + 1}/{self.retries}）: {str(e)}"
+                )
+                self._count("retries")
+                UPSTREAM_RETRIES.inc(upstream=self.label)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except UpstreamError:
+                self._fail("http")
+                raise
+
+            try:
+                with timed("parse"):
+                    data = json.loads(body.decode("utf-8"))
+            except ValueError as e:
+                self._fail("invalid_json")
+                raise UpstreamError("上游返回无效的JSON数据") from e
+            self.breaker.record_success()
+            return body, data
+
+    def fetch_json(self) -> Dict[str, Any]:
+        return self.fetch()[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["breaker"] = self.breaker.state
+        return result
+
+
+_clients: Dict[str, UpstreamClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream_client(url: str) -> UpstreamClient:
+    """按 URL 返回进程内共享的客户端，参数从 VNA_UPSTREAM_* 环境变量读取"""
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = UpstreamClient(
+                url,
+                connect_timeout=float(os.getenv("VNA_UPSTREAM_CONNECT_TIMEOUT", 3)),
+                read_timeout=float(os.getenv("VNA_UPSTREAM_READ_TIMEOUT", 10)),
+                retries=int(os.getenv("VNA_UPSTREAM_RETRIES", 2)),
+                backoff=float(os.getenv("VNA_UPSTREAM_BACKOFF", 0.5)),
+                breaker=CircuitBreaker(
+                    int(os.getenv("VNA_UPSTREAM_BREAKER_THRESHOLD", 5)),
+                    float(os.getenv("VNA_UPSTREAM_BREAKER_RESET", 30)),
+                ),
+                pool_size=int(os.getenv("VNA_UPSTREAM_POOL_SIZE", 4)),
+            )
+            _clients[url] = client
+        return client
+
+
+def get_upstream_hosts() -> Dict[str, str]:
+    """读取上游列表，返回 名称 -> URL（保持配置顺序）
+
+    VNSTAT_HOSTS 为逗号分隔的 "名称=URL" 列表；未配置时使用 VNSTAT_API_URL，名称为 default
+    """
+    value = os.getenv("VNSTAT_HOSTS", "").strip()
+    if not value:
+        url = os.getenv("VNSTAT_API_URL", "")
+        if not url.startswith(("http://", "https://")):
+            raise ValueError("VNSTAT_API_URL 必须包含协议（如 http:// 或 https://）")
+        return {DEFAULT_HOST: url}
+
+    hosts: Dict[str, str] = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition("=")
+        name = name.strip()
+        url = url.strip()
+        if not sep or not HOST_NAME_PATTERN.match(name) or name in (".", ".."):
+            raise ValueError(f"VNSTAT_HOSTS 格式无效: {item}，应为 名称=URL")
+        if name in hosts:
+            raise ValueError(f"VNSTAT_HOSTS 中上游名称重复: {name}")
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"上游 {name} 的地址必须包含协议（如 http:// 或 https://）")
+        hosts[name] = url
+    if not hosts:
+        raise ValueError("VNSTAT_HOSTS 未包含任何上游")
+    return hosts
+
+
+def get_fetch_concurrency() -> int:
+    return int(os.getenv("VNA_UPSTREAM_CONCURRENCY", 8))
+
+
+def fetch_all(
+    hosts: Dict[str, str]
+) -> Dict[str, Union[Dict[str, Any], UpstreamError]]:
+    """并发拉取所有上游，返回 名称 -> 数据，失败的上游对应其 UpstreamError"""
+    results: Dict[str, Union[Dict[str, Any], UpstreamError]] = {}
+    workers = max(1, min(len(hosts), get_fetch_concurrency()))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            name: executor.submit(get_upstream_client(url).fetch_json)
+            for name, url in hosts.items()
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except UpstreamError as e:
+                results[name] = e
+    return results
@@ -1,16 +1,70 @@
 import os
 import sys
-import json
 import logging
 import argparse
 import re
 import calendar
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-import requests
+from typing import Dict, Any, List, Optional, Tuple
 from dateutil import tz
 
+try:
+    from .backup_format import (
+        find_backup,
+        read_backup,
+        verify_backup_tree,
+        write_backup,
+    )
+    from .backup_catalog import load_catalog, mark_organized, update_catalog
+    from .backup_manifest import backup_lock
+    from .history_db import HistoryDB, get_history_db_path
+    from .profiling import timed
+    from .traffic_store import (
+        RANGE_MAX,
+        RANGE_MIN,
+        TrafficStore,
+        entry_date_key,
+    )
+    from .upstream_client import (
+        DEFAULT_HOST,
+        UpstreamError,
+        fetch_all,
+        get_upstream_hosts,
+    )
+except ImportError:
+    from backup_format import (
+        find_backup,
+        read_backup,
+        verify_backup_tree,
+        write_backup,
+    )
+    from backup_catalog import load_catalog, mark_organized, update_catalog
+    from backup_manifest import backup_lock
+    from history_db import HistoryDB, get_history_db_path
+    from profiling import timed
+    from traffic_store import (
+        RANGE_MAX,
+        RANGE_MIN,
+        TrafficStore,
+        entry_date_key,
+    )
+    from upstream_client import (
+        DEFAULT_HOST,
+        UpstreamError,
+        fetch_all,
+        get_upstream_hosts,
+    )
+
 JSON_DIR = "/app/backups/json"
+# 多上游时，除 default 外每个上游的备份位于 hosts/<名称>/json 下
+HOSTS_DIR = "/app/backups/hosts"
+
+
+def get_host_backup_dir(host: str = DEFAULT_HOST) -> str:
+    if host == DEFAULT_HOST:
+        return JSON_DIR
+    return os.path.join(HOSTS_DIR, host, "json")
 
 
 def get_month_dir(base_dir: str, year: int, month: int) -> str:
@@ -18,6 +72,22 @@ def get_month_dir(base_dir: str, year: int, month: int) -> str:
     return os.path.join(base_dir, month_str)
 
 
+def get_day_backup_base(base_dir: str, year: int, month: int, day: int) -> str:
+    """天备份文件路径（不含扩展名，实际文件为 .json 或 .vnb）"""
+    month_dir = get_month_dir(base_dir, year, month)
+    return os.path.join(month_dir, f"vnstat_{year}{month:02d}{day:02d}")
+
+
+def get_month_backup_base(base_dir: str, year: int, month: int) -> str:
+    month_dir = get_month_dir(base_dir, year, month)
+    return os.path.join(month_dir, f"vnstat_month_{year}{month:02d}")
+
+
+def get_rollup_base(base_dir: str, year: int, month: int) -> str:
+    month_dir = get_month_dir(base_dir, year, month)
+    return os.path.join(month_dir, f"vnstat_rollup_{year}{month:02d}")
+
+
 def ensure_month_dir(base_dir: str, year: int, month: int) -> str:
     d = get_month_dir(base_dir, year, month)
     os.makedirs(d, exist_ok=True)
@@ -53,336 +123,447 @@ def parse_args() -> int:
     return args.days
 
 
-def fetch_api_data(api_url: str) -> Dict[str, Any]:
+def parse_range_bound(value: str, upper: bool = False) -> Tuple[int, ...]:
+    """解析 YYYY[MM[DD[HH[MM]]]] 格式的范围边界，缺省部分按起止补齐
+
+    按实际日历校验（如 20230230 无效），上界缺省日期时补为当月最后一天
+    """
+    if not value.isdigit() or len(value) not in (4, 6, 8, 10, 12):
+        raise ValueError(f"无效的时间格式: {value}，应为 YYYY[MM[DD[HH[MM]]]]")
+
+    parts = [int(value[:4])] + [
+        int(value[i : i + 2]) for i in range(4, len(value), 2)
+    ]
+    fill = RANGE_MAX if upper else RANGE_MIN
+    bound = tuple(parts) + fill[len(parts) :]
+    if upper and len(parts) < 3 and 1 <= bound[1] <= 12 and bound[0] >= 1:
+        bound = bound[:2] + (calendar.monthrange(bound[0], bound[1])[1],) + bound[3:]
     try:
-        response = requests.get(api_url, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"API请求失败: {str(e)}")
-        sys.exit(3)
-    except json.JSONDecodeError:
-        logging.error("API返回无效的JSON数据")
-        sys.exit(4)
+        datetime(*bound)
+    except ValueError:
+        raise ValueError(f"无效的时间: {value}") from None
+    return bound
 
 
-def filter_data(data: Dict[str, Any], target_date: datetime) -> Dict[str, Any]:
-    filtered = {"interfaces": []}
+def day_bounds(target_date: datetime) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    day = (target_date.year, target_date.month, target_date.day)
+    return day + (0, 0), day + (23, 59)
 
-    target_year = target_date.year
-    target_month = target_date.month
-    target_day = target_date.day
 
-    for interface in data.get("interfaces", []):
-        traffic = interface.get("traffic", {})
-        new_traffic = {}
+def month_bounds(
+    target_year: int, target_month: int
+) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    month = (target_year, target_month)
+    return month + (1, 0, 0), month + (31, 23, 59)
 
-        for time_key in ["fiveminute", "hour", "day", "month", "year", "top"]:
-            if time_key not in traffic:
-                continue
 
-            entries = []
-            for entry in traffic[time_key]:
-                entry_date = entry.get("date", {})
-
-                if time_key in ["fiveminute", "hour", "top"]:
-                    if (
-                        entry_date.get("year") == target_year
-                        and entry_date.get("month") == target_month
-                        and entry_date.get("day") == target_day
-                    ):
-                        entries.append(entry)
-                elif time_key == "day":
-                    if (
-                        entry_date.get("year") == target_year
-                        and entry_date.get("month") == target_month
-                        and entry_date.get("day") == target_day
-                    ):
-                        entries.append(entry)
-                elif time_key == "month":
-                    if (
-                        entry_date.get("year") == target_year
-                        and entry_date.get("month") == target_month
-                    ):
-                        entries.append(entry)
-                elif time_key == "year":
-                    if entry_date.get("year") == target_year:
-                        entries.append(entry)
-
-            if entries:
-                new_traffic[time_key] = entries
-
-        if new_traffic:
-            new_interface = {k: v for k, v in interface.items() if k != "traffic"}
-            new_interface["traffic"] = new_traffic
-            filtered["interfaces"].append(new_interface)
-
-    return filtered
+def filter_data(data: Dict[str, Any], target_date: datetime) -> Dict[str, Any]:
+    return TrafficStore(data).filter_range_data(*day_bounds(target_date))
 
 
 def filter_month_data(
     data: Dict[str, Any], target_year: int, target_month: int
 ) -> Dict[str, Any]:
-    filtered = {"interfaces": []}
-
-    for interface in data.get("interfaces", []):
-        traffic = interface.get("traffic", {})
-        new_traffic = {}
-
-        for time_key in ["fiveminute", "hour", "day", "month", "year", "top"]:
-            if time_key not in traffic:
-                continue
-
-            entries = []
-            for entry in traffic[time_key]:
-                entry_date = entry.get("date", {})
-
-                if time_key in ["fiveminute", "hour", "top"]:
-                    if (
-                        entry_date.get("year") == target_year
-                        and entry_date.get("month") == target_month
-                    ):
-                        entries.append(entry)
-                elif time_key == "day":
-                    if (
-                        entry_date.get("year") == target_year
-                        and entry_date.get("month") == target_month
-                    ):
-                        entries.append(entry)
-                elif time_key == "month":
-                    if (
-                        entry_date.get("year") == target_year
-                        and entry_date.get("month") == target_month
-                    ):
-                        entries.append(entry)
-                elif time_key == "year":
-                    if entry_date.get("year") == target_year:
-                        entries.append(entry)
-
-            if entries:
-                new_traffic[time_key] = entries
-
-        if new_traffic:
-            new_interface = {k: v for k, v in interface.items() if k != "traffic"}
-            new_interface["traffic"] = new_traffic
-            filtered["interfaces"].append(new_interface)
-
-    return filtered
+    return TrafficStore(data).filter_range_data(
+        *month_bounds(target_year, target_month)
+    )
 
 
 def backup_month_data(
-    data: Dict[str, Any], target_year: int, target_month: int, output_dir: str
+    data: Dict[str, Any],
+    target_year: int,
+    target_month: int,
+    output_dir: str,
+    store: Optional[TrafficStore] = None,
+    history: Optional[HistoryDB] = None,
 ) -> bool:
     month_dir = ensure_month_dir(output_dir, target_year, target_month)
-    month_str = f"{target_year}{target_month:02d}"
-    month_file = os.path.join(month_dir, f"vnstat_month_{month_str}.json")
-
-    if os.path.exists(month_file):
-        logging.info(f"月备份文件已存在，跳过: {month_file}")
-        return False
-
-    filtered_data = filter_month_data(data, target_year, target_month)
+    month_base = get_month_backup_base(output_dir, target_year, target_month)
+
+    # 检查与写入在同一把锁内，避免与 API 或另一次任务重复写入
+    with backup_lock(month_dir):
+        existing = find_backup(month_base)
+        if existing:
+            logging.info(f"月备份文件已存在，跳过: {existing}")
+            return False
+
+        if store is None:
+            store = TrafficStore(data)
+        filtered_data = store.filter_range_data(
+            *month_bounds(target_year, target_month)
+        )
 
-    has_day_data = False
-    for interface in filtered_data.get("interfaces", []):
-        if interface.get("traffic", {}).get("day"):
-            has_day_data = True
-            break
+        has_day_data = False
+        for interface in filtered_data.get("interfaces", []):
+            if interface.get("traffic", {}).get("day"):
+                has_day_data = True
+                break
 
-    if not has_day_data:
-        logging.warning(
-            f"API未返回 {target_year}-{target_month:02d} 的天维度数据，跳过月备份"
-        )
-        return False
+        if not has_day_data:
+            logging.warning(
+                f"API未返回 {target_year}-{target_month:02d} 的天维度数据，跳过月备份"
+            )
+            return False
 
-    with open(month_file, "w") as f:
-        json.dump(filtered_data, f, indent=2)
+        month_file = write_backup(month_base, filtered_data)
     logging.info(f"月备份数据已保存: {month_file}")
+    ingest_history(filtered_data, history)
     return True
 
 
+def ingest_history(filtered_data: Dict[str, Any], db: Optional[HistoryDB] = None):
+    """将备份内容写入SQLite历史库，失败只记录日志，不影响文件备份"""
+    try:
+        db = db or HistoryDB(get_history_db_path())
+        rows = db.ingest(filtered_data)
+        logging.info(f"历史库已写入 {rows} 条记录: {db.path}")
+    except Exception as e:
+        logging.warning(f"写入历史库失败: {str(e)}")
+
+
+def apply_day_to_rollup(
+    rollup: Dict[str, Any],
+    day_data: Dict[str, Any],
+    target_year: int,
+    target_month: int,
+) -> Dict[str, Any]:
+    """将一天的备份并入月汇总：按日期去重天条目，并重算月条目
+
+    月条目优先取 vnstat 自身的月统计（当月累计值单调递增，取最大者即最新），
+    从未出现过时由天条目求和生成。生成的月条目 id 为 0（vnstat 的 id 从 1 开始），
+    据此区分两者，汇总中不另存内部状态，可原样作为月数据返回
+    """
+    interface_map = {iface["name"]: iface for iface in rollup["interfaces"]}
+    month_key = (target_year, target_month)
+
+    for interface in day_data.get("interfaces", []):
+        iface_name = interface.get("name", "unknown")
+        iface = interface_map.get(iface_name)
+        if iface is None:
+            iface = {
+                "name": iface_name,
+                "alias": interface.get("alias", ""),
+                "created": interface.get("created"),
+                "updated": interface.get("updated"),
+                "traffic": {"day": [], "month": []},
+            }
+            interface_map[iface_name] = iface
+            rollup["interfaces"].append(iface)
+        # 旧版本写入的内部统计字段
+        iface.pop("rollup", None)
+
+        traffic = interface.get("traffic", {})
+
+        days = {entry_date_key(e, 3): e for e in iface["traffic"]["day"]}
+        for entry in traffic.get("day", []):
+            if entry_date_key(entry, 2) == month_key:
+                days[entry_date_key(entry, 3)] = entry
+        day_entries = [days[key] for key in sorted(days)]
+        iface["traffic"]["day"] = day_entries
+
+        month_entries = [
+            e for e in traffic.get("month", []) if entry_date_key(e, 2) == month_key
+        ]
+        month_entries.extend(e for e in iface["traffic"]["month"] if e.get("id") != 0)
+        if month_entries:
+            latest = max(month_entries, key=lambda e: e.get("rx", 0) + e.get("tx", 0))
+            iface["traffic"]["month"] = [latest]
+            continue
+
+        first_day_ts = None
+        for d in day_entries:
+            if entry_date_key(d, 3) == month_key + (1,):
+                first_day_ts = d.get("timestamp")
+                break
+        if first_day_ts is None and day_entries:
+            first_day_ts = day_entries[0].get("timestamp")
+
+        iface["traffic"]["month"] = [
+            {
+                "id": 0,
+                "date": {"year": target_year, "month": target_month},
+                "timestamp": first_day_ts or 0,
+                "rx": sum(d.get("rx", 0) for d in day_entries),
+                "tx": sum(d.get("tx", 0) for d in day_entries),
+            }
+        ]
+
+    return rollup
+
+
 def merge_day_backups_to_month(
     output_dir: str, target_year: int, target_month: int
 ) -> Optional[Dict[str, Any]]:
+    """读取当月全部天备份重建月汇总，仅用于汇总文件缺失或损坏时修复"""
     days_in_month = calendar.monthrange(target_year, target_month)[1]
-    day_files_data: List[Dict[str, Any]] = []
-
-    month_dir = get_month_dir(output_dir, target_year, target_month)
+    merged: Dict[str, Any] = {"interfaces": []}
+    found = False
 
     for day in range(1, days_in_month + 1):
-        day_str = f"{target_year}{target_month:02d}{day:02d}"
-        day_file = os.path.join(month_dir, f"vnstat_{day_str}.json")
-
-        if os.path.isfile(day_file):
-            try:
-                with open(day_file, "r") as f:
-                    day_data = json.load(f)
-                day_files_data.append(day_data)
-            except (json.JSONDecodeError, Exception) as e:
-                logging.warning(f"读取天备份文件失败 {day_file}: {str(e)}")
+        day_base = get_day_backup_base(output_dir, target_year, target_month, day)
+        try:
+            day_data = read_backup(day_base)
+        except Exception as e:
+            logging.warning(f"读取天备份文件失败 {day_base}: {str(e)}")
+            continue
+        if day_data is not None:
+            with timed("merge"):
+                apply_day_to_rollup(merged, day_data, target_year, target_month)
+            found = True
 
-    if not day_files_data:
+    if not found:
         logging.warning(f"未找到 {target_year}-{target_month:02d} 的任何天备份文件")
         return None
 
-    merged: Dict[str, Any] = {"interfaces": []}
-    interface_map: Dict[str, Dict[str, Any]] = {}
-
-    for day_data in day_files_data:
-        for interface in day_data.get("interfaces", []):
-            iface_name = interface.get("name", "unknown")
-            if iface_name not in interface_map:
-                interface_map[iface_name] = {
-                    "name": iface_name,
-                    "alias": interface.get("alias", ""),
-                    "created": interface.get("created"),
-                    "updated": interface.get("updated"),
-                    "traffic": {
-                        "day": [],
-                        "month": [],
-                    },
-                }
-
-            iface = interface_map[iface_name]
-            traffic = interface.get("traffic", {})
-
-            for entry in traffic.get("day", []):
-                iface["traffic"]["day"].append(entry)
-
-            for entry in traffic.get("month", []):
-                existing = iface["traffic"]["month"]
-                entry_date = entry.get("date", {})
-                is_dup = False
-                for ex in existing:
-                    ex_date = ex.get("date", {})
-                    if ex_date.get("year") == entry_date.get("year") and ex_date.get("month") == entry_date.get("month"):
-                        is_dup = True
-                        break
-                if not is_dup:
-                    iface["traffic"]["month"].append(entry)
-
-    for iface_name, iface_data in interface_map.items():
-        iface_data["traffic"]["day"].sort(key=lambda x: x.get("timestamp", 0))
-
-        if not iface_data["traffic"]["month"]:
-            total_rx = sum(d.get("rx", 0) for d in iface_data["traffic"]["day"])
-            total_tx = sum(d.get("tx", 0) for d in iface_data["traffic"]["day"])
-            first_day_ts = None
-            for d in iface_data["traffic"]["day"]:
-                d_date = d.get("date", {})
-                if (
-                    d_date.get("year") == target_year
-                    and d_date.get("month") == target_month
-                    and d_date.get("day") == 1
-                ):
-                    first_day_ts = d.get("timestamp")
-                    break
-            if first_day_ts is None and iface_data["traffic"]["day"]:
-                first_day_ts = iface_data["traffic"]["day"][0].get("timestamp")
-
-            iface_data["traffic"]["month"] = [
-                {
-                    "id": 0,
-                    "date": {"year": target_year, "month": target_month},
-                    "timestamp": first_day_ts or 0,
-                    "rx": total_rx,
-                    "tx": total_tx,
-                }
-            ]
-
-        merged["interfaces"].append(iface_data)
-
     return merged
 
 
+def load_month_rollup(
+    output_dir: str, target_year: int, target_month: int
+) -> Optional[Dict[str, Any]]:
+    """读取月汇总文件，不存在或损坏时返回None"""
+    rollup_base = get_rollup_base(output_dir, target_year, target_month)
+    try:
+        return read_backup(rollup_base)
+    except Exception as e:
+        logging.warning(f"读取月汇总文件失败 {rollup_base}: {str(e)}")
+        return None
+
+
+def update_month_rollup(
+    output_dir: str, target_year: int, target_month: int, *day_datas: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """天备份写入后增量更新月汇总，可一次合入多天
+
+    汇总缺失时从已有天备份重建（已包含这些天）；读取到写回期间持有月目录锁
+    """
+    month_dir = ensure_month_dir(output_dir, target_year, target_month)
+    with backup_lock(month_dir):
+        rollup = load_month_rollup(output_dir, target_year, target_month)
+        if rollup is None:
+            rollup = merge_day_backups_to_month(output_dir, target_year, target_month)
+            if rollup is None:
+                rollup = {"interfaces": []}
+                for day_data in day_datas:
+                    apply_day_to_rollup(rollup, day_data, target_year, target_month)
+        else:
+            for day_data in day_datas:
+                apply_day_to_rollup(rollup, day_data, target_year, target_month)
+
+        rollup_file = write_backup(
+            get_rollup_base(output_dir, target_year, target_month), rollup
+        )
+    logging.info(f"月汇总已更新: {rollup_file}")
+    return rollup
+
+
+def list_backup_hosts() -> Dict[str, str]:
+    """默认及各上游已存在的备份目录：主机名 -> 目录"""
+    hosts = {DEFAULT_HOST: JSON_DIR}
+    if os.path.isdir(HOSTS_DIR):
+        for name in sorted(os.listdir(HOSTS_DIR)):
+            hosts[name] = get_host_backup_dir(name)
+    return {host: d for host, d in hosts.items() if os.path.isdir(d)}
+
+
+def list_backup_dirs() -> List[str]:
+    """默认及各上游已存在的备份目录"""
+    return list(list_backup_hosts().values())
+
+
+def verify_backups():
+    """增量校验默认及各上游的备份目录：跳过上次校验后未变化的月目录，
+    其余只 stat 已登记文件，未登记的解析一次后补登
+    """
+    for base_dir in list_backup_dirs():
+        result = verify_backup_tree(base_dir)
+        logging.info(
+            f"备份校验 {base_dir}: 一致 {result['ok']} 个，补登 {result['adopted']} 个，"
+            f"损坏 {result['corrupt']} 个，未变化的月目录 {result['skipped']} 个"
+        )
+
+
 def organize_backup_files(base_dir: str):
-    if not os.path.isdir(base_dir):
+    """将根目录下散落的天/月备份移入对应月目录
+
+    根目录修改时间与备份索引记录的一致时说明无新文件放入，直接跳过，启动耗时与备份数量无关
+    """
+    try:
+        base_mtime_ns = os.stat(base_dir).st_mtime_ns
+    except OSError:
         logging.info(f"备份目录不存在，跳过整理: {base_dir}")
         return
 
-    day_pattern = re.compile(r"^vnstat_(\d{4})(\d{2})(\d{2})\.json$")
-    month_pattern = re.compile(r"^vnstat_month_(\d{4})(\d{2})\.json$")
+    catalog = load_catalog(base_dir)
+    if catalog.get("organized_mtime_ns") == base_mtime_ns:
+        logging.info("备份目录无变化，跳过整理")
+        return
 
-    moved_count = 0
-    for filename in os.listdir(base_dir):
-        filepath = os.path.join(base_dir, filename)
-        if not os.path.isfile(filepath):
-            continue
+    day_pattern = re.compile(r"^vnstat_(\d{4})(\d{2})(\d{2})\.(?:json|vnb)$")
+    month_pattern = re.compile(r"^vnstat_month_(\d{4})(\d{2})\.(?:json|vnb)$")
 
-        m = day_pattern.match(filename)
-        if m:
-            year, month = int(m.group(1)), int(m.group(2))
-            month_dir = ensure_month_dir(base_dir, year, month)
-            dest = os.path.join(month_dir, filename)
-            if not os.path.exists(dest):
-                os.rename(filepath, dest)
-                moved_count += 1
-                logging.info(f"整理: {filename} -> {month_dir}")
-            else:
-                os.remove(filepath)
-                logging.info(f"整理: 目标已存在，删除源文件 {filename}")
+    moved_count = 0
+    with os.scandir(base_dir) as it:
+        entries = [entry for entry in it if entry.is_file()]
+    for entry in entries:
+        filename = entry.name
+        m = day_pattern.match(filename) or month_pattern.match(filename)
+        if not m:
             continue
 
-        m = month_pattern.match(filename)
-        if m:
-            year, month = int(m.group(1)), int(m.group(2))
-            month_dir = ensure_month_dir(base_dir, year, month)
-            dest = os.path.join(month_dir, filename)
+        year, month = int(m.group(1)), int(m.group(2))
+        month_dir = ensure_month_dir(base_dir, year, month)
+        dest = os.path.join(month_dir, filename)
+        with backup_lock(month_dir):
             if not os.path.exists(dest):
-                os.rename(filepath, dest)
+                os.rename(entry.path, dest)
+                update_catalog(dest)
                 moved_count += 1
                 logging.info(f"整理: {filename} -> {month_dir}")
             else:
-                os.remove(filepath)
+                os.remove(entry.path)
                 logging.info(f"整理: 目标已存在，删除源文件 {filename}")
-            continue
 
+    mark_organized(base_dir, os.stat(base_dir).st_mtime_ns)
     logging.info(f"备份文件整理完成，共移动 {moved_count} 个文件")
 
 
-def main():
-    for handler in logging.root.handlers[:]:
-        handler.close()
-        logging.root.removeHandler(handler)
-    log_dir = "/app/log"
-    log_file = setup_logging(log_dir)
-    logging.info(f"脚本启动，日志文件: {log_file}")
-
-    api_url = os.getenv("VNSTAT_API_URL")
-    if not api_url:
-        logging.error("必须通过Docker环境变量配置 VNSTAT_API_URL")
+def organize_all_backups():
+    """整理配置中各上游及已存在的上游备份目录（含已从配置中移除的上游）"""
+    try:
+        dirs = {get_host_backup_dir(host) for host in get_upstream_hosts()}
+    except ValueError as e:
+        logging.warning(f"读取上游列表失败，只整理已存在的备份目录: {str(e)}")
+        dirs = set()
+    dirs.update(list_backup_dirs())
+    for base_dir in sorted(dirs):
+        organize_backup_files(base_dir)
+
+
+def load_hosts() -> Dict[str, str]:
+    """读取上游列表，配置无效时退出"""
+    if not os.getenv("VNSTAT_HOSTS") and not os.getenv("VNSTAT_API_URL"):
+        logging.error("必须通过Docker环境变量配置 VNSTAT_API_URL 或 VNSTAT_HOSTS")
         sys.exit(1)
-
-    if not api_url.startswith(("http://", "https://")):
-        logging.error(f"API_URL 格式无效: {api_url}")
+    try:
+        return get_upstream_hosts()
+    except ValueError as e:
+        logging.error(str(e))
         sys.exit(2)
 
-    output_dir = JSON_DIR
-    today = datetime.now(tz=tz.gettz("Asia/Shanghai"))
-    days = parse_args()
-    data = fetch_api_data(api_url)
+
+def fetch_hosts_data(hosts: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """并发拉取所有上游，失败的上游记录日志后跳过；全部失败时抛出 UpstreamError"""
+    results = {}
+    for name, result in fetch_all(hosts).items():
+        if isinstance(result, UpstreamError):
+            logging.error(f"[{name}] API请求失败: {str(result)}")
+        else:
+            results[name] = result
+    if not results:
+        raise UpstreamError("所有上游均拉取失败")
+    return results
+
+
+def get_backfill_workers() -> int:
+    return int(os.getenv("VNA_BACKFILL_WORKERS", 4))
+
+
+def backup_host_days(
+    host: str, data: Dict[str, Any], today: datetime, days: int
+) -> Dict[str, List[str]]:
+    """将单个上游的快照写入其备份目录中最近 days 天的天备份
+
+    快照只遍历一次按天切分，缺失的天备份并行原子写入；随后按月各更新一次月汇总，
+    并为已结束且缺少月备份的月份补写月备份。返回 written / skipped / failed 日期列表
+    """
+    output_dir = get_host_backup_dir(host)
+    store = TrafficStore(data)
+    history = HistoryDB(get_history_db_path(host))
 
     os.makedirs(output_dir, exist_ok=True)
     os.chmod(output_dir, 0o755)
 
+    report: Dict[str, List[str]] = {"written": [], "skipped": [], "failed": []}
+    missing: Dict[Tuple[int, int, int], str] = {}
     for i in range(days):
         target_date = today - timedelta(days=i + 1)
-        handle_date = target_date.strftime("%Y%m%d")
-        logging.info(f"处理日期: {handle_date}")
+        day = (target_date.year, target_date.month, target_date.day)
+        ensure_month_dir(output_dir, day[0], day[1])
+        day_base = get_day_backup_base(output_dir, *day)
+
+        existing = find_backup(day_base)
+        if existing:
+            logging.info(f"天备份文件已存在，跳过: {existing}")
+            report["skipped"].append(target_date.strftime("%Y%m%d"))
+        else:
+            missing[day] = day_base
+
+    parts = store.partition_by_day(sorted(missing)) if missing else {}
+
+    def write_day(day):
+        return write_backup(missing[day], parts[day])
+
+    written: Dict[Tuple[int, int, int], Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=get_backfill_workers()) as executor:
+        futures = {day: executor.submit(write_day, day) for day in sorted(missing)}
+        for day, future in futures.items():
+            label = f"{day[0]}{day[1]:02d}{day[2]:02d}"
+            try:
+                logging.info(f"数据已保存: {future.result()}")
+            except Exception as e:
+                logging.error(f"[{host}] 写入天备份失败 {label}: {str(e)}")
+                report["failed"].append(label)
+                continue
+            written[day] = parts[day]
+            report["written"].append(label)
+
+    # SQLite 单写者，入库按日期顺序串行执行
+    for day in sorted(written):
+        ingest_history(written[day], history)
+
+    months = sorted({day[:2] for day in written})
+    for year, month in months:
+        month_days = [
+            written[day] for day in sorted(written) if day[:2] == (year, month)
+        ]
+        try:
+            update_month_rollup(output_dir, year, month, *month_days)
+        except Exception as e:
+            logging.warning(f"更新月汇总失败: {str(e)}")
+
+        if (year, month) < (today.year, today.month):
+            try:
+                backup_month_data(data, year, month, output_dir, store, history)
+            except Exception as e:
+                logging.warning(f"[{host}] 补写月备份失败 {year}-{month:02d}: {str(e)}")
+
+    report["skipped"].sort()
+    logging.info(
+        f"[{host}] 操作完成！写入 {len(report['written'])} 天，"
+        f"跳过 {len(report['skipped'])} 天，失败 {len(report['failed'])} 天，"
+        f"目录：{output_dir}"
+    )
+    return report
 
-        month_dir = ensure_month_dir(output_dir, target_date.year, target_date.month)
-        output_file = os.path.join(month_dir, f"vnstat_{handle_date}.json")
 
-        if os.path.exists(output_file):
-            logging.info(f"天备份文件已存在，跳过: {output_file}")
-            continue
+def main():
+    for handler in logging.root.handlers[:]:
+        handler.close()
+        logging.root.removeHandler(handler)
+    log_dir = "/app/log"
+    log_file = setup_logging(log_dir)
+    logging.info(f"脚本启动，日志文件: {log_file}")
 
-        filtered_data = filter_data(data, target_date)
-        with open(output_file, "w") as f:
-            json.dump(filtered_data, f, indent=2)
-        logging.info(f"数据已保存: {output_file}")
+    hosts = load_hosts()
+    today = datetime.now(tz=tz.gettz("Asia/Shanghai"))
+    days = parse_args()
 
-    logging.info(f"操作完成！已保存最近 {days} 天数据至：{output_dir}")
+    for host, data in fetch_hosts_data(hosts).items():
+        try:
+            backup_host_days(host, data, today, days)
+        except Exception as e:
+            logging.error(f"[{host}] 天备份失败: {str(e)}")
 
 
 def backup_last_month():
@@ -393,37 +574,47 @@ def backup_last_month():
     log_file = setup_logging(log_dir)
     logging.info(f"月备份脚本启动，日志文件: {log_file}")
 
-    api_url = os.getenv("VNSTAT_API_URL")
-    if not api_url:
-        logging.error("必须通过Docker环境变量配置 VNSTAT_API_URL")
-        sys.exit(1)
-
-    if not api_url.startswith(("http://", "https://")):
-        logging.error(f"API_URL 格式无效: {api_url}")
-        sys.exit(2)
-
-    output_dir = JSON_DIR
-    os.makedirs(output_dir, exist_ok=True)
-    os.chmod(output_dir, 0o755)
-
+    hosts = load_hosts()
     today = datetime.now(tz=tz.gettz("Asia/Shanghai"))
     last_month_date = today.replace(day=1) - timedelta(days=1)
     target_year = last_month_date.year
     target_month = last_month_date.month
 
-    month_dir = ensure_month_dir(output_dir, target_year, target_month)
-    month_str = f"{target_year}{target_month:02d}"
-    month_file = os.path.join(month_dir, f"vnstat_month_{month_str}.json")
+    # 只拉取尚未完成上月备份的上游
+    pending = {}
+    for host, url in hosts.items():
+        output_dir = get_host_backup_dir(host)
+        os.makedirs(output_dir, exist_ok=True)
+        os.chmod(output_dir, 0o755)
+        ensure_month_dir(output_dir, target_year, target_month)
+        month_file = find_backup(
+            get_month_backup_base(output_dir, target_year, target_month)
+        )
+        if month_file:
+            logging.info(f"[{host}] 上月备份文件已存在，跳过: {month_file}")
+        else:
+            pending[host] = url
 
-    if os.path.exists(month_file):
-        logging.info(f"上月备份文件已存在，跳过: {month_file}")
+    if not pending:
         return
 
     logging.info(f"开始备份上月数据: {target_year}-{target_month:02d}")
 
-    data = fetch_api_data(api_url)
-    backup_month_data(data, target_year, target_month, output_dir)
+    for host, data in fetch_hosts_data(pending).items():
+        try:
+            backup_month_data(
+                data,
+                target_year,
+                target_month,
+                get_host_backup_dir(host),
+                history=HistoryDB(get_history_db_path(host)),
+            )
+        except Exception as e:
+            logging.error(f"[{host}] 月备份失败: {str(e)}")
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except UpstreamError:
+        sys.exit(3)
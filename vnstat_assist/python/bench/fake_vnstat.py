@@ -0,0 +1,204 @@
+"""本地模拟的 vnstat json.cgi 上游，可注入延迟、错误并调整响应大小
+
+供基准测试在进程内启动，也可单独运行，将 VNSTAT_API_URL 指向它进行压测：
+
+    python bench/fake_vnstat.py --port 18081 --interfaces 4 --years 2 \\
+        --latency 50 --jitter 20 --error-rate 0.01
+
+GET /stats 返回已处理的请求数、注入的错误数及发送字节数（自身不计入）
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.synthetic import generate_document
+
+# status：返回 error_status；truncate：只发送一半响应体；close：不响应直接断开
+ERROR_MODES = ("status", "truncate", "close")
+
+
+class FakeVnstatServer:
+    """在后台线程中以 HTTP 提供固定的 json.cgi 文档，port=0 时由系统分配端口
+
+    - latency / jitter：每个请求的固定延迟及随机附加延迟（秒）
+    - error_rate：按该概率以 error_mode 方式返回错误
+    - pad_bytes：在文档顶层加入该长度的 padding 字段以增大响应，vnstat 解析时忽略
+    """
+
+    def __init__(
+        self,
+        doc: Dict[str, Any],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        error_status: int = 503,
+        error_mode: str = "status",
+        pad_bytes: int = 0,
+        seed: Optional[int] = None,
+    ):
+        if error_mode not in ERROR_MODES:
+            raise ValueError(f"未知的错误模式: {error_mode}")
+        if pad_bytes:
+            doc = {**doc, "padding": "x" * pad_bytes}
+        self.body = json.dumps(doc, separators=(",", ":")).encode()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_mode = error_mode
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "bytes_sent": 0}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send(200, json.dumps(server.stats()).encode())
+                    return
+
+                delay, fail = server._plan()
+                if delay:
+                    time.sleep(delay)
+                if not fail:
+                    server._count(len(server.body))
+                    self._send(200, server.body)
+                elif server.error_mode == "status":
+                    server._count(0, error=True)
+                    self._send(server.error_status, b'{"error":"injected"}')
+                elif server.error_mode == "truncate":
+                    half = server.body[: len(server.body) // 2]
+                    server._count(len(half), error=True)
+                    self._send(200, half, len(server.body))
+                    self.close_connection = True
+                else:
+                    server._count(0, error=True)
+                    self.close_connection = True
+
+            def _send(self, status: int, body: bytes, length: Optional[int] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(length or len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def _plan(self):
+        """本次请求的延迟及是否注入错误"""
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+        return delay, fail
+
+    def _count(self, sent: int, error: bool = False):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["errors"] += int(error)
+            self._stats["bytes_sent"] += sent
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    @property
+    def requests(self) -> int:
+        return self.stats()["requests"]
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/json.cgi"
+
+    def start(self) -> "FakeVnstatServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeVnstatServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 vnstat json.cgi 上游")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=18081, help="监听端口")
+    parser.add_argument("--input", help="提供已有的 json.cgi 文档，缺省时生成合成数据")
+    parser.add_argument("--interfaces", type=int, default=2, help="合成数据的网卡数")
+    parser.add_argument("--years", type=float, default=1, help="合成数据的覆盖年数")
+    parser.add_argument(
+        "--fiveminute-days", type=int, default=2, help="五分钟条目保留天数"
+    )
+    parser.add_argument(
+        "--hour-days", type=int, default=0, help="小时条目保留天数，0 表示全部"
+    )
+    parser.add_argument("--latency", type=float, default=0, help="固定延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="随机附加延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="错误概率 0-1")
+    parser.add_argument("--error-status", type=int, default=503, help="错误状态码")
+    parser.add_argument(
+        "--error-mode", choices=ERROR_MODES, default="status", help="错误方式"
+    )
+    parser.add_argument("--pad-kb", type=int, default=0, help="额外增大响应（KB）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "r") as f:
+            doc = json.load(f)
+    else:
+        doc = generate_document(
+            args.interfaces,
+            args.years,
+            args.fiveminute_days or None,
+            args.hour_days or None,
+            seed=args.seed,
+        )
+
+    server = FakeVnstatServer(
+        doc,
+        args.host,
+        args.port,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        error_mode=args.error_mode,
+        pad_bytes=args.pad_kb * 1024,
+        seed=args.seed,
+    )
+    print(f"模拟上游: {server.url}，响应 {len(server.body) / 1024:.1f} KB")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"统计: {json.dumps(server.stats())}")
+
+
+if __name__ == "__main__":
+    main()
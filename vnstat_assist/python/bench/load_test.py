@@ -0,0 +1,333 @@
+"""API 压测：N 个并发客户端登录后循环请求指定接口，统计延迟分布、吞吐、错误率及上游调用次数
+
+    python bench/fake_vnstat.py --port 18081 --latency 50 &
+    VNSTAT_API_URL=http://127.0.0.1:18081/json.cgi gunicorn -c api/gunicorn.conf.py ...
+    python bench/load_test.py --url http://127.0.0.1:19328 --clients 32 --duration 30 \\
+        --upstream http://127.0.0.1:18081 -o load.json
+
+--upstream 指向 fake_vnstat 时，按其 /stats 前后差值统计压测期间的上游调用次数；
+同时记录 API 的 /api/cache/stats 前后差值（快照缓存命中及上游请求统计）
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from backup.traffic_summary import percentile
+
+# 直方图各桶上限（毫秒），最后一桶为其余全部
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def default_endpoints(day: str, month: str) -> Dict[str, str]:
+    return {
+        "json": "/json.cgi",
+        "day": f"/backups/{day}",
+        "month": f"/backups/month/{month}",
+    }
+
+
+def login(base_url: str, username: str, password: str) -> str:
+    """获取 Bearer Token；未启用认证时接口同样返回可用的 token"""
+    response = requests.post(
+        f"{base_url}/auth/login",
+        json={"username": username, "password": password},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+class ClientStats:
+    """单个客户端线程的记录，结束后合并，压测期间无需加锁"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Counter] = {}
+        self.bytes: Counter = Counter()
+
+    def record(self, name: str, elapsed_ms: float, status: str, size: int):
+        self.latencies.setdefault(name, []).append(elapsed_ms)
+        self.statuses.setdefault(name, Counter())[status] += 1
+        self.bytes[name] += size
+
+
+def run_client(
+    base_url: str,
+    token: str,
+    endpoints: Dict[str, str],
+    offset: int,
+    deadline: float,
+    max_requests: int,
+    revalidate: bool,
+    timeout: float,
+    stats: ClientStats,
+):
+    """按接口轮流请求直到截止时间或达到请求数；offset 错开各客户端的起始接口"""
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    session.headers["Accept-Encoding"] = "gzip"
+    names = list(endpoints)
+    etags: Dict[str, str] = {}
+    sent = 0
+    while time.monotonic() < deadline and (not max_requests or sent < max_requests):
+        name = names[(offset + sent) % len(names)]
+        headers = {}
+        if revalidate and name in etags:
+            headers["If-None-Match"] = etags[name]
+        start = time.perf_counter()
+        try:
+            response = session.get(
+                base_url + endpoints[name], headers=headers, timeout=timeout
+            )
+            size = len(response.content)
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            size = 0
+            status = type(e).__name__
+            response = None
+        stats.record(name, (time.perf_counter() - start) * 1000, status, size)
+        if response is not None and response.headers.get("ETag"):
+            etags[name] = response.headers["ETag"]
+        sent += 1
+
+
+def histogram(latencies: List[float]) -> List[Dict[str, Any]]:
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for value in latencies:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    buckets = [{"le_ms": b, "count": c} for b, c in zip(HISTOGRAM_BOUNDS, counts)]
+    buckets.append({"le_ms": None, "count": counts[-1]})
+    return buckets
+
+
+def _is_success(status: str) -> bool:
+    return status in ("200", "304")
+
+
+def summarize(
+    latencies: List[float], statuses: Counter, size: int, elapsed: float
+) -> Dict[str, Any]:
+    total = sum(statuses.values())
+    errors = sum(n for status, n in statuses.items() if not _is_success(status))
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+        "bytes": size,
+        "status": dict(sorted(statuses.items())),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p90": round(percentile(latencies, 90), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0), 3),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0,
+        },
+        "histogram": histogram(latencies),
+    }
+
+
+def _get_json(url: str, token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        response = requests.get(url, headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def _delta(before: Any, after: Any) -> Any:
+    """两次统计中数值字段的差"""
+    if isinstance(before, dict) and isinstance(after, dict):
+        return {
+            key: _delta(before.get(key), value)
+            for key, value in after.items()
+            if isinstance(value, (int, float, dict)) and not isinstance(value, bool)
+        }
+    if isinstance(before, (int, float)) and isinstance(after, (int, float)):
+        return round(after - before, 3)
+    return after
+
+
+def run_load(
+    base_url: str,
+    token: str,
+    endpoints: Dict[str, str],
+    clients: int,
+    duration: float,
+    max_requests: int = 0,
+    revalidate: bool = False,
+    timeout: float = 30,
+    upstream: Optional[str] = None,
+) -> Dict[str, Any]:
+    upstream_before = _get_json(f"{upstream}/stats") if upstream else None
+    cache_before = _get_json(f"{base_url}/api/cache/stats", token)
+
+    deadline = time.monotonic() + duration
+    per_client = [ClientStats() for _ in range(clients)]
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(
+                base_url,
+                token,
+                endpoints,
+                i,
+                deadline,
+                max_requests,
+                revalidate,
+                timeout,
+                per_client[i],
+            ),
+            daemon=True,
+        )
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "url": base_url,
+            "clients": clients,
+            "duration_s": round(elapsed, 3),
+            "max_requests_per_client": max_requests,
+            "revalidate": revalidate,
+            "endpoints": endpoints,
+        },
+        "endpoints": {},
+    }
+    all_latencies: List[float] = []
+    all_statuses: Counter = Counter()
+    all_bytes = 0
+    for name in endpoints:
+        latencies = [v for s in per_client for v in s.latencies.get(name, [])]
+        statuses: Counter = sum(
+            (s.statuses.get(name, Counter()) for s in per_client), Counter()
+        )
+        size = sum(s.bytes[name] for s in per_client)
+        report["endpoints"][name] = summarize(latencies, statuses, size, elapsed)
+        all_latencies.extend(latencies)
+        all_statuses.update(statuses)
+        all_bytes += size
+    report["total"] = summarize(all_latencies, all_statuses, all_bytes, elapsed)
+
+    if upstream:
+        after = _get_json(f"{upstream}/stats")
+        report["upstream"] = _delta(upstream_before, after) if after else None
+    cache_after = _get_json(f"{base_url}/api/cache/stats", token)
+    if cache_before and cache_after:
+        report["cache"] = _delta(cache_before, cache_after)
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"{'endpoint':<10}{'req':>8}{'err%':>8}{'rps':>10}"
+        f"{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"
+    ]
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, stats in rows:
+        latency = stats["latency_ms"]
+        lines.append(
+            f"{name:<10}{stats['requests']:>8}{stats['error_rate'] * 100:>8.2f}"
+            f"{stats['throughput_rps']:>10.1f}{latency['p50']:>10.2f}"
+            f"{latency['p90']:>10.2f}{latency['p99']:>10.2f}{latency['max']:>10.2f}"
+        )
+
+    lines.append("")
+    buckets = report["total"]["histogram"]
+    peak = max((b["count"] for b in buckets), default=0) or 1
+    for bucket in buckets:
+        label = f"<= {bucket['le_ms']} ms"
+        if bucket["le_ms"] is None:
+            label = f"> {HISTOGRAM_BOUNDS[-1]} ms"
+        bar = "#" * round(bucket["count"] * 40 / peak)
+        lines.append(f"{label:>12} {bucket['count']:>8} {bar}")
+
+    for name, stats in report["endpoints"].items():
+        lines.append(f"{name} 状态: {stats['status']}")
+    if report.get("upstream"):
+        lines.append(f"上游调用: {report['upstream']}")
+    if report.get("cache"):
+        lines.append(f"快照缓存: {report['cache']}")
+    return lines
+
+
+def main():
+    yesterday = datetime.now() - timedelta(days=1)
+    last_month = datetime.now().replace(day=1) - timedelta(days=1)
+
+    parser = argparse.ArgumentParser(description="vnstat_assist API 压测")
+    parser.add_argument("--url", default="http://127.0.0.1:19328", help="API 地址")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=10, help="持续秒数")
+    parser.add_argument(
+        "--requests", type=int, default=0, help="每个客户端的请求数上限，0 表示不限"
+    )
+    parser.add_argument(
+        "--endpoints",
+        default="json,day,month",
+        help="压测的接口，逗号分隔：json,day,month",
+    )
+    parser.add_argument("--day", default=yesterday.strftime("%Y%m%d"), help="天备份日期")
+    parser.add_argument("--month", default=last_month.strftime("%Y%m"), help="月备份月份")
+    parser.add_argument("--username", default=os.getenv("VNA_USERNAME", ""))
+    parser.add_argument("--password", default=os.getenv("VNA_PASSWORD", ""))
+    parser.add_argument(
+        "--revalidate", action="store_true", help="携带 If-None-Match 重新验证"
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="单个请求超时秒数")
+    parser.add_argument("--upstream", help="fake_vnstat 地址，用于统计上游调用次数")
+    parser.add_argument("-o", "--output", help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    available = default_endpoints(args.day, args.month)
+    names = [name for name in args.endpoints.split(",") if name]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        parser.error(f"未知的接口: {','.join(unknown)}")
+
+    token = login(base_url, args.username, args.password)
+    report = run_load(
+        base_url,
+        token,
+        {name: available[name] for name in names},
+        args.clients,
+        args.duration,
+        args.requests,
+        args.revalidate,
+        args.timeout,
+        args.upstream.rstrip("/") if args.upstream else None,
+    )
+    print("\n".join(format_report(report)))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
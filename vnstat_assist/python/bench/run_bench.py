@@ -0,0 +1,349 @@
+"""热点路径基准测试：快照索引的构建/切片/多天切分、月汇总重建、备份目录整理及 Flask 路由
+
+结果（各项耗时的最小/中位/平均/最大毫秒数及运行环境）保存为 JSON，
+--compare 指定旧结果时逐项输出中位数变化，便于发现版本间的性能回退
+
+    python bench/run_bench.py --scale medium -o bench_results.json
+    python bench/run_bench.py --scale medium --compare bench_results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.fake_vnstat import FakeVnstatServer
+from bench.synthetic import generate_document
+
+SCALES = {
+    "small": {"interfaces": 1, "years": 0.25, "fiveminute_days": 2, "hour_days": 4},
+    "medium": {"interfaces": 2, "years": 1, "fiveminute_days": 30, "hour_days": None},
+    "large": {"interfaces": 4, "years": 3, "fiveminute_days": 90, "hour_days": None},
+}
+# 中位数变慢超过该比例时在对比结果中标记
+REGRESSION_THRESHOLD = 1.2
+
+
+def measure(
+    fn: Callable, repeat: int, setup: Optional[Callable] = None
+) -> Dict[str, Any]:
+    """运行 repeat 次并统计耗时；setup 的返回值作为 fn 的参数，其耗时不计入"""
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _span_days(doc: Dict[str, Any]) -> List[datetime]:
+    """文档中有天条目的日期（取第一个网卡）"""
+    return [
+        datetime(e["date"]["year"], e["date"]["month"], e["date"]["day"])
+        for e in doc["interfaces"][0]["traffic"]["day"]
+    ]
+
+
+def build_tree(base_dir: str, doc: Dict[str, Any], days: List[datetime]):
+    """按天切分文档写入天备份，构造与线上一致的备份目录"""
+    from backup.backup_format import write_backup
+    from backup.traffic_store import TrafficStore
+    from backup.vnstat_backup import ensure_month_dir, get_day_backup_base
+
+    keys = [(d.year, d.month, d.day) for d in days]
+    parts = TrafficStore(doc).partition_by_day(keys)
+    for key in keys:
+        ensure_month_dir(base_dir, key[0], key[1])
+        write_backup(get_day_backup_base(base_dir, *key), parts[key])
+
+
+def bench_filters(
+    doc: Dict[str, Any], days: List[datetime], partition_days: int, repeat: int
+) -> Dict[str, Dict[str, Any]]:
+    """线上热点路径：快照建索引、按天/按月切片、补录时单次遍历切分多天"""
+    from backup.traffic_store import TrafficStore
+    from backup.vnstat_backup import day_bounds, month_bounds
+
+    target_day = days[-2]
+    store = TrafficStore(doc)
+    keys = [(d.year, d.month, d.day) for d in days[-partition_days:]]
+    return {
+        "store_build": measure(lambda: TrafficStore(doc), repeat),
+        "store_filter_day": measure(
+            lambda: store.filter_range_data(*day_bounds(target_day)), repeat
+        ),
+        "store_filter_month": measure(
+            lambda: store.filter_range_data(
+                *month_bounds(target_day.year, target_day.month)
+            ),
+            repeat,
+        ),
+        "store_query_hour_month": measure(
+            lambda: store.query_interface_range(
+                doc["interfaces"][0]["name"],
+                "hour",
+                *month_bounds(target_day.year, target_day.month),
+            ),
+            repeat,
+        ),
+        f"store_partition_{len(keys)}_days": measure(
+            lambda: store.partition_by_day(keys), repeat
+        ),
+    }
+
+
+def bench_tree(
+    doc: Dict[str, Any], days: List[datetime], workdir: str, repeat: int
+) -> Dict[str, Dict[str, Any]]:
+    from backup.backup_format import find_backup
+    from backup.vnstat_backup import (
+        get_day_backup_base,
+        merge_day_backups_to_month,
+        organize_backup_files,
+    )
+
+    results = {}
+    tree = os.path.join(workdir, "tree")
+    start = time.perf_counter()
+    build_tree(tree, doc, days)
+    results["build_day_tree"] = {
+        "runs": 1,
+        "files": len(days),
+        "total_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+    month = days[-1].replace(day=1) - timedelta(days=1)
+    results["merge_day_backups_to_month"] = measure(
+        lambda: merge_day_backups_to_month(tree, month.year, month.month), repeat
+    )
+
+    # 旧版平铺布局：全部天备份散落在根目录下，由 organize_backup_files 移入月目录
+    sources = [
+        find_backup(get_day_backup_base(tree, d.year, d.month, d.day)) for d in days
+    ]
+    counter = iter(range(repeat + 1))
+
+    def flat_tree() -> str:
+        flat = os.path.join(workdir, f"flat_{next(counter)}")
+        os.makedirs(flat)
+        for path in sources:
+            shutil.copyfile(path, os.path.join(flat, os.path.basename(path)))
+        return flat
+
+    results["organize_backup_files"] = measure(organize_backup_files, repeat, flat_tree)
+    organized = flat_tree()
+    organize_backup_files(organized)
+    results["organize_backup_files_unchanged"] = measure(
+        lambda: organize_backup_files(organized), repeat
+    )
+    return results
+
+
+def bench_routes(
+    doc: Dict[str, Any], days: List[datetime], workdir: str, repeat: int
+) -> Dict[str, Dict[str, Any]]:
+    """启动本地模拟上游，以测试客户端请求各路由；首个请求（冷缓存）单独记录"""
+    import backup.vnstat_backup as vnstat_backup
+    from backup.history_db import HistoryDB
+
+    tree = os.path.join(workdir, "tree")
+    vnstat_backup.JSON_DIR = tree
+    vnstat_backup.HOSTS_DIR = os.path.join(workdir, "hosts")
+    os.environ["VNA_HISTORY_DB"] = os.path.join(workdir, "history.db")
+    HistoryDB(os.environ["VNA_HISTORY_DB"]).ingest(doc)
+
+    server = FakeVnstatServer(doc).start()
+    os.environ["VNSTAT_API_URL"] = server.url
+    os.environ.pop("VNSTAT_HOSTS", None)
+    os.environ["VNA_AUTH_ENABLE"] = "0"
+    # 预先占用 api_server 的日志器，避免其在 /app/log 下创建日志文件
+    logging.getLogger("api_server").addHandler(logging.NullHandler())
+    from api.api_server import app
+
+    day = days[-2]
+    stamp = day.strftime("%Y%m%d")
+    month = (day.replace(day=1) - timedelta(days=1)).strftime("%Y%m")
+    routes = {
+        "json_cgi": "/json.cgi",
+        "summary": "/api/summary",
+        "traffic_hour": f"/api/traffic?iface=eth0&granularity=hour&from={month}",
+        "traffic_backup": (
+            f"/api/traffic?iface=eth0&granularity=fiveminute&source=backup&from={stamp}"
+        ),
+        "traffic_aggregate": (
+            f"/api/traffic/aggregate?iface=eth0&bucket=day"
+            f"&from={days[0]:%Y%m%d}&to={stamp}"
+        ),
+        "backup_day": f"/backups/{stamp}",
+        "backup_month": f"/backups/month/{month}",
+        "backups_index": "/backups/index",
+        "billing": "/api/billing?iface=eth0&cycles=3",
+    }
+
+    results = {}
+    client = app.test_client()
+    try:
+        for name, path in routes.items():
+
+            def request(path=path):
+                response = client.get(path)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} 返回 {response.status_code}")
+                return response
+
+            start = time.perf_counter()
+            request()
+            first_ms = round((time.perf_counter() - start) * 1000, 3)
+            results[f"route_{name}"] = {
+                "path": path,
+                "first_ms": first_ms,
+                **measure(request, repeat),
+            }
+    finally:
+        server.stop()
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """逐项对比中位数，返回输出行"""
+    lines = [f"{'benchmark':<36}{'baseline':>12}{'current':>12}{'ratio':>8}"]
+    for name, stats in results["results"].items():
+        old = baseline.get("results", {}).get(name, {})
+        if "median_ms" not in stats or "median_ms" not in old:
+            continue
+        ratio = stats["median_ms"] / old["median_ms"] if old["median_ms"] else 0
+        flag = "  <-- 回退" if ratio >= REGRESSION_THRESHOLD else ""
+        lines.append(
+            f"{name:<36}{old['median_ms']:>12.3f}{stats['median_ms']:>12.3f}"
+            f"{ratio:>8.2f}{flag}"
+        )
+    return lines
+
+
+def run(
+    scale: Dict[str, Any],
+    repeat: int,
+    seed: int,
+    only: List[str],
+    partition_days: int = 30,
+) -> Dict:
+    start = time.perf_counter()
+    doc = generate_document(seed=seed, **scale)
+    generate_ms = (time.perf_counter() - start) * 1000
+    days = _span_days(doc)
+    traffic = doc["interfaces"][0]["traffic"]
+
+    results: Dict[str, Dict[str, Any]] = {}
+    workdir = tempfile.mkdtemp(prefix="vnstat_bench_")
+    try:
+        suites = {
+            "filters": lambda: bench_filters(doc, days, partition_days, repeat),
+            "tree": lambda: bench_tree(doc, days, workdir, repeat),
+            "routes": lambda: bench_routes(doc, days, workdir, repeat),
+        }
+        for name, suite in suites.items():
+            # 路由依赖 tree 生成的备份目录
+            if only and name not in only and not (name == "tree" and "routes" in only):
+                continue
+            results.update(suite())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "repeat": repeat,
+            "seed": seed,
+            "generate_ms": round(generate_ms, 3),
+            "document_bytes": len(json.dumps(doc, separators=(",", ":"))),
+            "rows_per_interface": {
+                key: len(value) for key, value in traffic.items() if key != "total"
+            },
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="vnstat_assist 热点路径基准测试")
+    parser.add_argument(
+        "--scale", choices=sorted(SCALES), default="small", help="数据规模（默认small）"
+    )
+    parser.add_argument("--interfaces", type=int, help="覆盖规模中的网卡数")
+    parser.add_argument("--years", type=float, help="覆盖规模中的年数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数（默认5）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（默认0）")
+    parser.add_argument(
+        "--partition-days",
+        type=int,
+        default=30,
+        help="partition_by_day 一次切分的天数（默认30）",
+    )
+    parser.add_argument(
+        "--only",
+        default="",
+        help="只运行指定的测试组，逗号分隔：filters,tree,routes",
+    )
+    parser.add_argument("-o", "--output", help="结果JSON输出路径")
+    parser.add_argument("--compare", help="与之对比的旧结果JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    scale = dict(SCALES[args.scale])
+    if args.interfaces:
+        scale["interfaces"] = args.interfaces
+    if args.years:
+        scale["years"] = args.years
+    only = [name for name in args.only.split(",") if name]
+
+    report = run(scale, args.repeat, args.seed, only, args.partition_days)
+    for name, stats in report["results"].items():
+        value = stats.get("median_ms", stats.get("total_ms"))
+        print(f"{name:<36}{value:>12.3f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存: {args.output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)))
+
+
+if __name__ == "__main__":
+    main()
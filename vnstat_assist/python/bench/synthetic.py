@@ -0,0 +1,232 @@
+"""生成与 vnstat json.cgi 结构一致的合成数据，供基准测试使用
+
+流量按网卡基准速率 × 日内周期（晚间高峰）× 周末系数 × 随机波动生成，偶有突发；
+小时/天/月/年条目由更细的条目逐级求和，各维度合计一致。同一参数及 seed 生成的文档相同
+
+    python bench/synthetic.py --interfaces 4 --years 2 -o /tmp/vnstat.json
+"""
+
+import argparse
+import calendar
+import json
+import math
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+JSON_VERSION = "2"
+VNSTAT_VERSION = "2.12"
+TOP_ENTRIES = 10
+# 单个网卡五分钟的基准流量（字节），各网卡依次减半
+BASE_FIVEMINUTE_BYTES = 256 * 1024**2
+
+
+def _date(moment: datetime, precision: int) -> Dict[str, Any]:
+    fields = ("year", "month", "day")[:precision]
+    return {field: getattr(moment, field) for field in fields}
+
+
+def _entry(
+    entry_id: int, moment: datetime, precision: int, rx: int, tx: int
+) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {"id": entry_id, "date": _date(moment, precision)}
+    if precision >= 4:
+        entry["time"] = {"hour": moment.hour, "minute": moment.minute}
+    entry["timestamp"] = calendar.timegm(moment.timetuple())
+    entry["rx"] = rx
+    entry["tx"] = tx
+    return entry
+
+
+def _load_factor(moment: datetime) -> float:
+    """日内周期：凌晨最低、21 点最高；周末整体上浮"""
+    hour = moment.hour + moment.minute / 60
+    daily = 0.55 + 0.45 * math.cos((hour - 21) / 24 * 2 * math.pi)
+    return daily * (1.3 if moment.weekday() >= 5 else 1.0)
+
+
+class TrafficModel:
+    """单个网卡的流量模型，rx 为主方向，tx 约为其五分之一"""
+
+    def __init__(self, rng: random.Random, base: int):
+        self.rng = rng
+        self.base = base
+
+    def sample(self, moment: datetime, slots: int = 1) -> Dict[str, int]:
+        load = self.base * slots * _load_factor(moment)
+        load *= self.rng.lognormvariate(0, 0.35)
+        if self.rng.random() < 0.01:
+            load *= self.rng.uniform(3, 10)
+        rx = int(load)
+        tx = int(load * self.rng.uniform(0.12, 0.28))
+        return {"rx": rx, "tx": tx}
+
+
+def generate_interface(
+    name: str,
+    model: TrafficModel,
+    start: datetime,
+    end: datetime,
+    fiveminute_days: Optional[int],
+    hour_days: Optional[int],
+) -> Dict[str, Any]:
+    """[start, end) 内单个网卡的条目；fiveminute/hour 只保留末尾若干天，None 表示整个区间"""
+    fiveminute_from = start
+    if fiveminute_days:
+        fiveminute_from = end - timedelta(days=fiveminute_days)
+    hour_from = end - timedelta(days=hour_days) if hour_days else start
+
+    fiveminute: List[Dict[str, Any]] = []
+    hours: List[Dict[str, Any]] = []
+    days: Dict[datetime, List[int]] = {}
+
+    moment = start
+    while moment < end:
+        if moment >= fiveminute_from:
+            rx = tx = 0
+            for i in range(12):
+                slot = moment + timedelta(minutes=5 * i)
+                if slot >= end:
+                    break
+                value = model.sample(slot)
+                fiveminute.append(
+                    _entry(len(fiveminute) + 1, slot, 5, value["rx"], value["tx"])
+                )
+                rx += value["rx"]
+                tx += value["tx"]
+        else:
+            value = model.sample(moment, 12)
+            rx, tx = value["rx"], value["tx"]
+
+        if moment >= hour_from:
+            hours.append(_entry(len(hours) + 1, moment, 4, rx, tx))
+        totals = days.setdefault(moment.replace(hour=0), [0, 0])
+        totals[0] += rx
+        totals[1] += tx
+        moment += timedelta(hours=1)
+
+    day_entries = []
+    months: Dict[datetime, List[int]] = {}
+    for day, (rx, tx) in sorted(days.items()):
+        day_entries.append(_entry(len(day_entries) + 1, day, 3, rx, tx))
+        totals = months.setdefault(day.replace(day=1), [0, 0])
+        totals[0] += rx
+        totals[1] += tx
+
+    month_entries = []
+    years: Dict[datetime, List[int]] = {}
+    for month, (rx, tx) in sorted(months.items()):
+        month_entries.append(_entry(len(month_entries) + 1, month, 2, rx, tx))
+        totals = years.setdefault(month.replace(month=1), [0, 0])
+        totals[0] += rx
+        totals[1] += tx
+
+    year_entries = [
+        _entry(i + 1, year, 1, rx, tx)
+        for i, (year, (rx, tx)) in enumerate(sorted(years.items()))
+    ]
+    top = sorted(day_entries, key=lambda e: e["rx"] + e["tx"], reverse=True)
+    total_rx = sum(e["rx"] for e in year_entries)
+    total_tx = sum(e["tx"] for e in year_entries)
+    last = end - timedelta(minutes=5)
+
+    return {
+        "name": name,
+        "alias": "",
+        "created": {
+            "date": _date(start, 3),
+            "timestamp": calendar.timegm(start.timetuple()),
+        },
+        "updated": {
+            "date": _date(last, 3),
+            "time": {"hour": last.hour, "minute": last.minute},
+            "timestamp": calendar.timegm(last.timetuple()),
+        },
+        "traffic": {
+            "total": {"rx": total_rx, "tx": total_tx},
+            "fiveminute": fiveminute,
+            "hour": hours,
+            "day": day_entries,
+            "month": month_entries,
+            "year": year_entries,
+            "top": top[:TOP_ENTRIES],
+        },
+    }
+
+
+def generate_document(
+    interfaces: int = 2,
+    years: float = 1,
+    fiveminute_days: Optional[int] = 2,
+    hour_days: Optional[int] = None,
+    end: Optional[datetime] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """生成 interfaces 个网卡、覆盖结束时间前 years 年的 json.cgi 文档
+
+    fiveminute_days / hour_days 为五分钟、小时条目保留的天数（vnstat 默认 2 天、4 天），
+    None 表示与天条目一样覆盖整个区间；end 默认当前整点
+    """
+    end = end or datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = (end - timedelta(days=int(years * 365))).replace(hour=0)
+    rng = random.Random(seed)
+    return {
+        "vnstatversion": VNSTAT_VERSION,
+        "jsonversion": JSON_VERSION,
+        "interfaces": [
+            generate_interface(
+                f"eth{i}",
+                TrafficModel(rng, BASE_FIVEMINUTE_BYTES >> i),
+                start,
+                end,
+                fiveminute_days,
+                hour_days,
+            )
+            for i in range(interfaces)
+        ],
+    }
+
+
+def _optional_days(value: str) -> Optional[int]:
+    """0 表示覆盖整个区间"""
+    days = int(value)
+    return days or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的 vnstat json.cgi 数据")
+    parser.add_argument("--interfaces", type=int, default=2, help="网卡数（默认2）")
+    parser.add_argument("--years", type=float, default=1, help="覆盖年数（默认1）")
+    parser.add_argument(
+        "--fiveminute-days",
+        type=_optional_days,
+        default=2,
+        help="五分钟条目保留天数，0 表示覆盖整个区间（默认2）",
+    )
+    parser.add_argument(
+        "--hour-days",
+        type=_optional_days,
+        default=0,
+        help="小时条目保留天数，0 表示覆盖整个区间（默认0）",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（默认0）")
+    parser.add_argument("-o", "--output", help="输出文件，缺省时写到标准输出")
+    args = parser.parse_args()
+
+    doc = generate_document(
+        args.interfaces,
+        args.years,
+        args.fiveminute_days,
+        args.hour_days,
+        seed=args.seed,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(doc, f, separators=(",", ":"))
+    else:
+        json.dump(doc, sys.stdout, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# api_server 在导入时读取环境变量并创建各上游的备份目录、历史库，须先指向临时目录
+RUNTIME_DIR = tempfile.mkdtemp(prefix="vna-tests-")
+os.environ.setdefault("VNSTAT_API_URL", "http://127.0.0.1:9/json.cgi")
+os.environ["VNA_AUTH_ENABLE"] = "0"
+os.environ["VNA_HISTORY_DB"] = os.path.join(RUNTIME_DIR, "history.db")
+os.environ["VNA_METRICS_DIR"] = os.path.join(RUNTIME_DIR, "metrics")
+os.environ["VNA_PROFILE_DIR"] = os.path.join(RUNTIME_DIR, "profiles")
+# 有处理器时 api_server 不再创建写入 /app/log 的文件日志
+logging.getLogger("api_server").addHandler(logging.NullHandler())
+
+from backup import vnstat_backup  # noqa: E402
+from backup.backup_format import write_backup  # noqa: E402
+from backup.traffic_store import TrafficStore  # noqa: E402
+from backup.vnstat_backup import ensure_month_dir, get_day_backup_base  # noqa: E402
+from bench.synthetic import generate_document  # noqa: E402
+
+vnstat_backup.JSON_DIR = os.path.join(RUNTIME_DIR, "backups", "json")
+vnstat_backup.HOSTS_DIR = os.path.join(RUNTIME_DIR, "backups", "hosts")
+
+SNAPSHOT_END = datetime(2026, 3, 20)
+BACKUP_DAYS = [(2026, 3, day) for day in range(1, 19)]
+
+
+@pytest.fixture(scope="session")
+def snapshot_doc():
+    """单网卡、覆盖 2026-03-20 之前一年的合成快照，五分钟条目保留2天、小时条目保留4天"""
+    return generate_document(interfaces=1, years=1, hour_days=4, end=SNAPSHOT_END)
+
+
+@pytest.fixture
+def day_parts(snapshot_doc):
+    """快照按天切分后 3/1 至 3/18 各天的备份内容"""
+    return TrafficStore(snapshot_doc).partition_by_day(BACKUP_DAYS)
+
+
+def write_days(base_dir, parts, fmt="json"):
+    paths = []
+    for day, data in parts.items():
+        ensure_month_dir(base_dir, day[0], day[1])
+        paths.append(write_backup(get_day_backup_base(base_dir, *day), data, fmt))
+    return paths
+
+
+def make_entry(date, rx, tx, time=None, entry_id=1):
+    entry = {"id": entry_id, "date": dict(date), "timestamp": 0, "rx": rx, "tx": tx}
+    if time is not None:
+        entry["time"] = dict(time)
+    return entry
+
+
+def serve_document(monkeypatch, host, doc):
+    """让上游 host 的快照缓存直接返回 doc，不经过网络"""
+    from api.api_server import SnapshotCache
+
+    body = json.dumps(doc).encode()
+    monkeypatch.setattr(host, "cache", SnapshotCache(lambda: (body, doc), 60, 0))
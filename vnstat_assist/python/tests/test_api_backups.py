@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from backup import vnstat_backup
+from backup.backup_format import SIDECAR_EXT, write_backup
+from backup.traffic_store import TrafficStore
+from backup.vnstat_backup import (
+    ensure_month_dir,
+    get_day_backup_base,
+    update_month_rollup,
+)
+from tests.conftest import make_entry, serve_document
+
+DAYS = [(2026, 3, 10), (2026, 3, 11)]
+
+
+@pytest.fixture(scope="module")
+def client(snapshot_doc):
+    from api.api_server import app
+
+    base_dir = vnstat_backup.JSON_DIR
+    parts = TrafficStore(snapshot_doc).partition_by_day(DAYS)
+    ensure_month_dir(base_dir, 2026, 3)
+    for day, data in parts.items():
+        write_backup(get_day_backup_base(base_dir, *day), data)
+    update_month_rollup(base_dir, 2026, 3, *parts.values())
+    return app.test_client()
+
+
+def _assert_revalidated(response):
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert "immutable" not in response.headers["Cache-Control"]
+    assert response.headers.get("ETag")
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/backups/20260310",
+        "/backups/month/202603",
+        "/backups/index",
+        "/api/traffic?source=backup&from=2026031000&to=2026031012",
+    ],
+)
+def test_backup_routes_return_304_for_matching_etag(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    _assert_revalidated(response)
+
+    etag = response.headers["ETag"]
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    _assert_revalidated(cached)
+
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client):
+    url = "/backups/20260310"
+    last_modified = client.get(url).headers["Last-Modified"]
+    response = client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    earlier = "Thu, 01 Jan 2015 00:00:00 GMT"
+    assert client.get(url, headers={"If-Modified-Since": earlier}).status_code == 200
+
+
+def test_proxy_and_summary_revalidate_against_snapshot(client, monkeypatch):
+    from api import api_server
+
+    date = {"year": 2026, "month": 3, "day": 10}
+    doc = {
+        "interfaces": [
+            {
+                "name": "eth0",
+                "updated": {"date": date, "time": {"hour": 1, "minute": 5}},
+                "traffic": {"day": [make_entry(date, 1, 2)]},
+            }
+        ]
+    }
+    serve_document(monkeypatch, api_server.DEFAULT_UPSTREAM, doc)
+
+    etags = {}
+    for url in ("/json.cgi", "/api/summary"):
+        response = client.get(url)
+        assert response.status_code == 200
+        etags[url] = response.headers["ETag"]
+        cached = client.get(url, headers={"If-None-Match": etags[url]})
+        assert cached.status_code == 304
+        assert cached.headers["ETag"] == etags[url]
+
+    # vnstat 更新时间变化后 ETag 随之变化
+    doc["interfaces"][0]["updated"]["time"]["minute"] = 10
+    serve_document(monkeypatch, api_server.DEFAULT_UPSTREAM, doc)
+    for url, etag in etags.items():
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_rewritten_backup_gets_new_etag(client):
+    url = "/backups/20260311"
+    etag = client.get(url).headers["ETag"]
+
+    # 采集日志压实或降精度会原地改写已结束的天备份
+    date = {"year": 2026, "month": 3, "day": 11}
+    rewritten = {
+        "interfaces": [
+            {"name": "eth0", "traffic": {"day": [make_entry(date, 1, 2)]}}
+        ]
+    }
+    write_backup(get_day_backup_base(vnstat_backup.JSON_DIR, 2026, 3, 11), rewritten)
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json() == rewritten
+
+
+def test_compact_backup_served_without_sidecar(client, snapshot_doc):
+    day = (2026, 3, 12)
+    data = TrafficStore(snapshot_doc).partition_by_day([day])[day]
+    base = get_day_backup_base(vnstat_backup.JSON_DIR, *day)
+    write_backup(base, data, "compact")
+
+    for _ in range(2):
+        response = client.get("/backups/20260312", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        body = response.data
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        assert json.loads(body) == data
+        assert not os.path.exists(base + SIDECAR_EXT)
+
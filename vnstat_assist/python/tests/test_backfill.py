@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from backup import vnstat_backup
+from backup.backup_format import find_backup, read_backup, write_backup
+from backup.history_db import HistoryDB, get_history_db_path
+from backup.traffic_store import TrafficStore
+from backup.vnstat_backup import (
+    backup_host_days,
+    ensure_month_dir,
+    get_day_backup_base,
+    get_month_backup_base,
+)
+
+# 回补 3/2、3/1、2/28、2/27 四天，2 月已结束
+TODAY = datetime(2026, 3, 3, 8)
+DAYS = [(2026, 3, 2), (2026, 3, 1), (2026, 2, 28), (2026, 2, 27)]
+
+
+@pytest.fixture
+def host(request):
+    """每个测试使用独立的上游目录"""
+    return request.node.name.replace("_", "-")
+
+
+def _base(host, day):
+    return get_day_backup_base(vnstat_backup.get_host_backup_dir(host), *day)
+
+
+def test_backfill_writes_missing_days_once(host, snapshot_doc):
+    output_dir = vnstat_backup.get_host_backup_dir(host)
+    ensure_month_dir(output_dir, 2026, 3)
+    write_backup(_base(host, (2026, 3, 1)), {"interfaces": []})
+
+    report = backup_host_days(host, snapshot_doc, TODAY, len(DAYS))
+    assert report == {
+        "written": ["20260227", "20260228", "20260302"],
+        "skipped": ["20260301"],
+        "failed": [],
+    }
+
+    parts = TrafficStore(snapshot_doc).partition_by_day(DAYS)
+    for day in [(2026, 2, 27), (2026, 2, 28), (2026, 3, 2)]:
+        assert read_backup(_base(host, day)) == parts[day]
+    # 已有的天备份不被覆盖
+    assert read_backup(_base(host, (2026, 3, 1))) == {"interfaces": []}
+    # 已结束的 2 月补写月备份，当前月不写
+    assert read_backup(get_month_backup_base(output_dir, 2026, 2)) is not None
+    assert read_backup(get_month_backup_base(output_dir, 2026, 3)) is None
+    history = HistoryDB(get_history_db_path(host))
+    rows = history.iter_rows("eth0", "day", (2026, 2, 27), (2026, 3, 2))
+    assert len(list(rows)) == 3
+
+    again = backup_host_days(host, snapshot_doc, TODAY, len(DAYS))
+    assert again["written"] == []
+    assert again["skipped"] == ["20260227", "20260228", "20260301", "20260302"]
+
+
+def test_backfill_reports_failed_days(host, snapshot_doc, monkeypatch):
+    failing = _base(host, (2026, 2, 28))
+
+    def write(base_path, data, *args, **kwargs):
+        if base_path == failing:
+            raise OSError("disk full")
+        return write_backup(base_path, data, *args, **kwargs)
+
+    monkeypatch.setattr(vnstat_backup, "write_backup", write)
+    report = backup_host_days(host, snapshot_doc, TODAY, len(DAYS))
+    assert report["failed"] == ["20260228"]
+    assert report["written"] == ["20260227", "20260301", "20260302"]
+    assert find_backup(failing) is None
+
+    # 失败的天下次运行时重新写入
+    monkeypatch.undo()
+    report = backup_host_days(host, snapshot_doc, TODAY, len(DAYS))
+    assert report["written"] == ["20260228"]
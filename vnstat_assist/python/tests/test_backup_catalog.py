@@ -0,0 +1,149 @@
+import json
+import os
+
+import pytest
+
+from backup import backup_catalog
+from backup.backup_catalog import (
+    catalog_index,
+    find_in_catalog,
+    get_catalog_log_path,
+    get_catalog_path,
+    load_catalog,
+    scan_catalog,
+)
+from backup.backup_format import (
+    encode_backup,
+    remove_backup,
+    verify_backup_tree,
+    write_backup,
+)
+from backup.vnstat_backup import (
+    get_day_backup_base,
+    get_month_backup_base,
+    organize_backup_files,
+)
+from tests.conftest import BACKUP_DAYS, write_days
+
+
+def test_catalog_index_lists_days_and_months(tmp_path, day_parts):
+    base_dir = str(tmp_path)
+    write_days(base_dir, day_parts)
+    write_backup(get_month_backup_base(base_dir, 2026, 3), {"interfaces": []})
+
+    index = catalog_index(base_dir)
+    assert list(index["days"]) == [f"202603{day:02d}" for _, _, day in BACKUP_DAYS]
+    assert index["days"]["20260301"]["format"] == "json"
+    month = index["months"]["202603"]
+    assert month["days"] == len(BACKUP_DAYS)
+    assert month["month_backup"]["format"] == "json"
+    assert month["rollup"] is None
+
+
+def test_catalog_log_is_replayed_and_compacted(tmp_path, day_parts, monkeypatch):
+    base_dir = str(tmp_path)
+    write_days(base_dir, dict(list(day_parts.items())[:2]))
+    log_path = get_catalog_log_path(base_dir)
+    # 写入只追加日志，不重写快照
+    with open(get_catalog_path(base_dir), "rb") as f:
+        snapshot = f.read()
+    remove_backup(get_day_backup_base(base_dir, 2026, 3, 1) + ".json")
+    with open(get_catalog_path(base_dir), "rb") as f:
+        assert f.read() == snapshot
+    assert os.path.getsize(log_path) > 0
+    assert load_catalog(base_dir)["files"] == scan_catalog(base_dir)
+
+    # 日志超过快照大小后合并回快照
+    monkeypatch.setattr(backup_catalog, "CATALOG_LOG_MIN_COMPACT", 0)
+    write_days(base_dir, day_parts)
+    assert os.path.getsize(log_path) <= os.path.getsize(get_catalog_path(base_dir))
+    assert load_catalog(base_dir)["files"] == scan_catalog(base_dir)
+
+
+def test_corrupt_catalog_is_rebuilt(tmp_path, day_parts):
+    base_dir = str(tmp_path)
+    write_days(base_dir, day_parts)
+    with open(get_catalog_log_path(base_dir), "a") as f:
+        f.write("{not json\n")
+    assert load_catalog(base_dir)["files"] == scan_catalog(base_dir)
+    assert not os.path.exists(get_catalog_log_path(base_dir))
+
+
+def test_verify_skips_unchanged_months(tmp_path, day_parts):
+    base_dir = str(tmp_path)
+    write_days(base_dir, day_parts)
+    assert verify_backup_tree(base_dir)["ok"] == len(BACKUP_DAYS)
+
+    assert verify_backup_tree(base_dir) == {
+        "ok": 0,
+        "adopted": 0,
+        "corrupt": 0,
+        "skipped": 1,
+    }
+    write_backup(get_day_backup_base(base_dir, 2026, 3, 1), day_parts[(2026, 3, 1)])
+    assert verify_backup_tree(base_dir)["ok"] == len(BACKUP_DAYS)
+
+
+def test_organize_skips_unchanged_base_dir(tmp_path, day_parts, monkeypatch):
+    base_dir = str(tmp_path)
+    flat = os.path.join(base_dir, "vnstat_20260301.json")
+    with open(flat, "wb") as f:
+        f.write(encode_backup(day_parts[(2026, 3, 1)], "json"))
+
+    organize_backup_files(base_dir)
+    base = get_day_backup_base(base_dir, 2026, 3, 1)
+    assert find_in_catalog(base_dir, base) == base + ".json"
+
+    scanned = []
+    scandir = os.scandir
+    monkeypatch.setattr(
+        os, "scandir", lambda path: scanned.append(path) or scandir(path)
+    )
+    organize_backup_files(base_dir)
+    assert scanned == []
+
+    with open(os.path.join(base_dir, "vnstat_20260302.json"), "wb") as f:
+        f.write(encode_backup(day_parts[(2026, 3, 2)], "json"))
+    organize_backup_files(base_dir)
+    assert scanned == [base_dir]
+    assert find_in_catalog(base_dir, get_day_backup_base(base_dir, 2026, 3, 2))
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from api import api_server
+
+    host = api_server.UpstreamHost("catalog", "http://127.0.0.1:9/catalog.cgi")
+    monkeypatch.setitem(api_server.HOSTS, "catalog", host)
+    return host, api_server.app.test_client()
+
+
+def test_unindexed_backup_is_served_and_indexed(api, day_parts):
+    host, client = api
+    write_days(host.backup_dir, {(2026, 3, 1): day_parts[(2026, 3, 1)]})
+    # 绕过写入者放入的文件：索引中没有登记
+    base = get_day_backup_base(host.backup_dir, 2026, 3, 2)
+    with open(base + ".json", "wb") as f:
+        f.write(encode_backup(day_parts[(2026, 3, 2)], "json"))
+    assert find_in_catalog(host.backup_dir, base) is None
+
+    response = client.get("/backups/20260302?host=catalog")
+    assert response.status_code == 200
+    assert json.loads(response.data) == day_parts[(2026, 3, 2)]
+    assert find_in_catalog(host.backup_dir, base) == base + ".json"
+
+    index = client.get("/backups/index?host=catalog")
+    assert list(index.get_json()["days"]) == ["20260301", "20260302"]
+    etag = index.headers["ETag"]
+    cached = client.get("/backups/index?host=catalog", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+
+def test_externally_deleted_backup_is_dropped_from_index(api, day_parts):
+    host, client = api
+    write_days(host.backup_dir, {(2026, 3, 1): day_parts[(2026, 3, 1)]})
+    base = get_day_backup_base(host.backup_dir, 2026, 3, 1)
+    os.remove(base + ".json")
+
+    assert client.get("/backups/20260301?host=catalog").status_code == 500
+    assert find_in_catalog(host.backup_dir, base) is None
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from backup.backup_catalog import find_in_catalog
+from backup.backup_format import (
+    SIDECAR_EXT,
+    decode_backup,
+    encode_backup,
+    find_backup,
+    migrate_tree,
+    read_backup,
+    write_backup,
+)
+from backup.backup_manifest import lookup_manifest
+from backup.vnstat_backup import ensure_month_dir, get_day_backup_base
+from tests.conftest import BACKUP_DAYS, write_days
+
+
+def test_compact_round_trip(snapshot_doc):
+    blob = encode_backup(snapshot_doc, "compact")
+    assert blob.startswith(b"VNB1")
+    assert decode_backup(blob, "vnstat_20260319.vnb") == snapshot_doc
+    assert len(blob) < len(encode_backup(snapshot_doc, "json"))
+
+
+def test_compact_keeps_irregular_entries_and_rejects_corrupt_files():
+    doc = {
+        "vnstatversion": "2.12",
+        "interfaces": [
+            {
+                "name": "eth0",
+                "traffic": {
+                    "total": {"rx": 3, "tx": 4},
+                    "day": [
+                        {"id": 1, "date": {"year": 2026}, "rx": 1, "tx": 2},
+                        {"id": 2, "date": {"year": 2026}, "rx": 2},
+                    ],
+                    "hour": [{"id": 1, "rx": "1", "tx": 1.5}],
+                },
+            }
+        ],
+    }
+    blob = encode_backup(doc, "compact")
+    assert decode_backup(blob, "vnstat_20260301.vnb") == doc
+
+    for broken in (b"XXXX" + blob[4:], blob[:20]):
+        with pytest.raises(ValueError):
+            decode_backup(broken, "vnstat_20260301.vnb")
+
+
+def test_write_backup_switches_format(tmp_path, day_parts):
+    base = get_day_backup_base(str(tmp_path), 2026, 3, 1)
+    ensure_month_dir(str(tmp_path), 2026, 3)
+    data = day_parts[(2026, 3, 1)]
+
+    json_path = write_backup(base, data, "json")
+    compact_path = write_backup(base, data, "compact")
+    assert compact_path.endswith(".vnb")
+    assert not os.path.exists(json_path)
+    assert find_backup(base) == compact_path
+    assert read_backup(base) == data
+    assert lookup_manifest(compact_path) is not None
+    assert find_in_catalog(str(tmp_path), base) == compact_path
+
+
+def test_compact_backup_has_no_sidecar(tmp_path, day_parts, monkeypatch):
+    base = get_day_backup_base(str(tmp_path), 2026, 3, 1)
+    ensure_month_dir(str(tmp_path), 2026, 3)
+    data = day_parts[(2026, 3, 1)]
+
+    write_backup(base, data, "json")
+    assert os.path.exists(base + SIDECAR_EXT)
+    assert write_backup(base, data, "compact").endswith(".vnb")
+    assert not os.path.exists(base + SIDECAR_EXT)
+
+    monkeypatch.setenv("VNA_BACKUP_SIDECAR", "1")
+    write_backup(base, data, "compact")
+    assert os.path.exists(base + SIDECAR_EXT)
+    monkeypatch.setenv("VNA_BACKUP_SIDECAR", "0")
+    write_backup(base, data, "json")
+    assert not os.path.exists(base + SIDECAR_EXT)
+
+
+def test_migrate_tree_converts_and_skips(tmp_path, day_parts):
+    base_dir = str(tmp_path)
+    write_days(base_dir, day_parts)
+
+    assert migrate_tree(base_dir, "compact") == (len(BACKUP_DAYS), 0)
+    for day, data in day_parts.items():
+        base = get_day_backup_base(base_dir, *day)
+        assert find_backup(base) == base + ".vnb"
+        assert read_backup(base) == data
+        assert find_in_catalog(base_dir, base) == base + ".vnb"
+    assert migrate_tree(base_dir, "compact") == (0, len(BACKUP_DAYS))
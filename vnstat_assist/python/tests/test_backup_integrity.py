@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from backup.backup_catalog import find_in_catalog, load_catalog, scan_catalog
+from backup.backup_format import (
+    BACKUP_NAME_PATTERN,
+    encode_backup,
+    find_backup,
+    read_backup,
+    verify_backup_tree,
+    write_atomic,
+    write_backup,
+)
+from backup.backup_manifest import count_records, load_manifest, lookup_manifest
+from backup.vnstat_backup import ensure_month_dir, get_day_backup_base
+from tests.conftest import BACKUP_DAYS, write_days
+
+
+def test_write_atomic_keeps_old_file_when_rename_fails(tmp_path, monkeypatch):
+    path = str(tmp_path / "vnstat_20260301.json")
+    write_atomic(path, b"old")
+
+    def fail(src, dst):
+        raise OSError("crash before rename")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        write_atomic(path, b"new")
+    monkeypatch.undo()
+
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(str(tmp_path)) == ["vnstat_20260301.json"]
+
+
+def test_manifest_matches_only_unchanged_files(tmp_path, day_parts):
+    base = get_day_backup_base(str(tmp_path), 2026, 3, 1)
+    ensure_month_dir(str(tmp_path), 2026, 3)
+    data = day_parts[(2026, 3, 1)]
+    path = write_backup(base, data, "json")
+
+    entry = lookup_manifest(path)
+    assert entry["size"] == os.path.getsize(path)
+    assert entry["records"] == count_records(data)
+    assert len(entry["sha256"]) == 64
+
+    # 被外部改写的文件不再与 manifest 一致，读者需重新解析
+    with open(path, "ab") as f:
+        f.write(b" ")
+    assert lookup_manifest(path) is None
+
+
+def test_verify_adopts_unlisted_and_reports_corrupt(tmp_path, day_parts):
+    base_dir = str(tmp_path)
+    write_days(base_dir, day_parts, "compact")
+    result = verify_backup_tree(base_dir, full=True)
+    assert result == {"ok": len(BACKUP_DAYS), "adopted": 0, "corrupt": 0, "skipped": 0}
+    assert load_catalog(base_dir)["files"] == scan_catalog(base_dir)
+
+    # 外部改动：截断一个文件，放入一个未登记的文件
+    broken = find_backup(get_day_backup_base(base_dir, 2026, 3, 5))
+    with open(broken, "r+b") as f:
+        f.truncate(10)
+    adopted = get_day_backup_base(base_dir, 2026, 3, 25) + ".json"
+    with open(adopted, "wb") as f:
+        f.write(encode_backup(day_parts[(2026, 3, 1)], "json"))
+
+    result = verify_backup_tree(base_dir, full=True)
+    assert result == {
+        "ok": len(BACKUP_DAYS) - 1,
+        "adopted": 1,
+        "corrupt": 1,
+        "skipped": 0,
+    }
+    assert lookup_manifest(adopted) is not None
+    assert find_in_catalog(base_dir, adopted[: -len(".json")]) == adopted
+
+
+def _write_one(args):
+    base_dir, day, data, fmt = args
+    return write_backup(get_day_backup_base(base_dir, *day), data, fmt)
+
+
+@pytest.mark.parametrize("executor", ["threads", "processes"])
+def test_concurrent_writes_keep_manifest_and_catalog(tmp_path, day_parts, executor):
+    """多个写入者并发写同一月目录（同一天交替写两种格式），manifest 与索引不丢条目"""
+    base_dir = str(tmp_path)
+    ensure_month_dir(base_dir, 2026, 3)
+    jobs = [
+        (base_dir, day, data, fmt)
+        for day, data in day_parts.items()
+        for fmt in ("json", "compact")
+    ]
+    if executor == "threads":
+        pool = ThreadPoolExecutor(max_workers=8)
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=4, mp_context=multiprocessing.get_context("fork")
+        )
+    with pool:
+        list(pool.map(_write_one, jobs))
+
+    month_dir = os.path.join(base_dir, "202603")
+    backups = sorted(
+        name for name in os.listdir(month_dir) if BACKUP_NAME_PATTERN.match(name)
+    )
+    assert len(backups) == len(BACKUP_DAYS)
+    assert not [name for name in os.listdir(month_dir) if ".tmp" in name]
+
+    manifest = load_manifest(month_dir)["files"]
+    assert sorted(manifest) == backups
+    for day, data in day_parts.items():
+        base = get_day_backup_base(base_dir, *day)
+        path = find_backup(base)
+        assert lookup_manifest(path) is not None
+        assert find_in_catalog(base_dir, base) == path
+        assert read_backup(base) == data
+    assert load_catalog(base_dir)["files"] == scan_catalog(base_dir)
@@ -0,0 +1,211 @@
+import copy
+import os
+from datetime import datetime
+
+from backup.backup_catalog import catalog_index
+from backup.backup_format import find_backup
+from backup.backup_retention import (
+    RetentionPolicy,
+    apply_retention,
+    downsample_day,
+    prune_history,
+    summarize_month,
+)
+from backup.capture_journal import get_journal_dir, prune_journal
+from backup.history_db import HistoryDB
+from backup.traffic_store import TrafficStore
+from backup.vnstat_backup import get_day_backup_base, get_month_backup_base
+from tests.conftest import make_entry, write_days
+
+TODAY = datetime(2026, 3, 20)
+
+
+def _totals(data, time_key):
+    entries = [
+        entry
+        for interface in data["interfaces"]
+        for entry in interface["traffic"].get(time_key, [])
+    ]
+    return sum(e["rx"] for e in entries), sum(e["tx"] for e in entries)
+
+
+def test_downsample_day_fills_missing_hours_from_fiveminute():
+    day = {"year": 2026, "month": 3, "day": 1}
+    hours = [make_entry(day, 1200, 600, {"hour": h}) for h in range(24)]
+    fiveminute = [
+        make_entry(day, 100, 50, {"hour": h, "minute": m})
+        for h in range(24)
+        for m in range(0, 60, 5)
+    ]
+    data = {
+        "interfaces": [
+            {
+                "name": "eth0",
+                "traffic": {
+                    # 5、6 点的小时条目缺失，只能由五分钟条目补齐
+                    "hour": [e for e in hours if e["time"]["hour"] not in (5, 6)],
+                    "fiveminute": fiveminute,
+                    "day": [make_entry(day, 28800, 14400)],
+                },
+            }
+        ]
+    }
+    original = copy.deepcopy(data)
+
+    result = downsample_day(data)
+    traffic = result["interfaces"][0]["traffic"]
+    assert "fiveminute" not in traffic
+    assert [e["time"]["hour"] for e in traffic["hour"]] == list(range(24))
+    assert _totals(result, "hour") == _totals(original, "fiveminute")
+    assert traffic["day"] == original["interfaces"][0]["traffic"]["day"]
+    assert result["retention"] == {"tier": "hourly"}
+    assert data == original
+
+
+def test_summarize_month_preserves_day_totals(snapshot_doc):
+    store = TrafficStore(snapshot_doc)
+    days = [(2026, 2, day) for day in range(1, 29)]
+    sources = list(store.partition_by_day(days).values())
+
+    summary = summarize_month(sources, 2026, 2)
+    assert summary is not None
+    traffic = summary["interfaces"][0]["traffic"]
+    assert "rollup" not in summary["interfaces"][0]
+    assert "hour" not in traffic and "fiveminute" not in traffic
+
+    expected = store.query_interface_range("eth0", "day", (2026, 2, 1), (2026, 2, 28))
+    assert traffic["day"] == expected["entries"]
+    assert traffic["month"] == store.query_interface_range(
+        "eth0", "month", (2026, 2), (2026, 2)
+    )["entries"]
+    assert traffic["year"] == store.query_interface_range(
+        "eth0", "year", (2026,), (2026,)
+    )["entries"]
+    top = store.query_interface_range("eth0", "top", (2026, 2, 1), (2026, 2, 28))
+    assert top["entries"]
+    assert traffic["top"] == top["entries"]
+    assert summary["retention"] == {"tier": "daily"}
+
+
+def test_summarize_month_without_vnstat_month_sums_days(snapshot_doc):
+    store = TrafficStore(snapshot_doc)
+    days = [(2026, 2, day) for day in range(1, 11)]
+    sources = list(store.partition_by_day(days).values())
+    for source in sources:
+        for interface in source["interfaces"]:
+            interface["traffic"].pop("month", None)
+
+    summary = summarize_month(sources, 2026, 2)
+    traffic = summary["interfaces"][0]["traffic"]
+    (month,) = traffic["month"]
+    assert month["id"] == 0
+    assert (month["rx"], month["tx"]) == _totals(summary, "day")
+
+
+
+def _fine_doc():
+    """3/1 与 3/15 两天的五分钟、小时、天条目，3/1 的 5、6 点小时条目缺失"""
+    traffic = {"fiveminute": [], "hour": [], "day": []}
+    for day in (1, 15):
+        date = {"year": 2026, "month": 3, "day": day}
+        for hour in range(24):
+            for minute in range(0, 60, 5):
+                time = {"hour": hour, "minute": minute}
+                traffic["fiveminute"].append(make_entry(date, 10, 5, time))
+            if day == 15 or hour not in (5, 6):
+                traffic["hour"].append(make_entry(date, 120, 60, {"hour": hour}))
+        traffic["day"].append(make_entry(date, 2880, 1440))
+    return {"interfaces": [{"name": "eth0", "traffic": traffic}]}
+
+
+def _counts(db):
+    return {row["granularity"]: row["count"] for row in db.coverage()}
+
+
+def test_history_downsample_fills_hours_then_drops_them(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    db.ingest(_fine_doc())
+    assert _counts(db) == {"day": 2, "fiveminute": 576, "hour": 46}
+
+    # 3/1 的五分钟条目并入缺失的两个小时后删除，3/15 不受影响
+    assert db.downsample((2026, 3, 10), None) == 288
+    assert _counts(db) == {"day": 2, "fiveminute": 288, "hour": 48}
+    filled = db.iter_rows("eth0", "hour", (2026, 3, 1, 5, 0), (2026, 3, 1, 6, 59))
+    assert [(rx, tx) for _, rx, tx in filled] == [(120, 60), (120, 60)]
+
+    # 天精度层级删除小时及五分钟条目，天条目保留
+    assert db.downsample(None, (2026, 3, 10)) == 24
+    assert _counts(db) == {"day": 2, "fiveminute": 288, "hour": 24}
+
+
+def test_prune_history_follows_policy_tiers(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    db.ingest(_fine_doc())
+    before = _counts(db)
+
+    assert prune_history(db, RetentionPolicy(0, 0), TODAY) == 0
+    assert prune_history(db, RetentionPolicy(10, 0), TODAY, dry_run=True) == 0
+    assert _counts(db) == before
+
+    # 完整精度窗口为 10 天：3/10 之前只保留小时精度
+    assert prune_history(db, RetentionPolicy(10, 0), TODAY) == 288
+    assert _counts(db) == {"day": 2, "fiveminute": 288, "hour": 48}
+
+
+def _journal(base_dir, *stamps):
+    journal_dir = get_journal_dir(base_dir)
+    os.makedirs(journal_dir, exist_ok=True)
+    for stamp in stamps:
+        with open(os.path.join(journal_dir, stamp + ".jsonl"), "w") as f:
+            f.write("{}\n")
+    return journal_dir
+
+
+def _journals(journal_dir):
+    return sorted(name for name in os.listdir(journal_dir) if name.endswith(".jsonl"))
+
+
+def test_prune_journal_removes_only_older_days(tmp_path):
+    journal_dir = _journal(str(tmp_path), "20260301", "20260310", "notes")
+
+    assert prune_journal(str(tmp_path), "20260305", dry_run=True) == 1
+    assert len(_journals(journal_dir)) == 3
+    assert prune_journal(str(tmp_path), "20260305") == 1
+    assert _journals(journal_dir) == ["20260310.jsonl", "notes.jsonl"]
+
+
+def test_apply_retention_merges_and_downsamples(tmp_path, snapshot_doc):
+    base_dir = str(tmp_path)
+    days = [(2025, 12, day) for day in range(1, 4)]
+    days += [(2026, 3, day) for day in range(1, 4)]
+    write_days(base_dir, TrafficStore(snapshot_doc).partition_by_day(days))
+    _journal(base_dir, "20260301")
+    policy = RetentionPolicy(full_days=10, hourly_months=2, fmt="compact")
+
+    expected = {
+        "months": 1,
+        "pruned": 3,
+        "downsampled": 3,
+        "journals": 1,
+        "failed": 0,
+    }
+    # 试运行不删除 12 月的天备份，它们也计入降精度
+    dry_run = apply_retention(base_dir, policy, TODAY, dry_run=True)
+    assert dry_run == dict(expected, downsampled=6)
+    assert list(catalog_index(base_dir)["days"])[0] == "20251201"
+
+    assert apply_retention(base_dir, policy, TODAY) == expected
+    index = catalog_index(base_dir)
+    assert list(index["days"]) == ["20260301", "20260302", "20260303"]
+    assert index["months"]["202512"]["month_backup"]["format"] == "compact"
+    assert find_backup(get_month_backup_base(base_dir, 2025, 12)).endswith(".vnb")
+    assert find_backup(get_day_backup_base(base_dir, 2026, 3, 1)).endswith(".vnb")
+
+    # 已处理的文件由 manifest 判定，再次执行不做任何改动
+    assert apply_retention(base_dir, policy, TODAY) == {
+        "months": 0,
+        "pruned": 0,
+        "downsampled": 0,
+        "journals": 0,
+        "failed": 0,
+    }
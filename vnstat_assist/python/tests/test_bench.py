@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from bench.run_bench import SCALES, bench_filters, compare
+from bench.synthetic import generate_document
+
+END = datetime(2026, 3, 20)
+
+
+def test_generate_document_is_deterministic_and_consistent():
+    doc = generate_document(interfaces=2, years=0.1, end=END, seed=7)
+    assert doc == generate_document(interfaces=2, years=0.1, end=END, seed=7)
+    assert doc != generate_document(interfaces=2, years=0.1, end=END, seed=8)
+    assert [i["name"] for i in doc["interfaces"]] == ["eth0", "eth1"]
+
+    traffic = doc["interfaces"][0]["traffic"]
+    # 五分钟条目默认只保留最近 2 天，天条目之和与小时条目之和一致
+    first = datetime(**traffic["fiveminute"][0]["date"])
+    assert END - timedelta(days=2) <= first < END
+    assert sum(e["rx"] for e in traffic["day"]) == sum(e["rx"] for e in traffic["hour"])
+    assert traffic["total"]["rx"] == sum(e["rx"] for e in traffic["year"])
+
+
+def test_bench_filters_covers_store_hot_path():
+    doc = generate_document(end=END, **SCALES["small"])
+    days = [datetime(**e["date"]) for e in doc["interfaces"][0]["traffic"]["day"]]
+    results = bench_filters(doc, days, partition_days=10, repeat=1)
+    assert set(results) == {
+        "store_build",
+        "store_filter_day",
+        "store_filter_month",
+        "store_query_hour_month",
+        "store_partition_10_days",
+    }
+    assert all(stats["runs"] == 1 for stats in results.values())
+
+
+def test_compare_flags_regressions():
+    baseline = {"results": {"a": {"median_ms": 1.0}, "b": {"median_ms": 1.0}}}
+    current = {"results": {"a": {"median_ms": 1.5}, "b": {"median_ms": 1.0}}}
+    lines = compare(current, baseline)
+    assert "回退" in lines[1] and "回退" not in lines[2]
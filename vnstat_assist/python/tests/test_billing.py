@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backup.billing import billing_cycle, cycle_bounds, cycle_containing
+from backup.history_db import HistoryDB
+from backup.traffic_store import TrafficStore
+from tests.conftest import make_entry
+
+DATE = {"year": 2026, "month": 3, "day": 1}
+
+
+def _sample_doc():
+    """3月1日 00:00 起的 20 个五分钟样本：rx 为 300*i 字节，tx 为 150*(21-i) 字节"""
+    fiveminute = [
+        make_entry(
+            DATE,
+            300 * i,
+            150 * (21 - i),
+            {"hour": (i - 1) * 5 // 60, "minute": (i - 1) * 5 % 60},
+        )
+        for i in range(1, 21)
+    ]
+    day = [make_entry(DATE, 63000, 31500)]
+    return {
+        "interfaces": [
+            {"name": "eth0", "traffic": {"fiveminute": fiveminute, "day": day}}
+        ]
+    }
+
+
+def test_p95_matches_hand_computed_sample():
+    """最近秩 P95：20 个样本取第 19 小的值，速率 = 字节 * 8 / 300 秒
+
+    rx 第19小为 5700 字节 -> 152 bit/s；tx 第19小为 2850 字节 -> 76 bit/s；
+    逐点较大值依次为 3000,2850,...,2100(i=7),2400,...,6000，第19小为 5700 -> 152 bit/s
+    P99 取最大值：rx 6000 -> 160，tx 3000 -> 80，较大值 6000 -> 160
+    """
+    report = billing_cycle(
+        "eth0",
+        2026,
+        3,
+        start_day=1,
+        store=TrafficStore(_sample_doc()),
+        now=datetime(2026, 3, 1, 12),
+    )
+    assert report["p95"] == {"rx_bps": 152, "tx_bps": 76, "max_bps": 152}
+    assert report["p99"] == {"rx_bps": 160, "tx_bps": 80, "max_bps": 160}
+    assert report["samples"] == 20
+    assert report["expected_samples"] == 12 * 12
+    assert report["usage"] == {"rx": 63000, "tx": 31500, "total": 94500}
+    assert report["cycle"] == {
+        "start": "2026-03-01",
+        "end": "2026-03-31",
+        "start_day": 1,
+        "closed": False,
+    }
+
+
+def test_quota_projection():
+    report = billing_cycle(
+        "eth0",
+        2026,
+        3,
+        start_day=1,
+        quota=1000000,
+        store=TrafficStore(_sample_doc()),
+        now=datetime(2026, 3, 16, 12),
+    )
+    # 已用 15.5 天 / 31 天，线性外推为两倍
+    assert report["quota"]["used"] == 94500
+    assert report["quota"]["projected"] == 189000
+    assert report["quota"]["remaining"] == 1000000 - 94500
+
+
+def test_cycle_bounds_clamp_start_day_to_month_end():
+    assert cycle_bounds(2026, 2, 31) == (datetime(2026, 2, 28), datetime(2026, 3, 31))
+    assert cycle_bounds(2026, 12, 15) == (datetime(2026, 12, 15), datetime(2027, 1, 15))
+    assert cycle_containing(datetime(2026, 3, 10), 15) == (2026, 2)
+    assert cycle_containing(datetime(2026, 1, 10), 15) == (2025, 12)
+    with pytest.raises(ValueError):
+        cycle_bounds(2026, 3, 0)
+
+
+def _february_doc(rx=300):
+    """2026 年 2 月完整的五分钟样本，每个样本 rx 字节"""
+    fiveminute = []
+    moment = datetime(2026, 2, 1)
+    while moment < datetime(2026, 3, 1):
+        date = {"year": moment.year, "month": moment.month, "day": moment.day}
+        time = {"hour": moment.hour, "minute": moment.minute}
+        fiveminute.append(make_entry(date, rx, 0, time))
+        moment += timedelta(minutes=5)
+    return {"interfaces": [{"name": "eth0", "traffic": {"fiveminute": fiveminute}}]}
+
+
+def _february(history):
+    return billing_cycle(
+        "eth0", 2026, 2, start_day=1, history=history, now=datetime(2026, 10, 18)
+    )
+
+
+def test_incomplete_closed_cycle_is_not_cached(tmp_path):
+    history = HistoryDB(str(tmp_path / "history.db"))
+    first = _february(history)
+    assert first["samples"] == 0
+    assert first["expected_samples"] == 28 * 288
+    assert first["cached"] is False
+    assert _february(history)["cached"] is False
+
+    # 之后导入的数据能够生效
+    history.ingest(_february_doc())
+    report = _february(history)
+    assert report["samples"] == 28 * 288
+    assert report["p95"]["rx_bps"] == 8
+    assert _february(history)["cached"] is True
+
+
+def test_ingest_invalidates_cached_cycle(tmp_path):
+    history = HistoryDB(str(tmp_path / "history.db"))
+    history.ingest(_february_doc())
+    assert _february(history)["p95"]["rx_bps"] == 8
+    assert _february(history)["cached"] is True
+
+    # 其他周期的数据不影响已缓存的周期
+    march = make_entry({"year": 2026, "month": 3, "day": 1}, 1, 1)
+    history.ingest({"interfaces": [{"name": "eth0", "traffic": {"day": [march]}}]})
+    assert _february(history)["cached"] is True
+
+    history.ingest(_february_doc(rx=600))
+    report = _february(history)
+    assert report["cached"] is False
+    assert report["p95"]["rx_bps"] == 16
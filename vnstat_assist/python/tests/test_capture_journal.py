@@ -0,0 +1,124 @@
+import copy
+from datetime import datetime
+
+from backup.backup_format import read_backup, write_backup
+from backup.capture_journal import append_snapshot, compact_day, compact_journal
+from backup.traffic_store import TrafficStore, entry_date_key, pack_date_key
+from backup.vnstat_backup import (
+    ensure_month_dir,
+    get_day_backup_base,
+    get_month_backup_base,
+)
+from tests.conftest import make_entry
+
+DAY = (2026, 3, 1)
+DATE = {"year": 2026, "month": 3, "day": 1}
+
+
+def _hour(hour, rx):
+    return make_entry(DATE, rx, rx, {"hour": hour})
+
+
+def _doc(hours):
+    return {
+        "interfaces": [
+            {
+                "name": "eth0",
+                "traffic": {"hour": hours, "day": [make_entry(DATE, 0, 0)]},
+            }
+        ]
+    }
+
+
+def _rows(hours):
+    return {
+        "eth0": {
+            "hour": {pack_date_key(entry_date_key(e, 4)): e for e in hours},
+        }
+    }
+
+
+def _hours(data):
+    return {
+        e["time"]["hour"]: e["rx"] for e in data["interfaces"][0]["traffic"]["hour"]
+    }
+
+
+def test_compact_day_merges_missing_entries_into_existing_backups(tmp_path):
+    base_dir = str(tmp_path)
+    ensure_month_dir(base_dir, 2026, 3)
+    # 天备份写于 20 点之前；日志中有 20-23 点及一个与已有条目冲突的 10 点
+    existing = _doc([_hour(h, 100) for h in range(20)])
+    write_backup(get_day_backup_base(base_dir, *DAY), existing)
+    write_backup(get_month_backup_base(base_dir, 2026, 3), copy.deepcopy(existing))
+    rows = _rows([_hour(h, 200) for h in (10, 20, 21, 22, 23)])
+
+    data, created = compact_day(base_dir, TrafficStore({"interfaces": []}), rows, DAY)
+    assert created is False
+    expected = {h: 100 for h in range(20)}
+    expected.update({h: 200 for h in range(20, 24)})
+    assert _hours(data) == expected
+    assert _hours(read_backup(get_day_backup_base(base_dir, *DAY))) == expected
+    assert _hours(read_backup(get_month_backup_base(base_dir, 2026, 3))) == expected
+
+    # 再次压实相同的日志不再产生变化
+    assert compact_day(base_dir, TrafficStore({"interfaces": []}), rows, DAY) == (
+        None,
+        False,
+    )
+
+
+def test_compact_day_skips_dimensions_removed_by_retention(tmp_path):
+    base_dir = str(tmp_path)
+    ensure_month_dir(base_dir, 2026, 3)
+    downsampled = _doc([_hour(h, 100) for h in range(24)])
+    downsampled["retention"] = {"tier": "hourly"}
+    write_backup(get_day_backup_base(base_dir, *DAY), downsampled)
+    rows = {
+        "eth0": {
+            "fiveminute": {
+                pack_date_key((2026, 3, 1, 0, 0)): make_entry(
+                    DATE, 1, 1, {"hour": 0, "minute": 0}
+                )
+            }
+        }
+    }
+
+    assert compact_day(base_dir, TrafficStore({"interfaces": []}), rows, DAY) == (
+        None,
+        False,
+    )
+    stored = read_backup(get_day_backup_base(base_dir, *DAY))
+    assert "fiveminute" not in stored["interfaces"][0]["traffic"]
+
+
+def test_compact_day_creates_missing_backup_from_snapshot(tmp_path):
+    base_dir = str(tmp_path)
+    snapshot = _doc([_hour(h, 100) for h in range(12)])
+    rows = _rows([_hour(h, 300) for h in range(12, 24)])
+
+    data, created = compact_day(base_dir, TrafficStore(snapshot), rows, DAY)
+    assert created is True
+    assert _hours(data) == {h: 100 if h < 12 else 300 for h in range(24)}
+    assert read_backup(get_day_backup_base(base_dir, *DAY)) == data
+
+
+def test_journal_append_and_compact_round_trip(tmp_path):
+    base_dir = str(tmp_path)
+    ensure_month_dir(base_dir, 2026, 3)
+    write_backup(
+        get_day_backup_base(base_dir, *DAY), _doc([_hour(h, 100) for h in range(6)])
+    )
+    # 快照最新的条目可能尚未结束，不写入日志
+    snapshot = _doc([_hour(h, 100) for h in range(24)])
+    snapshot["interfaces"][0]["traffic"]["hour"].append(
+        make_entry({"year": 2026, "month": 3, "day": 2}, 5, 5, {"hour": 0})
+    )
+    store = TrafficStore(snapshot)
+    assert append_snapshot(base_dir, store) == 24
+    assert append_snapshot(base_dir, store) == 0
+
+    report = compact_journal(base_dir, store, datetime(2026, 3, 2, 1))
+    assert report == {"compacted": ["20260301"], "failed": []}
+    merged = read_backup(get_day_backup_base(base_dir, *DAY))
+    assert _hours(merged) == {h: 100 for h in range(24)}
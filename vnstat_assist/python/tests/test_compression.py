@@ -0,0 +1,110 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from backup import vnstat_backup
+from backup.backup_format import SIDECAR_EXT, write_backup
+from backup.traffic_store import TrafficStore
+from backup.vnstat_backup import ensure_month_dir, get_day_backup_base
+from tests.conftest import serve_document
+
+DAY = (2026, 3, 13)
+
+
+@pytest.fixture
+def api(monkeypatch, snapshot_doc):
+    from api import api_server
+
+    serve_document(monkeypatch, api_server.DEFAULT_UPSTREAM, snapshot_doc)
+    return api_server
+
+
+@pytest.fixture
+def day_backup(snapshot_doc):
+    ensure_month_dir(vnstat_backup.JSON_DIR, *DAY[:2])
+    base = get_day_backup_base(vnstat_backup.JSON_DIR, *DAY)
+    data = TrafficStore(snapshot_doc).partition_by_day([DAY])[DAY]
+    write_backup(base, data, "json")
+    return base, data
+
+
+def test_proxy_negotiates_gzip(api, snapshot_doc):
+    client = api.app.test_client()
+    plain = client.get("/json.cgi")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    compressed = client.get("/json.cgi", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == plain.data
+    assert json.loads(plain.data) == snapshot_doc
+    # 不同编码的表示使用不同的 ETag
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+
+
+def test_brotli_preferred_only_when_installed(api, monkeypatch):
+    client = api.app.test_client()
+    monkeypatch.setattr(api, "brotli", None)
+    response = client.get("/json.cgi", headers={"Accept-Encoding": "br"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/json.cgi", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_brotli_response():
+    brotli = pytest.importorskip("brotli")
+    from api import api_server
+
+    with api_server.app.test_request_context(headers={"Accept-Encoding": "br, gzip"}):
+        assert api_server.preferred_encoding() == "br"
+        body = b"x" * 4096
+        assert brotli.decompress(api_server.compress_body(body, "br")) == body
+
+
+def test_small_responses_are_not_compressed(api):
+    # 小于压缩阈值的响应原样返回
+    response = api.app.test_client().get(
+        "/api/hosts", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert len(response.data) < api.COMPRESS_MIN_SIZE
+    assert "Content-Encoding" not in response.headers
+
+
+def test_backup_served_from_sidecar(api, day_backup):
+    base, data = day_backup
+    client = api.app.test_client()
+    url = "/backups/" + "".join(f"{v:02d}" for v in DAY)
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    with open(base + SIDECAR_EXT, "rb") as f:
+        assert response.data == f.read()
+    assert json.loads(gzip.decompress(response.data)) == data
+
+    plain = client.get(url)
+    assert "Content-Encoding" not in plain.headers
+    assert json.loads(plain.data) == data
+
+
+def test_stale_sidecar_is_not_served(api, day_backup):
+    base, data = day_backup
+    url = "/backups/" + "".join(f"{v:02d}" for v in DAY)
+    # 备份被外部改写，预压缩文件早于备份文件
+    stale = json.dumps({"interfaces": []}).encode()
+    with open(base + SIDECAR_EXT, "wb") as f:
+        f.write(gzip.compress(stale))
+    sidecar_mtime = os.stat(base + SIDECAR_EXT).st_mtime_ns
+    os.utime(base + ".json", ns=(sidecar_mtime + 10**9, sidecar_mtime + 10**9))
+
+    response = api.app.test_client().get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    body = response.data
+    if response.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    assert json.loads(body) == data
+    # 解析后补写预压缩文件
+    with open(base + SIDECAR_EXT, "rb") as f:
+        assert json.loads(gzip.decompress(f.read())) == data
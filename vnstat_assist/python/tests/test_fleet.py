@@ -0,0 +1,156 @@
+import json
+import os
+
+import pytest
+
+from backup import vnstat_backup
+from backup.backup_format import write_backup
+from backup.upstream_client import get_upstream_hosts
+from backup.vnstat_backup import (
+    ensure_month_dir,
+    get_day_backup_base,
+    organize_all_backups,
+)
+from tests.conftest import make_entry, serve_document
+
+DATE = {"year": 2026, "month": 3, "day": 1}
+
+
+def _doc(*interfaces):
+    return {
+        "interfaces": [
+            {
+                "name": name,
+                "traffic": {
+                    "day": [make_entry(DATE, rx, tx)],
+                    "hour": [make_entry(DATE, rx, tx, {"hour": 0})],
+                },
+            }
+            for name, rx, tx in interfaces
+        ]
+    }
+
+
+@pytest.mark.parametrize(
+    "env, expected",
+    [
+        ({"VNSTAT_API_URL": "http://a/json.cgi"}, {"default": "http://a/json.cgi"}),
+        (
+            {"VNSTAT_HOSTS": " edge=http://e/json.cgi , core=https://c/json.cgi,"},
+            {"edge": "http://e/json.cgi", "core": "https://c/json.cgi"},
+        ),
+    ],
+)
+def test_get_upstream_hosts(monkeypatch, env, expected):
+    monkeypatch.delenv("VNSTAT_HOSTS", raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    hosts = get_upstream_hosts()
+    assert hosts == expected
+    assert list(hosts) == list(expected)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "edge",
+        "edge=e/json.cgi",
+        "../x=http://e/json.cgi",
+        "a=http://a/json.cgi,a=http://b/json.cgi",
+        ",",
+    ],
+)
+def test_get_upstream_hosts_rejects_invalid(monkeypatch, value):
+    monkeypatch.setenv("VNSTAT_HOSTS", value)
+    with pytest.raises(ValueError):
+        get_upstream_hosts()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """默认上游加一个 edge 上游及一个不可用的 down 上游"""
+    from api import api_server
+
+    serve_document(monkeypatch, api_server.DEFAULT_UPSTREAM, _doc(("eth0", 100, 10)))
+    edge = api_server.UpstreamHost("edge", "http://127.0.0.1:9/edge.cgi")
+    serve_document(monkeypatch, edge, _doc(("eth0", 1, 2), ("wlan0", 3, 4)))
+    down = api_server.UpstreamHost("down", "http://127.0.0.1:9/down.cgi")
+
+    def unavailable():
+        raise RuntimeError("connection refused")
+
+    monkeypatch.setattr(
+        down, "cache", api_server.SnapshotCache(unavailable, ttl=60, stale_seconds=0)
+    )
+    monkeypatch.setitem(api_server.HOSTS, "edge", edge)
+    monkeypatch.setitem(api_server.HOSTS, "down", down)
+    return api_server
+
+
+def test_host_parameter_selects_upstream(api):
+    client = api.app.test_client()
+    assert client.get("/api/hosts").get_json()["hosts"] == ["default", "edge", "down"]
+    default = json.loads(client.get("/json.cgi").data)
+    edge = json.loads(client.get("/json.cgi?host=edge").data)
+    assert [i["name"] for i in default["interfaces"]] == ["eth0"]
+    assert [i["name"] for i in edge["interfaces"]] == ["eth0", "wlan0"]
+    assert client.get("/json.cgi?host=down").status_code == 500
+
+
+def test_host_backups_are_separate(api):
+    edge_dir = vnstat_backup.get_host_backup_dir("edge")
+    assert edge_dir != vnstat_backup.JSON_DIR
+    ensure_month_dir(edge_dir, 2026, 4)
+    write_backup(get_day_backup_base(edge_dir, 2026, 4, 1), _doc(("eth0", 7, 8)))
+
+    client = api.app.test_client()
+    response = client.get("/backups/20260401?host=edge")
+    assert response.status_code == 200
+    assert response.get_json()["interfaces"][0]["traffic"]["day"][0]["rx"] == 7
+    assert client.get("/backups/20260401").status_code == 500
+
+
+def test_unknown_host_requires_auth_first(api, monkeypatch):
+    client = api.app.test_client()
+    assert client.get("/json.cgi?host=nope").status_code == 404
+
+    monkeypatch.setattr(api, "AUTH_ENABLED", 1)
+    # 未登录时已知与未知上游的响应一致，无法借此探测上游名称
+    assert client.get("/json.cgi?host=nope").status_code == 401
+    assert client.get("/json.cgi?host=edge").status_code == 401
+    token = api.JWTManager.generate_token("username")
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/json.cgi?host=nope", headers=headers).status_code == 404
+    assert client.get("/json.cgi?host=edge", headers=headers).status_code == 200
+
+
+def test_fleet_sums_hosts_and_reports_failures(api):
+    body = api.app.test_client().get("/api/fleet?from=20260301").get_json()
+    assert {h["name"]: h["total"] for h in body["hosts"]} == {
+        "default": {"rx": 100, "tx": 10},
+        "edge": {"rx": 4, "tx": 6},
+    }
+    edge = next(h for h in body["hosts"] if h["name"] == "edge")
+    assert [i["name"] for i in edge["interfaces"]] == ["eth0", "wlan0"]
+    assert list(body["errors"]) == ["down"]
+    assert body["series"] == [
+        {"date": {"year": 2026, "month": 3, "day": 1}, "rx": 104, "tx": 16}
+    ]
+    assert body["total"] == {"rx": 104, "tx": 16}
+
+    hourly = api.app.test_client().get("/api/fleet?bucket=hour&from=20260301")
+    assert hourly.get_json()["total"] == {"rx": 104, "tx": 16}
+
+
+def test_organize_all_backups_covers_removed_hosts(monkeypatch):
+    """配置中已移除的上游，其遗留的平铺备份同样被整理进月目录"""
+    monkeypatch.setenv("VNSTAT_HOSTS", "core=http://c/json.cgi")
+    removed_dir = vnstat_backup.get_host_backup_dir("removed")
+    os.makedirs(removed_dir, exist_ok=True)
+    flat = os.path.join(removed_dir, "vnstat_20260305.json")
+    with open(flat, "w") as f:
+        json.dump(_doc(("eth0", 1, 1)), f)
+
+    organize_all_backups()
+    assert not os.path.exists(flat)
+    assert os.path.exists(os.path.join(removed_dir, "202603", "vnstat_20260305.json"))
@@ -0,0 +1,113 @@
+from backup.backup_format import write_backup
+from backup.history_db import HistoryDB, import_tree
+from backup.traffic_store import TrafficStore, pack_date_key
+from backup.vnstat_backup import (
+    ensure_month_dir,
+    get_day_backup_base,
+    update_month_rollup,
+)
+from tests.conftest import make_entry
+
+DATE = {"year": 2026, "month": 3, "day": 1}
+
+
+def _doc(hours, name="eth0", top=()):
+    traffic = {"hour": list(hours), "top": list(top)}
+    return {"interfaces": [{"name": name, "alias": "wan", "traffic": traffic}]}
+
+
+def _hour(hour, rx, day=1):
+    return make_entry({**DATE, "day": day}, rx, rx * 2, {"hour": hour})
+
+
+def test_ingest_overwrites_same_date_and_queries_range(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    assert db.ingest(_doc(_hour(h, 10) for h in range(24))) == 24
+    db.ingest(_doc([_hour(5, 99)]))
+
+    result = db.query_interface_range(
+        "eth0", "hour", (2026, 3, 1, 4, 0), (2026, 3, 1, 6, 59)
+    )
+    assert [(e["time"]["hour"], e["rx"]) for e in result["entries"]] == [
+        (4, 10),
+        (5, 99),
+        (6, 10),
+    ]
+    assert result["total"] == {"rx": 119, "tx": 238}
+    rows = db.iter_rows("eth0", "hour", (2026, 3, 1, 22, 0), (2026, 3, 1, 23, 59))
+    assert list(rows) == [
+        (pack_date_key((2026, 3, 1, 22)), 10, 20),
+        (pack_date_key((2026, 3, 1, 23)), 10, 20),
+    ]
+    assert db.query_interface_range("eth9", "hour", (2026,), (2026,)) is None
+    assert db.interface_names() == ["eth0"]
+    assert db.has_interface("eth0")
+
+
+def test_query_matches_traffic_store(tmp_path, snapshot_doc):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    db.ingest(snapshot_doc)
+    store = TrafficStore(snapshot_doc)
+    for granularity, start, end in [
+        ("fiveminute", (2026, 3, 19, 6, 0), (2026, 3, 19, 8, 30)),
+        ("hour", (2026, 3, 17, 0, 0), (2026, 3, 19, 23, 59)),
+        ("day", (2026, 1, 1, 0, 0), (2026, 2, 28, 23, 59)),
+        ("month", (2025, 6, 1, 0, 0), (2026, 3, 31, 23, 59)),
+    ]:
+        expected = store.query_interface_range("eth0", granularity, start, end)
+        assert db.query_interface_range("eth0", granularity, start, end) == expected
+
+
+def test_top_is_ordered_by_traffic(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    top = [
+        make_entry({**DATE, "day": day}, rx, 0, entry_id=day)
+        for day, rx in ((1, 5), (2, 50), (3, 20))
+    ]
+    db.ingest(_doc([], top=top))
+    result = db.query_interface_range("eth0", "top", (2026,), (2026, 12, 31))
+    assert [e["rx"] for e in result["entries"]] == [50, 20, 5]
+
+
+def test_import_tree_skips_rollups_and_corrupt_files(tmp_path):
+    base_dir = str(tmp_path / "json")
+    ensure_month_dir(base_dir, 2026, 3)
+    days = [_doc([_hour(h, 1, day=day) for h in range(24)]) for day in (1, 2)]
+    for day, data in zip((1, 2), days):
+        write_backup(get_day_backup_base(base_dir, 2026, 3, day), data)
+    update_month_rollup(base_dir, 2026, 3, *days)
+    with open(get_day_backup_base(base_dir, 2026, 3, 3) + ".json", "w") as f:
+        f.write("{broken")
+
+    db = HistoryDB(str(tmp_path / "history.db"))
+    assert import_tree(db, base_dir) == (2, 48)
+    assert db.coverage() == [
+        {
+            "iface": "eth0",
+            "granularity": "hour",
+            "count": 48,
+            "first": 2026030100_00,
+            "last": 2026030223_00,
+        }
+    ]
+
+
+def test_history_routes(tmp_path, monkeypatch):
+    from api import api_server
+
+    db = HistoryDB(str(tmp_path / "history.db"))
+    db.ingest(_doc(_hour(h, 10) for h in range(24)))
+    monkeypatch.setattr(api_server.DEFAULT_UPSTREAM, "history", db)
+    client = api_server.app.test_client()
+
+    response = client.get(
+        "/api/traffic?source=history&granularity=hour&from=2026030104&to=2026030106"
+    )
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["iface"], body["source"]) == ("eth0", "history")
+    assert [e["time"]["hour"] for e in body["entries"]] == [4, 5, 6]
+    assert body["total"] == {"rx": 30, "tx": 60}
+
+    coverage = client.get("/api/history/coverage").get_json()["coverage"]
+    assert [(c["granularity"], c["count"]) for c in coverage] == [("hour", 24)]
@@ -0,0 +1,148 @@
+import copy
+import json
+import time
+
+import pytest
+
+from backup.traffic_store import TrafficStore, diff_stores
+from tests.conftest import make_entry, serve_document
+
+
+def _hour(hour, rx, tx):
+    return make_entry({"year": 2026, "month": 3, "day": 1}, rx, tx, {"hour": hour})
+
+
+def _doc(hours, total=None):
+    traffic = {"hour": list(hours)}
+    if total is not None:
+        traffic["total"] = total
+    return {"interfaces": [{"name": "eth0", "updated": {"n": 1}, "traffic": traffic}]}
+
+
+def test_diff_stores_reports_only_changed_entries():
+    hours = [_hour(h, 100, 100) for h in range(4)]
+    old = _doc(hours, total={"rx": 400, "tx": 400})
+    new = copy.deepcopy(old)
+    new_hours = new["interfaces"][0]["traffic"]["hour"]
+    new_hours[3]["rx"] = 150
+    new_hours.append(_hour(4, 10, 20))
+    new["interfaces"][0]["traffic"]["total"] = {"rx": 460, "tx": 420}
+    new["interfaces"][0]["updated"] = {"n": 2}
+
+    delta = diff_stores(TrafficStore(old), TrafficStore(new))
+    assert delta == [
+        {
+            "name": "eth0",
+            "updated": {"n": 2},
+            "traffic": {"hour": [new_hours[3], new_hours[4]]},
+            "total": {"rx": 460, "tx": 420},
+        }
+    ]
+
+
+def test_diff_stores_unchanged_and_interface_change():
+    doc = _doc([_hour(0, 1, 1)], total={"rx": 1, "tx": 1})
+    assert diff_stores(TrafficStore(doc), TrafficStore(copy.deepcopy(doc))) == []
+
+    renamed = copy.deepcopy(doc)
+    renamed["interfaces"][0]["name"] = "eth1"
+    assert diff_stores(TrafficStore(doc), TrafficStore(renamed)) is None
+
+
+class ScriptedCache:
+    """返回测试设置的快照，未调用 push 时始终返回同一个快照对象"""
+
+    def __init__(self, doc):
+        self.push(doc)
+
+    def push(self, doc):
+        from api.api_server import Snapshot
+
+        self.snapshot = Snapshot(json.dumps(doc).encode(), doc)
+
+    def get(self):
+        return self.snapshot, "HIT"
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cache():
+    return ScriptedCache(_doc([_hour(h, 100, 100) for h in range(3)]))
+
+
+@pytest.fixture
+def feed(cache):
+    from api.api_server import LiveFeed
+
+    # 轮询线程只做首次轮询（建立基准），之后由测试手动轮询
+    return LiveFeed(cache, interval=60, max_clients=2)
+
+
+def _get(q):
+    event, data = q.get_nowait()
+    return event, json.loads(data)
+
+
+def test_live_feed_publishes_deltas_and_resets(feed, cache):
+    q = feed.subscribe()
+    _wait_for(lambda: feed._snapshot is not None)
+    feed._poll()
+    assert q.empty()
+
+    hours = [_hour(h, 100, 100) for h in range(3)] + [_hour(3, 5, 6)]
+    cache.push(_doc(hours))
+    feed._poll()
+    event, payload = _get(q)
+    assert event == "delta"
+    assert payload["seq"] == 1
+    assert payload["interfaces"][0]["traffic"] == {"hour": [hours[3]]}
+
+    renamed = _doc(hours)
+    renamed["interfaces"][0]["name"] = "eth1"
+    cache.push(renamed)
+    feed._poll()
+    assert _get(q) == ("reset", {"seq": 2})
+
+    assert feed.subscribe() is not None
+    assert feed.subscribe() is None
+
+
+def test_slow_subscriber_gets_reset_instead_of_backlog(feed):
+    q = feed.subscribe()
+    for i in range(feed.QUEUE_SIZE + 3):
+        feed._publish("delta", {"interfaces": [{"name": "eth0", "n": i}]})
+    # 队列写满后清空积压，只保留一个 reset，之后的增量继续排队
+    assert _get(q) == ("reset", {"seq": feed.QUEUE_SIZE + 1})
+    assert [_get(q)[1]["seq"] for _ in range(2)] == [
+        feed.QUEUE_SIZE + 2,
+        feed.QUEUE_SIZE + 3,
+    ]
+    assert q.empty()
+
+
+def test_live_route_streams_hello_and_limits_subscribers(monkeypatch):
+    from api import api_server
+
+    host = api_server.DEFAULT_UPSTREAM
+    serve_document(monkeypatch, host, _doc([_hour(0, 1, 1)]))
+    feed = api_server.LiveFeed(host.cache, interval=60, max_clients=1)
+    monkeypatch.setattr(host, "live", feed)
+    client = api_server.app.test_client()
+
+    response = client.get("/api/live", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    first = next(response.response)
+    if isinstance(first, bytes):
+        first = first.decode()
+    assert "event: hello" in first
+    assert client.get("/api/live").status_code == 503
+
+    response.close()
+    _wait_for(lambda: not feed._subscribers)
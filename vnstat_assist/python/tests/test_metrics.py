@@ -0,0 +1,170 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from backup.metrics import Counter, Gauge, Histogram, Registry, collect, render
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("VNA_METRICS_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+    registry.role = "api"
+    return registry
+
+
+def _metrics(registry):
+    requests = Counter("test_requests_total", "请求数", registry=registry)
+    clients = Gauge("test_clients", "连接数", registry=registry)
+    latency = Histogram("test_seconds", "耗时", buckets=(0.1, 1), registry=registry)
+    return requests, clients, latency
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _write(metrics_dir, role, pid, registry, updated):
+    snapshot = registry.snapshot()
+    snapshot.update(pid=pid, role=role, updated=updated)
+    path = metrics_dir / f"{role}_{pid}.json"
+    path.write_text(json.dumps(snapshot))
+    return path
+
+
+def _samples(merged, name):
+    return merged[name]["samples"]
+
+
+def test_render_prometheus_text(registry):
+    requests, clients, latency = _metrics(registry)
+    requests.inc(route="/json.cgi", status="200")
+    requests.inc(2, route="/json.cgi", status="200")
+    clients.set(3)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, route="/a")
+
+    text = render(collect(registry))
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/json.cgi",status="200"} 3' in text
+    assert "test_clients 3" in text
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{route="/a"} 3' in text
+
+
+def test_snapshot_written_only_when_changed(metrics_dir, registry):
+    requests, _, _ = _metrics(registry)
+    path = registry.snapshot_path()
+    registry.write_snapshot()
+    first = os.stat(path).st_mtime_ns
+    time.sleep(0.01)
+    registry.write_snapshot()
+    assert os.stat(path).st_mtime_ns == first
+
+    requests.inc()
+    registry.write_snapshot()
+    with open(path) as f:
+        snapshot = json.load(f)
+    assert snapshot["metrics"]["test_requests_total"]["samples"] == [[{}, 1]]
+
+
+def test_collect_merges_live_processes(metrics_dir, registry):
+    requests, clients, latency = _metrics(registry)
+    requests.inc(route="/a")
+    clients.set(1)
+    latency.observe(0.05)
+
+    # 另一个存活进程（父进程）写出的快照：计数器与直方图相加，仪表取最近更新的值
+    other = Registry()
+    other_requests, other_clients, other_latency = _metrics(other)
+    other_requests.inc(4, route="/a")
+    other_clients.set(7)
+    other_latency.observe(0.5)
+    _write(metrics_dir, "scheduler", os.getppid(), other, time.time() + 60)
+
+    merged = collect(registry)
+    assert _samples(merged, "test_requests_total") == {(("route", "/a"),): 5}
+    assert _samples(merged, "test_clients") == {(): 7}
+    assert _samples(merged, "test_seconds")[()] == {
+        "buckets": [1, 1],
+        "sum": 0.55,
+        "count": 2,
+    }
+
+
+def test_dead_process_snapshots_are_folded_once(metrics_dir, registry):
+    requests, clients, _ = _metrics(registry)
+    requests.inc()
+
+    dead = Registry()
+    dead_requests, dead_clients, _ = _metrics(dead)
+    dead_requests.inc(10)
+    dead_clients.set(99)
+    dead_pid = _dead_pid()
+    path = _write(metrics_dir, "api", dead_pid, dead, time.time())
+    stale = path.read_text()
+
+    merged = collect(registry)
+    assert _samples(merged, "test_requests_total") == {(): 11}
+    # 已退出进程的仪表不再输出
+    assert _samples(merged, "test_clients") == {}
+    assert not path.exists()
+    assert (metrics_dir / "api_retired.json").exists()
+
+    # 再次合并时 retired 的累计值不回退也不重复
+    assert _samples(collect(registry), "test_requests_total") == {(): 11}
+
+    # 上次并入后未能删除的同一快照不重复累加
+    path.write_text(stale)
+    assert _samples(collect(registry), "test_requests_total") == {(): 11}
+    assert not path.exists()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from api import api_server
+
+    monkeypatch.delenv("VNA_METRICS_TOKEN", raising=False)
+    monkeypatch.delenv("VNA_METRICS_ENABLE", raising=False)
+    return api_server
+
+
+def test_metrics_route_counts_requests(api):
+    client = api.app.test_client()
+    client.get("/api/hosts")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert 'route="/api/hosts"' in response.get_data(as_text=True)
+
+
+def test_metrics_route_auth(api, monkeypatch):
+    client = api.app.test_client()
+    monkeypatch.setenv("VNA_METRICS_TOKEN", "scrape")
+    assert client.get("/metrics").status_code == 401
+    headers = {"Authorization": "Bearer scrape"}
+    assert client.get("/metrics", headers=headers).status_code == 200
+
+    # 启用认证时也接受登录 Token
+    monkeypatch.setattr(api, "AUTH_ENABLED", 1)
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=headers).status_code == 200
+    token = api.JWTManager.generate_token("username")
+    login = {"Authorization": f"Bearer {token}"}
+    assert client.get("/metrics", headers=login).status_code == 200
+
+    monkeypatch.setenv("VNA_METRICS_ENABLE", "0")
+    assert client.get("/metrics", headers=headers).status_code == 404
@@ -0,0 +1,97 @@
+import copy
+
+from backup.backup_format import write_backup
+from backup.traffic_store import TrafficStore
+from backup.vnstat_backup import (
+    apply_day_to_rollup,
+    ensure_month_dir,
+    get_day_backup_base,
+    load_month_rollup,
+    merge_day_backups_to_month,
+    update_month_rollup,
+)
+from tests.conftest import make_entry
+
+DAYS = [(2026, 2, day) for day in range(1, 29)]
+
+
+def _day_doc(day, rx, month=None):
+    date = {"year": 2026, "month": 2, "day": day}
+    traffic = {"day": [make_entry(date, rx, rx // 2)]}
+    if month is not None:
+        traffic["month"] = [make_entry({"year": 2026, "month": 2}, *month)]
+    return {"interfaces": [{"name": "eth0", "traffic": traffic}]}
+
+
+def test_incremental_rollup_matches_rebuild(tmp_path, snapshot_doc):
+    base_dir = str(tmp_path)
+    parts = TrafficStore(snapshot_doc).partition_by_day(DAYS)
+    for day in DAYS:
+        ensure_month_dir(base_dir, *day[:2])
+        write_backup(get_day_backup_base(base_dir, *day), parts[day])
+        update_month_rollup(base_dir, 2026, 2, parts[day])
+
+    rollup = load_month_rollup(base_dir, 2026, 2)
+    assert rollup == merge_day_backups_to_month(base_dir, 2026, 2)
+    traffic = rollup["interfaces"][0]["traffic"]
+    assert len(traffic["day"]) == len(DAYS)
+    # vnstat 自身的月统计优先于天条目求和
+    (month,) = traffic["month"]
+    assert month["id"] != 0
+    assert month == parts[DAYS[-1]]["interfaces"][0]["traffic"]["month"][0]
+
+
+def test_missing_rollup_is_rebuilt_from_day_backups(tmp_path):
+    base_dir = str(tmp_path)
+    ensure_month_dir(base_dir, 2026, 2)
+    for day in (1, 2):
+        write_backup(get_day_backup_base(base_dir, 2026, 2, day), _day_doc(day, 100))
+
+    rollup = update_month_rollup(base_dir, 2026, 2, _day_doc(3, 100))
+    traffic = rollup["interfaces"][0]["traffic"]
+    # 第 3 天尚无天备份文件，重建时只包含前两天
+    assert [e["date"]["day"] for e in traffic["day"]] == [1, 2]
+    assert load_month_rollup(base_dir, 2026, 2) == rollup
+
+
+def test_apply_day_dedups_and_sums_without_vnstat_month():
+    rollup = {"interfaces": []}
+    for doc in (_day_doc(1, 100), _day_doc(2, 300), _day_doc(2, 400)):
+        apply_day_to_rollup(rollup, copy.deepcopy(doc), 2026, 2)
+
+    traffic = rollup["interfaces"][0]["traffic"]
+    assert [(e["date"]["day"], e["rx"]) for e in traffic["day"]] == [(1, 100), (2, 400)]
+    (month,) = traffic["month"]
+    assert (month["id"], month["rx"], month["tx"]) == (0, 500, 250)
+
+    # vnstat 的月统计一旦出现即取代求和结果，取累计值最大的一条
+    apply_day_to_rollup(rollup, _day_doc(3, 10, month=(900, 90)), 2026, 2)
+    apply_day_to_rollup(rollup, _day_doc(4, 10, month=(800, 80)), 2026, 2)
+    assert [(e["rx"], e["tx"]) for e in traffic["month"]] == [(900, 90)]
+    assert set(rollup["interfaces"][0]) == {
+        "name",
+        "alias",
+        "created",
+        "updated",
+        "traffic",
+    }
+
+
+def test_month_route_serves_rollup_without_internal_fields(monkeypatch, snapshot_doc):
+    from api import api_server
+
+    host = api_server.UpstreamHost("rollup", "http://127.0.0.1:9/rollup.cgi")
+    monkeypatch.setitem(api_server.HOSTS, "rollup", host)
+    parts = TrafficStore(snapshot_doc).partition_by_day(DAYS[:3])
+    for day in DAYS[:3]:
+        ensure_month_dir(host.backup_dir, *day[:2])
+        write_backup(get_day_backup_base(host.backup_dir, *day), parts[day])
+    update_month_rollup(host.backup_dir, 2026, 2, *parts.values())
+
+    response = api_server.app.test_client().get("/backups/month/202602?host=rollup")
+    assert response.status_code == 200
+    interfaces = response.get_json()["interfaces"]
+    assert interfaces
+    for interface in interfaces:
+        assert set(interface) == {"name", "alias", "created", "updated", "traffic"}
+        assert len(interface["traffic"]["day"]) == 3
@@ -0,0 +1,144 @@
+import time
+
+import pytest
+
+from backup.profiling import (
+    Profiler,
+    RequestTimings,
+    begin_request_timings,
+    current_timings,
+    end_request_timings,
+    list_captures,
+    load_capture,
+    start_capture,
+    timed,
+)
+from tests.conftest import serve_document
+
+TOKEN = "admin-token"
+
+
+def test_request_timings_header():
+    timings = RequestTimings()
+    timings.add("upstream", 0.0125)
+    timings.add("parse", 0.001)
+    timings.add("parse", 0.002)
+    assert timings.header(0.02) == (
+        'upstream;dur=12.50, parse;dur=3.00;desc="2x", total;dur=20.00'
+    )
+
+
+def test_nested_phases_record_self_time():
+    with timed("ignored"):
+        pass
+    assert current_timings() is None
+
+    token = begin_request_timings()
+    try:
+        with timed("merge"):
+            with timed("read"):
+                time.sleep(0.05)
+        timings = current_timings()
+    finally:
+        end_request_timings(token)
+    # 外层只记录扣除内层后的自身耗时
+    assert timings.spans["read"][0] >= 0.05
+    assert timings.spans["merge"][0] < 0.05
+    assert current_timings() is None
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("VNA_PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _busy_work():
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        sum(range(1000))
+
+
+def test_start_capture_validates(profile_dir):
+    for kwargs in ({"mode": "perf", "seconds": 1}, {"mode": "cprofile"}):
+        with pytest.raises(ValueError):
+            start_capture(**kwargs)
+    with pytest.raises(ValueError):
+        start_capture("cprofile", seconds=3600)
+
+
+@pytest.mark.parametrize("mode", ["cprofile", "sampling"])
+def test_capture_profiles_requested_number_of_requests(profile_dir, mode):
+    control = start_capture(mode, requests=1, interval=0.001)
+    profiler = Profiler()
+    handle = profiler.begin()
+    assert handle is not None
+    _busy_work()
+    profiler.end(handle)
+    # 已剖析指定数量的请求，之后的请求不再剖析
+    assert profiler.begin() is None
+
+    (capture,) = list_captures()
+    assert capture["id"] == control["id"]
+    assert capture["requests"] == 1
+    assert capture["done"]
+    body, filename = load_capture(control["id"], text=True)
+    assert "_busy_work" in body.decode()
+    if mode == "cprofile":
+        assert filename.endswith(".txt")
+        assert load_capture(control["id"])[1].endswith(".prof")
+    else:
+        assert filename.endswith(".folded")
+
+
+@pytest.fixture
+def api(monkeypatch, profile_dir, snapshot_doc):
+    from api import api_server
+
+    serve_document(monkeypatch, api_server.DEFAULT_UPSTREAM, snapshot_doc)
+    return api_server
+
+
+def test_server_timing_header(api, monkeypatch):
+    client = api.app.test_client()
+    header = client.get("/json.cgi").headers["Server-Timing"]
+    assert header.split(", ")[-1].startswith("total;dur=")
+
+    monkeypatch.setitem(api.CONFIG, "server_timing", 0)
+    assert "Server-Timing" not in client.get("/json.cgi").headers
+
+
+def test_profile_route_requires_admin_token(api, monkeypatch):
+    client = api.app.test_client()
+    monkeypatch.delenv("VNA_PROFILE_TOKEN", raising=False)
+    assert client.get("/debug/profile").status_code == 404
+
+    monkeypatch.setenv("VNA_PROFILE_TOKEN", TOKEN)
+    assert client.get("/debug/profile").status_code == 401
+    # 登录 Token 不能代替管理员 Token
+    login = api.JWTManager.generate_token("username")
+    headers = {"Authorization": f"Bearer {login}"}
+    assert client.get("/debug/profile", headers=headers).status_code == 401
+
+
+def test_profile_route_starts_and_stops_captures(api, monkeypatch):
+    monkeypatch.setenv("VNA_PROFILE_TOKEN", TOKEN)
+    client = api.app.test_client()
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+
+    url = "/debug/profile?mode=sampling&seconds=30"
+    response = client.post(url, headers=headers)
+    assert response.status_code == 201
+    capture_id = response.get_json()["id"]
+    assert client.post(url, headers=headers).status_code == 409
+    status = client.get("/debug/profile", headers=headers).get_json()
+    assert status["active"]["id"] == capture_id
+
+    assert client.delete("/debug/profile", headers=headers).get_json() == {
+        "stopped": capture_id
+    }
+    assert client.delete("/debug/profile", headers=headers).status_code == 404
+    bad = client.post("/debug/profile?mode=perf&seconds=1", headers=headers)
+    assert bad.status_code == 400
+    missing = client.get("/debug/profile/20260101000000_abcdef", headers=headers)
+    assert missing.status_code == 404
@@ -0,0 +1,96 @@
+import pytest
+
+from backup.traffic_store import TrafficStore
+from backup.vnstat_backup import parse_range_bound
+from tests.conftest import make_entry, serve_document
+
+
+def _hour(day, hour, rx, tx):
+    return make_entry({"year": 2026, "month": 3, "day": day}, rx, tx, {"hour": hour})
+
+
+def _doc(hours):
+    return {"interfaces": [{"name": "eth0", "traffic": {"hour": list(hours)}}]}
+
+
+@pytest.mark.parametrize(
+    "value, upper, expected",
+    [
+        ("2026", False, (2026, 1, 1, 0, 0)),
+        ("2026", True, (2026, 12, 31, 23, 59)),
+        ("202602", True, (2026, 2, 28, 23, 59)),
+        ("202402", True, (2024, 2, 29, 23, 59)),
+        ("20240229", False, (2024, 2, 29, 0, 0)),
+        ("2026031008", True, (2026, 3, 10, 8, 59)),
+        ("202603100830", False, (2026, 3, 10, 8, 30)),
+    ],
+)
+def test_parse_range_bound(value, upper, expected):
+    assert parse_range_bound(value, upper) == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "20230230",
+        "20230431",
+        "202613",
+        "20260300",
+        "2026031024",
+        "202603101060",
+        "0000",
+        "2026-03",
+        "20260",
+    ],
+)
+def test_parse_range_bound_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_range_bound(value)
+
+
+def test_query_interface_range_slices_and_sums():
+    store = TrafficStore(_doc(_hour(1, h, h, 2 * h) for h in range(24)))
+    start = parse_range_bound("2026030105")
+    end = parse_range_bound("2026030107", upper=True)
+    result = store.query_interface_range("eth0", "hour", start, end)
+    assert [e["time"]["hour"] for e in result["entries"]] == [5, 6, 7]
+    assert result["total"] == {"rx": 18, "tx": 36}
+    assert store.query_interface_range("eth9", "hour", (2026,), (2026,)) is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from api import api_server
+
+    hours = [_hour(day, h, 10 * h, h) for day in (1, 2) for h in range(24)]
+    serve_document(monkeypatch, api_server.DEFAULT_UPSTREAM, _doc(hours))
+    return api_server.app.test_client()
+
+
+def test_traffic_returns_only_requested_slice(client):
+    response = client.get(
+        "/api/traffic?granularity=hour&from=2026030222&to=2026030223"
+    )
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["iface"] == "eth0"
+    assert body["source"] == "live"
+    assert [(e["date"]["day"], e["time"]["hour"]) for e in body["entries"]] == [
+        (2, 22),
+        (2, 23),
+    ]
+    assert body["total"] == {"rx": 450, "tx": 45}
+
+
+@pytest.mark.parametrize(
+    "query, status",
+    [
+        ("granularity=week&from=202603", 400),
+        ("source=file&from=202603", 400),
+        ("from=20230230&to=20230301", 400),
+        ("source=backup&from=20230230&to=20230301", 400),
+        ("iface=eth9&granularity=hour&from=202603", 404),
+    ],
+)
+def test_traffic_rejects_invalid_requests(client, query, status):
+    assert client.get(f"/api/traffic?{query}").status_code == status
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from api.api_server import SnapshotCache
+
+
+class CountingFetcher:
+    def __init__(self, delay=0.0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return b'{"interfaces":[]}', {"interfaces": [], "fetch": calls}
+
+
+def _age(cache, seconds):
+    """把当前快照的拉取时间前移，不依赖真实等待"""
+    cache._snapshot.fetched_at -= seconds
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_hit_within_ttl():
+    fetcher = CountingFetcher()
+    cache = SnapshotCache(fetcher, ttl=30, stale_seconds=300)
+
+    first, status = cache.get()
+    assert status == "MISS"
+    second, status = cache.get()
+    assert status == "HIT"
+    assert second is first
+    assert fetcher.calls == 1
+
+
+def test_stale_snapshot_served_while_refreshing_in_background():
+    fetcher = CountingFetcher()
+    cache = SnapshotCache(fetcher, ttl=30, stale_seconds=300)
+    old, _ = cache.get()
+    _age(cache, 60)
+
+    snapshot, status = cache.get()
+    assert status == "STALE"
+    assert snapshot is old
+
+    _wait_for(lambda: cache.stats()["upstream_fetches"] == 2)
+    fresh, status = cache.get()
+    assert status == "HIT"
+    assert fresh.data["fetch"] == 2
+
+
+def test_expired_snapshot_is_refetched():
+    fetcher = CountingFetcher()
+    cache = SnapshotCache(fetcher, ttl=30, stale_seconds=300)
+    cache.get()
+    _age(cache, 331)
+
+    snapshot, status = cache.get()
+    assert status == "MISS"
+    assert snapshot.data["fetch"] == 2
+
+
+def test_concurrent_misses_share_one_fetch():
+    fetcher = CountingFetcher(delay=0.2)
+    cache = SnapshotCache(fetcher, ttl=30, stale_seconds=300)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(cache.get())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetcher.calls == 1
+    assert {status for _, status in results} == {"MISS"}
+    assert len({id(snapshot) for snapshot, _ in results}) == 1
+
+
+def test_fetch_error_propagates_to_all_waiters():
+    fetcher = CountingFetcher(delay=0.1, fail=True)
+    cache = SnapshotCache(fetcher, ttl=30, stale_seconds=300)
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def worker():
+        barrier.wait()
+        try:
+            cache.get()
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4
+    assert fetcher.calls == 1
+    with pytest.raises(RuntimeError):
+        cache.get()
@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import pytest
+
+from backup.history_db import HistoryDB
+from backup.traffic_store import aggregate_rows, bucket_key, pack_date_key
+from tests.conftest import make_entry, serve_document
+
+
+def _day(offset, rx):
+    """2026-02-23 之后第 offset 天的天条目"""
+    moment = date(2026, 2, 23) + timedelta(days=offset)
+    return make_entry(
+        {"year": moment.year, "month": moment.month, "day": moment.day}, rx, 0
+    )
+
+
+def _doc(days):
+    return {"interfaces": [{"name": "eth0", "traffic": {"day": list(days)}}]}
+
+
+def test_bucket_key_weeks_start_on_monday():
+    # 2026-03-01 为周日，归入 2026-02-23 这一周
+    assert bucket_key((2026, 3, 1, 13, 5), "week") == (2026, 2, 23)
+    assert bucket_key((2026, 3, 2, 0, 0), "week") == (2026, 3, 2)
+    assert bucket_key((2026, 3, 1, 13, 5), "hour") == (2026, 3, 1, 13)
+    assert bucket_key((2026, 3, 1, 13, 5), "month") == (2026, 3)
+
+
+def test_aggregate_rows_sums_buckets():
+    rows = [
+        (pack_date_key((2026, 3, 1, 10)), 1, 2),
+        (pack_date_key((2026, 3, 1, 11)), 3, 4),
+        (pack_date_key((2026, 3, 2, 0)), 5, 6),
+    ]
+    result = aggregate_rows(rows, "day")
+    assert result["series"] == [
+        {"date": {"year": 2026, "month": 3, "day": 1}, "rx": 4, "tx": 6},
+        {"date": {"year": 2026, "month": 3, "day": 2}, "rx": 5, "tx": 6},
+    ]
+    assert result["total"] == {"rx": 9, "tx": 12}
+    assert aggregate_rows(rows, "hour")["series"][0]["time"] == {
+        "hour": 10,
+        "minute": 0,
+    }
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """历史库有 2/23 起 14 天，实时快照只有最近 3 天且最后一天的流量更新"""
+    from api import api_server
+
+    history = HistoryDB(str(tmp_path / "history.db"))
+    history.ingest(_doc(_day(offset, 100) for offset in range(14)))
+    host = api_server.DEFAULT_UPSTREAM
+    monkeypatch.setattr(host, "history", history)
+    live = [_day(11, 100), _day(12, 100), _day(13, 500)]
+    serve_document(monkeypatch, host, _doc(live))
+    return api_server.app.test_client()
+
+
+def test_aggregate_route_prefers_live_snapshot(client):
+    url = "/api/traffic/aggregate?bucket=week&from=20260223&to=20260308"
+    response = client.get(url)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["iface"] == "eth0"
+    assert [(s["date"]["day"], s["rx"]) for s in body["series"]] == [
+        (23, 700),
+        (2, 1100),
+    ]
+    assert body["total"] == {"rx": 1800, "tx": 0}
+
+    days = client.get("/api/traffic/aggregate?bucket=day&from=20260307&to=20260308")
+    assert [s["rx"] for s in days.get_json()["series"]] == [100, 500]
+
+
+@pytest.mark.parametrize(
+    "query, status",
+    [
+        ("bucket=year&from=2026", 400),
+        ("from=20261", 400),
+        ("from=20260230", 400),
+        ("iface=eth9&from=2026", 404),
+    ],
+)
+def test_aggregate_route_rejects_invalid_requests(client, query, status):
+    assert client.get(f"/api/traffic/aggregate?{query}").status_code == status
@@ -0,0 +1,113 @@
+from datetime import datetime
+
+from backup.traffic_store import (
+    GRANULARITY_PRECISION,
+    TIME_KEYS,
+    TrafficStore,
+    entry_date_key,
+)
+from backup.vnstat_backup import filter_data, parse_range_bound
+from tests.conftest import make_entry
+
+
+def _hour(day, hour, rx, tx):
+    return make_entry({"year": 2026, "month": 3, "day": day}, rx, tx, {"hour": hour})
+
+
+def _doc(hours, top=()):
+    traffic = {"hour": list(hours), "top": list(top)}
+    return {"interfaces": [{"name": "eth0", "updated": {"n": 1}, "traffic": traffic}]}
+
+
+def test_series_index_sorts_and_bisects_unordered_entries():
+    hours = [
+        _hour(2, 1, 5, 1),
+        _hour(1, 23, 4, 2),
+        _hour(1, 0, 3, 3),
+        _hour(2, 0, 2, 4),
+    ]
+    store = TrafficStore(_doc(hours))
+    index = store.get_series("eth0", "hour")
+    assert [e["rx"] for e in index.entries] == [3, 4, 2, 5]
+
+    start, end = (2026, 3, 1, 23, 0), (2026, 3, 2, 0, 59)
+    assert index.bounds(start, end) == (1, 3)
+    assert index.totals(start, end) == (6, 6)
+    assert [k for k, _, _ in index.rows(start, end)] == list(index.keys[1:3])
+    assert store.query_interface_range("eth0", "hour", start, end)["entries"] == [
+        hours[1],
+        hours[3],
+    ]
+
+
+def test_missing_time_key_is_empty_range():
+    store = TrafficStore(_doc([_hour(1, 0, 1, 1)]))
+    assert store.get_series("eth0", "fiveminute") is None
+    assert store.query_interface_range(
+        "eth0", "fiveminute", (2026,), (2026, 12, 31, 23, 59)
+    ) == {"entries": [], "total": {"rx": 0, "tx": 0}}
+    assert store.filter_range_data((2025,), (2025, 12, 31, 23, 59)) == {
+        "interfaces": []
+    }
+
+
+def test_top_keeps_original_order():
+    top = [_hour(3, 0, 900, 0), _hour(1, 0, 800, 0), _hour(2, 0, 700, 0)]
+    store = TrafficStore(_doc([], top=top))
+    start = parse_range_bound("20260301")
+    end = parse_range_bound("20260303", upper=True)
+    result = store.query_interface_range("eth0", "top", start, end)
+    assert [e["rx"] for e in result["entries"]] == [900, 800, 700]
+
+
+def _linear_filter(data, start, end):
+    """逐条比较的参考实现，条目按自身精度截断范围后比较"""
+    filtered = {"interfaces": []}
+    for interface in data["interfaces"]:
+        traffic = {}
+        for time_key in TIME_KEYS:
+            precision = GRANULARITY_PRECISION[time_key]
+            kept = [
+                e
+                for e in interface["traffic"].get(time_key, [])
+                if start[:precision] <= entry_date_key(e, precision) <= end[:precision]
+            ]
+            if kept:
+                traffic[time_key] = kept
+        if traffic:
+            meta = {k: v for k, v in interface.items() if k != "traffic"}
+            filtered["interfaces"].append({**meta, "traffic": traffic})
+    return filtered
+
+
+def test_store_matches_linear_filter(snapshot_doc):
+    store = TrafficStore(snapshot_doc)
+    for value_from, value_to in [
+        ("2026031812", "2026031915"),
+        ("20260301", "20260310"),
+        ("202601", "202602"),
+        ("2025", "2026"),
+    ]:
+        start = parse_range_bound(value_from)
+        end = parse_range_bound(value_to, upper=True)
+        assert store.filter_range_data(start, end) == _linear_filter(
+            snapshot_doc, start, end
+        )
+
+
+def test_filter_data_wraps_store(snapshot_doc):
+    day = datetime(2026, 3, 19)
+    expected = TrafficStore(snapshot_doc).filter_range_data(
+        (2026, 3, 19, 0, 0), (2026, 3, 19, 23, 59)
+    )
+    assert filter_data(snapshot_doc, day) == expected
+    assert expected["interfaces"][0]["traffic"]["fiveminute"]
+
+
+def test_partition_by_day_matches_filter(snapshot_doc):
+    store = TrafficStore(snapshot_doc)
+    days = [(2026, 3, 18), (2026, 3, 19), (2026, 2, 1)]
+    parts = store.partition_by_day(days)
+    for day in days:
+        expected = store.filter_range_data(day + (0, 0), day + (23, 59))
+        assert parts[day] == expected
@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+
+import pytest
+
+from backup.backup_format import encode_backup, write_backup
+from backup.traffic_store import TrafficStore
+from backup.traffic_summary import percentile, summarize_data, summarize_series
+from backup.vnstat_backup import ensure_month_dir, get_day_backup_base
+from tests.conftest import make_entry, serve_document
+
+DAY = date(2026, 3, 10)
+
+
+def _date(moment):
+    return {"year": moment.year, "month": moment.month, "day": moment.day}
+
+
+def _doc(today):
+    """today 的五分钟速率依次为 8..160 bit/s，今天 2 点与昨天 2 点的小时流量最高"""
+    yesterday = today - timedelta(days=1)
+    fiveminute = [
+        make_entry(
+            _date(today), (i + 1) * 300, 300, {"hour": i // 12, "minute": i % 12 * 5}
+        )
+        for i in range(20)
+    ]
+    hour = [
+        make_entry(_date(yesterday), 3600, 0, {"hour": 2}),
+        make_entry(_date(today), 3600, 0, {"hour": 1}),
+        make_entry(_date(today), 7200, 3600, {"hour": 2}),
+    ]
+    day = [
+        make_entry(_date(today - timedelta(days=2)), 50, 50),
+        make_entry(_date(yesterday), 1000, 0),
+        make_entry(_date(today), 300, 100),
+    ]
+    traffic = {"fiveminute": fiveminute, "hour": hour, "day": day}
+    return {"interfaces": [{"name": "eth0", "traffic": traffic}]}
+
+
+def _bounds(moment):
+    key = (moment.year, moment.month, moment.day)
+    return key, key + (23, 59)
+
+
+@pytest.mark.parametrize(
+    "values, pct, expected",
+    [([], 95, 0), ([5], 95, 5), (list(range(20, 0, -1)), 95, 19), ([1, 2], 50, 1)],
+)
+def test_percentile_uses_nearest_rank(values, pct, expected):
+    assert percentile(values, pct) == expected
+
+
+def test_summarize_series_peaks_and_p95():
+    series = TrafficStore(_doc(DAY)).series["eth0"]
+    summary = summarize_series(series, *_bounds(DAY))
+
+    # 合计取覆盖最完整的天条目
+    assert (summary["rx"], summary["tx"]) == (300, 100)
+    peak = summary["peak_fiveminute"]
+    assert peak["rx"] == {
+        "bps": 160,
+        "date": _date(DAY),
+        "time": {"hour": 1, "minute": 35},
+    }
+    assert peak["tx"]["bps"] == 8
+    assert summary["peak_hour"]["rx"]["bps"] == 16
+    assert summary["peak_hour"]["rx"]["time"] == {"hour": 2, "minute": 0}
+    assert summary["p95"] == {"rx_bps": 152, "tx_bps": 8, "samples": 20}
+
+
+def test_summarize_series_top_days_and_busiest_hours():
+    series = TrafficStore(_doc(DAY)).series["eth0"]
+    start = (2026, 3, 1)
+    summary = summarize_series(series, start, _bounds(DAY)[1], top_n=2)
+
+    assert summary["top_days"] == [
+        {"date": {"year": 2026, "month": 3, "day": 9}, "rx": 1000, "tx": 0},
+        {"date": _date(DAY), "rx": 300, "tx": 100},
+    ]
+    # 按一天中的小时累计：两天的 2 点合计最高
+    assert summary["busiest_hours"] == [
+        {"hour": 2, "rx": 10800, "tx": 3600},
+        {"hour": 1, "rx": 3600, "tx": 0},
+    ]
+
+
+def test_summarize_series_empty_range():
+    series = TrafficStore(_doc(DAY)).series["eth0"]
+    summary = summarize_series(series, (2025, 1, 1), (2025, 1, 31))
+    assert summary == {
+        "rx": 0,
+        "tx": 0,
+        "peak_fiveminute": None,
+        "peak_hour": None,
+        "p95": {"rx_bps": 0, "tx_bps": 0, "samples": 0},
+        "top_days": [],
+        "busiest_hours": [],
+    }
+
+
+@pytest.fixture
+def api(monkeypatch):
+    from api import api_server
+
+    host = api_server.UpstreamHost("summary", "http://127.0.0.1:9/summary.cgi")
+    serve_document(monkeypatch, host, _doc(date.today()))
+    monkeypatch.setitem(api_server.HOSTS, "summary", host)
+    return host, api_server.app.test_client()
+
+
+def test_live_summary_covers_today_and_yesterday(api):
+    _, client = api
+    response = client.get("/api/summary?host=summary")
+    assert response.status_code == 200
+    eth0 = response.get_json()["interfaces"]["eth0"]
+    assert set(eth0) == {"today", "yesterday", "month", "total"}
+    assert (eth0["today"]["rx"], eth0["today"]["tx"]) == (300, 100)
+    assert eth0["today"]["p95"]["samples"] == 20
+    assert (eth0["yesterday"]["rx"], eth0["yesterday"]["tx"]) == (1000, 0)
+    assert eth0["yesterday"]["p95"]["samples"] == 0
+
+    etag = response.headers["ETag"]
+    cached = client.get("/api/summary?host=summary", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert client.get("/api/summary?host=summary&iface=eth9").status_code == 404
+
+
+def test_backup_summary_from_manifest_or_file(api):
+    host, client = api
+    data = _doc(DAY)
+    ensure_month_dir(host.backup_dir, 2026, 3)
+    write_backup(get_day_backup_base(host.backup_dir, 2026, 3, 10), data)
+    # 未经 write_backup 写入的文件，manifest 中没有摘要
+    with open(get_day_backup_base(host.backup_dir, 2026, 3, 11) + ".json", "wb") as f:
+        f.write(encode_backup(data, "json"))
+
+    for day in ("20260310", "20260311"):
+        response = client.get(f"/api/summary?host=summary&date={day}")
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["date"] == day
+        assert body["interfaces"] == summarize_data(data)
+
+    assert client.get("/api/summary?host=summary&date=202613").status_code == 400
+    assert client.get("/api/summary?host=summary&date=20260312").status_code == 404
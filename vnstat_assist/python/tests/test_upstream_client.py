@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+from backup.upstream_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamClient,
+    UpstreamError,
+)
+from bench.fake_vnstat import FakeVnstatServer
+
+DOC = {"vnstatversion": "2.12", "interfaces": []}
+
+
+@pytest.fixture
+def server():
+    with FakeVnstatServer(DOC) as server:
+        yield server
+
+
+def _client(server, retries=2, breaker=None):
+    return UpstreamClient(
+        server.url,
+        connect_timeout=1,
+        read_timeout=2,
+        retries=retries,
+        backoff=0,
+        breaker=breaker or CircuitBreaker(100, 30),
+    )
+
+
+def test_fetch_returns_raw_body_and_data(server):
+    client = _client(server)
+    body, data = client.fetch()
+    assert data == DOC
+    assert body == server.body
+    assert client.stats() == {
+        "requests": 1,
+        "retries": 0,
+        "failures": 0,
+        "breaker": "closed",
+    }
+
+
+@pytest.mark.parametrize("error_mode", ["status", "truncate", "close"])
+def test_transient_errors_are_retried(server, error_mode):
+    server.error_rate = 1
+    server.error_mode = error_mode
+    client = _client(server, retries=2)
+    with pytest.raises(UpstreamError):
+        client.fetch()
+    assert server.requests == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["failures"] == 3
+
+
+def test_retry_recovers_when_upstream_comes_back(server, monkeypatch):
+    client = _client(server, retries=2)
+    server.error_rate = 1
+    sleeps = []
+
+    def sleep(delay):
+        sleeps.append(delay)
+        server.error_rate = 0
+
+    monkeypatch.setattr("backup.upstream_client.time.sleep", sleep)
+    assert client.fetch()[1] == DOC
+    assert len(sleeps) == 1
+    assert client.stats()["retries"] == 1
+
+
+def test_client_errors_are_not_retried(server):
+    server.error_rate = 1
+    server.error_status = 404
+    client = _client(server, retries=3)
+    with pytest.raises(UpstreamError):
+        client.fetch()
+    assert server.requests == 1
+
+
+def test_invalid_json_is_not_retried(server, monkeypatch):
+    client = _client(server, retries=3)
+    monkeypatch.setattr(client, "_request", lambda: b"<html>")
+    with pytest.raises(UpstreamError):
+        client.fetch()
+    assert client.stats()["failures"] == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_breaker_opens_and_recovers_through_half_open_probe(server):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    client = _client(server, retries=0, breaker=breaker)
+    server.error_rate = 1
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            client.fetch()
+    assert breaker.state == "open"
+
+    # 熔断期间不再请求上游
+    with pytest.raises(CircuitOpenError) as info:
+        client.fetch()
+    assert 0 < info.value.retry_after <= 0.2
+    assert server.requests == 2
+
+    # 试探失败重新打开，试探成功则关闭
+    time.sleep(0.25)
+    assert breaker.state == "half-open"
+    with pytest.raises(UpstreamError):
+        client.fetch()
+    assert breaker.state == "open"
+    time.sleep(0.25)
+    server.error_rate = 0
+    assert client.fetch()[1] == DOC
+    assert breaker.state == "closed"
+    assert server.requests == 4
+
+
+def test_breaker_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    breaker.allow()
+    breaker.allow()
+
+
+def test_threads_share_one_session(server):
+    client = _client(server)
+    sessions = []
+    threads = [
+        threading.Thread(target=lambda: sessions.append(client._session()))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(session) for session in sessions}) == 1